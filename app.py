@@ -4,9 +4,78 @@ from PIL import Image
 import numpy as np
 from streamlit_cropper import st_cropper
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime
 import os
+from template_features import ALIGN_SIZE, TemplateFeatureStore, preprocess_capture
+from feature_matching import MATCHERS, find_homography, to_dmatches
+from registration import pyramid_register
+from inspection_pipeline import subtract_images, find_defects
+from tiled_inspection import preprocess_full_resolution, tiled_subtraction
+from stage_timer import StageMetrics
+from chart_cache import ChartCache, data_version, downsample_minmax
+from detection_utils import draw_detections
+from hybrid_inspect import hybrid_inspect
+from inference_server import RemoteModel, configured_server
+from inference_backends import check_class_mapping, configured_backend, load_backend
+
+
+# Processed templates and their ORB features are shared by all sessions and
+# persisted under data/template_cache so restarts do not recompute them
+@st.cache_resource
+def get_template_store():
+    return TemplateFeatureStore(os.path.join("data", "template_cache"))
+
+
+template_store = get_template_store()
+
+METRICS_PATH = os.path.join("data", "metrics.jsonl")
+
+CLASS_NAMES = {
+    0: "short",
+    1: "spur",
+    2: "spurious copper",
+    3: "open",
+    4: "mouse bite",
+    5: "hole breakout",
+    6: "conductor scratch",
+    7: "conductor foreign object",
+    8: "base material foreign object"
+}
+CONF_THRESHOLD = 0.25
+YOLO_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "train_results", "weights", "best.pt")
+
+
+# The YOLO model is only needed by the hybrid mode, so it is loaded on first use
+# and then shared by all sessions. `revision` (the mtime of best.pt) changes when
+# retrain.py promotes new weights; max_entries=1 releases the replaced model
+@st.cache_resource(show_spinner="Loading YOLO model...", max_entries=1)
+def load_yolo_model(path, backend="pytorch", server=None, revision=None):
+    # With an inference server configured this is only a thin client
+    yolo_model = RemoteModel(server) if server is not None else load_backend(path, backend)
+    check_class_mapping(yolo_model, CLASS_NAMES)
+    return yolo_model
+
+
+
+# Per-stage wall-clock spans, aggregated process-wide for the diagnostics page
+@st.cache_resource
+def get_stage_metrics(path):
+    return StageMetrics(path)
+
+
+stage_metrics = get_stage_metrics(METRICS_PATH)
+
+
+# Charts are rendered once per input-data version and reused as PNG bytes
+@st.cache_resource
+def get_chart_cache(max_entries=32):
+    return ChartCache(max_entries=max_entries)
+
+
+chart_cache = get_chart_cache()
+MAX_CHART_POINTS = 1000
+timer = stage_metrics.start("app", label=st.session_state.get("page", "home"))
+
 
 # Home Page (Overview & Introduction)
 def home_page():
@@ -31,6 +100,11 @@ def home_page():
         st.session_state.page = "template_upload"  # Go to Template Image Upload Page
         st.rerun()  # Use st.rerun() instead of deprecated experimental_rerun
 
+    st.markdown("---")
+    if st.button("⏱️ Diagnostics"):
+        st.session_state.page = "diagnostics"
+        st.rerun()
+
 # Template Image Upload Page
 def template_image_upload_page():
     st.title("Upload Template PCB Image")
@@ -49,24 +123,21 @@ def template_image_upload_page():
         template_image = Image.open(uploaded_template_img)
         st.image(template_image, caption="Uploaded Template Image.", use_container_width=True)
 
-        # Convert the uploaded image to an OpenCV format (numpy array)
-        img_array = np.array(template_image)
+        # Preprocessing is cached per template content, so reruns only look it up
+        with timer.span("template_features"):
+            stages = template_store.get(uploaded_template_img.getvalue())["stages"]
 
         # Step 1: Convert to Grayscale
-        gray_image = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        st.image(gray_image, caption="Grayscale Template Image", use_container_width=True)
+        st.image(stages["gray"], caption="Grayscale Template Image", use_container_width=True)
 
         # Step 2: Resize the image
-        resized_image = cv2.resize(gray_image, (750, 450))
-        st.image(resized_image, caption="Resized Template Image", use_container_width=True)
+        st.image(stages["resized"], caption="Resized Template Image", use_container_width=True)
 
         # Step 3: Apply Gaussian Blur
-        blurred_image = cv2.GaussianBlur(resized_image, (3, 3), 0)
-        st.image(blurred_image, caption="Blurred Template Image (Gaussian)", use_container_width=True)
+        st.image(stages["blurred"], caption="Blurred Template Image (Gaussian)", use_container_width=True)
 
         # Step 4: Apply Thresholding
-        _, thresholded_image = cv2.threshold(blurred_image, 128, 255, cv2.THRESH_BINARY)
-        st.image(thresholded_image, caption="Thresholded Template Image", use_container_width=True)
+        st.image(stages["thresholded"], caption="Thresholded Template Image", use_container_width=True)
 
         # Button to continue to the next page
         next_button = st.button("Next")
@@ -102,11 +173,15 @@ def capture_output_image_page():
         # Determine the source of the image
         if camera_image is not None:
             # Use the camera-captured image
-            image = Image.open(camera_image)
+            with timer.span("decode"):
+                image = Image.open(camera_image)
+                image.load()  # PIL decodes lazily; force it inside the span
             st.write("Image captured using the camera.")
         else:
             # Use the uploaded image
-            image = Image.open(uploaded_image)
+            with timer.span("decode"):
+                image = Image.open(uploaded_image)
+                image.load()  # PIL decodes lazily; force it inside the span
             st.write("Image uploaded successfully.")
 
         # Display the selected image
@@ -119,12 +194,13 @@ def capture_output_image_page():
         st.subheader("Crop the Image (Google Lens-like experience)")
 
         # Allow the user to crop the image with interactive cropping
-        cropped_image = st_cropper(
-            st.session_state.output_img,
-            realtime_update=True,  # Reflect cropping changes in real-time
-            box_color="blue",  # Highlight cropping box with blue
-            aspect_ratio=None  # Free aspect-ratio cropping
-        )
+        with timer.span("crop"):
+            cropped_image = st_cropper(
+                st.session_state.output_img,
+                realtime_update=True,  # Reflect cropping changes in real-time
+                box_color="blue",  # Highlight cropping box with blue
+                aspect_ratio=None  # Free aspect-ratio cropping
+            )
         st.subheader("Cropped Image")
         st.image(cropped_image, caption="Cropped Output PCB Image", use_container_width=True)
 
@@ -153,58 +229,100 @@ def image_alignment():
     if "template_img" and "cropped_img" in st.session_state:
         #Displaying the captured image
         cropped_opencv_image = np.array(st.session_state.cropped_img)
-        gray_image1 = cv2.cvtColor(cropped_opencv_image, cv2.COLOR_RGB2GRAY)
-        resized_image1 = cv2.resize(gray_image1, (750, 450))
-        img1 = cv2.GaussianBlur(resized_image1, (3, 3), 0)
+        with timer.span("preprocess"):
+            img1 = preprocess_capture(cropped_opencv_image)
         st.image(img1, caption="Grayscale Image", use_container_width=True)
 
         #Displaying the template image
         uploaded_file = st.session_state.template_img  # Retrieve the uploaded file
-        template_image = Image.open(uploaded_file)  # Open it as a PIL image
-        uploaded_template_img = np.array(template_image)  # Convert it to a NumPy array
-        gray_image2 = cv2.cvtColor(uploaded_template_img, cv2.COLOR_RGB2GRAY)  # Convert to grayscale
-        resized_image2 = cv2.resize(gray_image2, (750, 450))
-        blurred_image2 = cv2.GaussianBlur(resized_image2, (3, 3), 0)
-        _, img2 = cv2.threshold(blurred_image2, 128, 255, cv2.THRESH_BINARY)
+        with timer.span("template_features"):
+            template_features = template_store.get(uploaded_file.getvalue())  # Cached per template
+        img2 = template_features["stages"]["thresholded"]
         st.image(img2, caption="Grayscale Image from Template Upload Page", use_container_width=True)
 
-        #ORB Detection
-        st.subheader("ORB Detection")
-        orb = cv2.ORB_create()
-
-        #Template Image
-        kp1, des1 = orb.detectAndCompute(img2, None)
-        img_template = cv2.drawKeypoints(img2, kp1, None, color=(0, 255, 0), flags=0)
-        st.image(img_template, caption="ORB Detection", use_container_width=True)
-
-        #Captured Image
-        kp2, des2 = orb.detectAndCompute(img1, None)
-        img_captured = cv2.drawKeypoints(img1, kp2, None, color=(0, 255, 0), flags=0)
-        st.image(img_captured, caption="ORB Detection", use_container_width=True)
-
-        #Feature Matching
-        st.subheader("Feature Matching")
-        bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-        matches = bf.match(des1, des2)
-        matches = sorted(matches, key=lambda x: x.distance)
-        img3 = cv2.drawMatches(img2, kp1, img1, kp2, matches[:10], None, flags=2)
-        st.image(img3, caption="Feature Matching", use_container_width=True)
-
-        #Homography Calculation
-        st.subheader("Homography Calculation")
-        dmatches = sorted(matches, key=lambda x: x.distance)
-
-        src_pts = np.float32([kp1[m.queryIdx].pt for m in dmatches]).reshape(-1, 1, 2)
-        dst_pts = np.float32([kp2[m.trainIdx].pt for m in dmatches]).reshape(-1, 1, 2)
+        registration_mode = st.radio(
+            "Registration mode", ["ORB (750x450)", "Pyramid (full resolution)"], horizontal=True
+        )
+        # Set again below once this run's alignment succeeds
+        st.session_state.pop("warped_color", None)
+
+        if registration_mode == "ORB (750x450)":
+            # Only the pyramid mode produces a full-resolution alignment
+            st.session_state.pop("full_resolution", None)
+
+            #ORB Detection
+            st.subheader("ORB Detection")
+            orb = cv2.ORB_create()
+
+            #Template Image
+            kp1, des1 = template_features["keypoints"], template_features["descriptors"]
+            img_template = cv2.drawKeypoints(img2, kp1, None, color=(0, 255, 0), flags=0)
+            st.image(img_template, caption="ORB Detection", use_container_width=True)
+
+            #Captured Image
+            with timer.span("orb"):
+                kp2, des2 = orb.detectAndCompute(img1, None)
+            img_captured = cv2.drawKeypoints(img1, kp2, None, color=(0, 255, 0), flags=0)
+            st.image(img_captured, caption="ORB Detection", use_container_width=True)
+
+            #Feature Matching
+            st.subheader("Feature Matching")
+            with st.expander("Matcher settings"):
+                backend = st.selectbox("Matcher backend", list(MATCHERS))
+                ratio = st.slider("Ratio test threshold", 0.5, 0.95, 0.75, 0.05)
+                max_matches = st.number_input("Max matches sent to RANSAC", 10, 2000, 200, 10)
+
+            with timer.span("match"):
+                # Capture -> template, so h warps the capture into the template frame
+                h, status, matches = find_homography(kp2, des2, kp1, des1, backend, ratio, int(max_matches))
+            query_idx, train_idx, distance = matches
+            img3 = cv2.drawMatches(img1, kp2, img2, kp1,
+                                   to_dmatches(query_idx[:10], train_idx[:10], distance[:10]), None, flags=2)
+            st.image(img3, caption="Feature Matching", use_container_width=True)
+
+            #Homography Calculation
+            st.subheader("Homography Calculation")
+            if status is not None:
+                st.write(f"{len(query_idx)} matches, {int(status.sum())} RANSAC inliers")
+            st.write('calculated homography is', h)
 
-        h, status = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
-        st.write('calculated homography is', h)
+            # Warp the perspective of the captured image to match the template
+            with timer.span("warp"):
+                img4 = None if h is None else cv2.warpPerspective(img1, h, (img2.shape[1], img2.shape[0]))
+            if h is not None:
+                # Colour capture in the same frame, for classifying defect regions in hybrid mode
+                capture_bgr = cv2.cvtColor(cv2.resize(cropped_opencv_image, ALIGN_SIZE), cv2.COLOR_RGB2BGR)
+                st.session_state.warped_color = cv2.warpPerspective(capture_bgr, h, (img2.shape[1], img2.shape[0]))
+        else:
+            # Estimate on a downscaled level first, then refine towards full resolution
+            st.subheader("Pyramid Registration")
+            with st.expander("Pyramid settings"):
+                use_ecc = st.checkbox("Refine finer levels with ECC", value=False)
+                tolerance = st.number_input("Stop when the residual is below (px)", 0.1, 20.0, 1.0, 0.1)
+
+            capture_gray = cv2.cvtColor(cropped_opencv_image, cv2.COLOR_RGB2GRAY)
+            template_gray = template_features["stages"]["gray"]
+            with timer.span("registration"):
+                h, report = pyramid_register(capture_gray, template_gray, use_ecc=use_ecc, tolerance=tolerance)
+            st.dataframe(pd.DataFrame(report))
+            st.write(f"Total registration time: {sum(r['time_s'] for r in report) * 1000:.1f} ms")
+            st.write('calculated homography is', h)
+
+            img4 = None
+            if h is not None:
+                # Warp at full resolution, then bring it to the subtraction size
+                with timer.span("warp"):
+                    warped_full = cv2.warpPerspective(capture_gray, h, (template_gray.shape[1], template_gray.shape[0]))
+                    img4 = cv2.GaussianBlur(cv2.resize(warped_full, ALIGN_SIZE), (3, 3), 0)
+                # Kept for the tiled full-resolution inspection on the results page
+                st.session_state.full_resolution = (template_gray, warped_full)
+                st.session_state.warped_color = cv2.warpPerspective(
+                    cv2.cvtColor(cropped_opencv_image, cv2.COLOR_RGB2BGR), h,
+                    (template_gray.shape[1], template_gray.shape[0]))
 
         # Warping: Transforming the captured image using the homography matrix
-        if h is not None:
+        if img4 is not None:
             st.subheader("Warping")
-            # Warp the perspective of the captured image to match the template
-            img4 = cv2.warpPerspective(img1, h, (img2.shape[1], img2.shape[0]))
 
             # Convert warped image to RGB for proper displaying in Streamlit (optional)
             img4_rgb = cv2.cvtColor(img4, cv2.COLOR_GRAY2RGB)
@@ -248,34 +366,79 @@ def image_subtraction_and_results():
         img2 = st.session_state.template_image  # Retrieve template image
         img4 = st.session_state.warped_image  # Retrieve warped image
 
-        # Perform image subtraction
-        sub_img = cv2.subtract(img2, img4)
+        # Perform image subtraction (the median-blurred version is used for detection)
+        with timer.span("subtract"):
+            sub_img, final_img = subtract_images(img2, img4)
 
         # Display the subtracted result
         st.subheader("Resultant Image After Subtraction")
-        plt.figure(figsize=(10, 6))
-        plt.imshow(sub_img, cmap="gray")
-        st.pyplot(plt)
-
-        # Median blur to reduce noise
-        final_img = cv2.medianBlur(sub_img, 5)
+        with timer.span("chart_subtraction"):
+            st.image(chart_cache.render(("gray", data_version(sub_img)),
+                                        lambda fig: fig.subplots().imshow(sub_img, cmap="gray")))
 
         # Display the final binary image
         st.subheader("Final Binary Image for Defect Detection (Noise Reduced)")
-        plt.figure(figsize=(10, 6))
-        plt.imshow(final_img, cmap="gray")
-        st.pyplot(plt)
+        with timer.span("chart_subtraction"):
+            st.image(chart_cache.render(("gray", data_version(final_img)),
+                                        lambda fig: fig.subplots().imshow(final_img, cmap="gray")))
 
-        # Contour detection
+        # Defect extraction (connected components with per-defect statistics)
         st.subheader("Contour Detection")
-        cnts = cv2.findContours(
-            final_img, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE
-        )[-2]
-        blobs = [cnt for cnt in cnts if 0 < cv2.contourArea(cnt) < 300]
+        with timer.span("defects"):
+            defects = find_defects(final_img)
 
         # Display the number of defects
-        num_defects = len(blobs)
+        num_defects = len(defects)
         st.write(f"**Number of defects detected:** {num_defects}")
+        if defects:
+            marked = cv2.cvtColor(img4, cv2.COLOR_GRAY2RGB)
+            for d in defects:
+                cv2.rectangle(marked, (d["x"], d["y"]), (d["x"] + d["width"], d["y"] + d["height"]),
+                              (255, 0, 0), 1)
+            st.image(marked, caption="Detected defects", use_container_width=True)
+            st.dataframe(pd.DataFrame(defects))
+
+        # Hybrid mode: the subtraction blobs are the only regions the YOLO model looks at
+        if "warped_color" in st.session_state:
+            st.subheader("Hybrid Classification (YOLO on defect regions)")
+            if st.checkbox("Classify defect regions with the YOLO model"):
+                padding = st.slider("Crop padding (px)", 0, 64, 16, 4)
+                revision = os.path.getmtime(YOLO_MODEL_PATH) if os.path.exists(YOLO_MODEL_PATH) else None
+                model = load_yolo_model(YOLO_MODEL_PATH, configured_backend(), configured_server(), revision)
+                with timer.span("hybrid"):
+                    hybrid = hybrid_inspect(model, st.session_state.warped_color, final_img, defects,
+                                            conf=CONF_THRESHOLD, padding=padding)
+                if hybrid["skipped"]:
+                    st.success("No defect regions - YOLO inference skipped for this board.")
+                else:
+                    st.write(f"{len(hybrid['windows'])} regions classified in one batch "
+                             f"({hybrid['inference_ms']:.1f} ms)")
+                    xyxy, confidences, classes = hybrid["detections"]
+                    annotated = draw_detections(st.session_state.warped_color, xyxy, classes, confidences,
+                                                CLASS_NAMES)
+                    for x0, y0, x1, y1 in hybrid["windows"]:
+                        cv2.rectangle(annotated, (x0, y0), (x1, y1), (255, 255, 0), 1)
+                    st.image(annotated, channels="BGR", caption="Crop windows and YOLO detections",
+                             use_container_width=True)
+                    blobs = pd.DataFrame(hybrid["blobs"])
+                    blobs["defect_type"] = blobs["class_id"].map(lambda c: CLASS_NAMES.get(c, "unclassified"))
+                    st.dataframe(blobs)
+
+        # Tiled inspection keeps the full resolution of the pyramid-aligned images
+        if "full_resolution" in st.session_state:
+            st.subheader("Tiled Full-Resolution Inspection")
+            if st.checkbox("Run tiled inspection at full resolution"):
+                tile_size = st.select_slider("Tile size (px)", [256, 384, 512, 768, 1024], value=512)
+                overlap = st.slider("Tile overlap (px)", 16, 256, 64, 16)
+                with timer.span("tiled_inspection"):
+                    template_full, warped_full = preprocess_full_resolution(*st.session_state.full_resolution)
+                    tiled_defects, tile_report = tiled_subtraction(template_full, warped_full, tile_size, overlap)
+                st.write(f"**Defects found at full resolution:** {len(tiled_defects)} "
+                         f"({len(tile_report)} tiles, "
+                         f"{sum(t['time_ms'] for t in tile_report):.1f} ms total tile time)")
+                if tiled_defects:
+                    st.dataframe(pd.DataFrame(tiled_defects))
+                st.dataframe(pd.DataFrame(tile_report))
 
         # Save results to a persistent CSV file
         csv_file = "defects_data.csv"
@@ -285,6 +448,9 @@ def image_subtraction_and_results():
             defects_data = pd.read_csv(csv_file)
         else:  # Create a new DataFrame if file doesn't exist
             defects_data = pd.DataFrame(columns=["Date", "Defects Detected"])
+        # Chart keys come from the persisted rows and this result's count. The current
+        # row's timestamp changes on every rerun, so only the dated chart keys on it too
+        series_version = data_version(defects_data, num_defects)
 
         # Create a new DataFrame with the current result
         new_data = pd.DataFrame([{"Date": current_date, "Defects Detected": num_defects}])
@@ -292,30 +458,42 @@ def image_subtraction_and_results():
         # Concatenate the new data to the existing DataFrame
         defects_data = pd.concat([defects_data, new_data], ignore_index=True)
 
+        # Long histories are downsampled before plotting; peaks are kept so outliers stay visible
+        counts = defects_data["Defects Detected"].to_numpy(dtype=float)
+        keep = downsample_minmax(counts, MAX_CHART_POINTS)
+
         # Graph 1: Number of PCBs inspected vs Defects
         st.subheader("Number of PCBs Inspected vs Defects")
-        plt.figure(figsize=(8, 5))
-        plt.bar(defects_data.index + 1, defects_data["Defects Detected"], color="blue")
-        plt.xlabel("PCB Count")
-        plt.ylabel("Defects Detected")
-        plt.title("Defects Detected per PCB")
-        st.pyplot(plt)
+        with timer.span("chart_per_pcb"):
+            def draw_per_pcb(fig):
+                ax = fig.subplots()
+                ax.bar(keep + 1, counts[keep], color="blue")
+                ax.set_xlabel("PCB Count")
+                ax.set_ylabel("Defects Detected")
+                ax.set_title("Defects Detected per PCB")
+
+            st.image(chart_cache.render(("per_pcb", series_version), draw_per_pcb, figsize=(8, 5)))
 
         # Graph 2: Number of Defects Detected vs Date
         st.subheader("Number of Defects Detected Over Time")
-        plt.figure(figsize=(10, 5))
-        plt.plot(
-            pd.to_datetime(defects_data["Date"]),
-            defects_data["Defects Detected"],
-            marker="o",
-            linestyle="-",
-            color="red",
-        )
-        plt.xlabel("Date")
-        plt.ylabel("Defects Detected")
-        plt.title("Defects Detected Over Time")
-        plt.xticks(rotation=45)
-        st.pyplot(plt)
+        with timer.span("chart_over_time"):
+            def draw_over_time(fig):
+                ax = fig.subplots()
+                dates = pd.to_datetime(defects_data["Date"]).to_numpy()
+                ax.plot(
+                    dates[keep],
+                    counts[keep],
+                    marker="o" if len(keep) < 200 else None,
+                    linestyle="-",
+                    color="red",
+                )
+                ax.set_xlabel("Date")
+                ax.set_ylabel("Defects Detected")
+                ax.set_title("Defects Detected Over Time")
+                ax.tick_params(axis="x", labelrotation=45)
+
+            st.image(chart_cache.render(("over_time", series_version, current_date), draw_over_time,
+                                        figsize=(10, 5)))
 
     else:
         st.error(
@@ -327,20 +505,51 @@ def image_subtraction_and_results():
 
 
 
+def diagnostics_page():
+    st.title("Diagnostics")
+
+    if st.button("Back"):
+        st.session_state.page = "home"
+        st.rerun()
+
+    summary = stage_metrics.summary()
+    if not summary:
+        st.info("No timings recorded yet - run an inspection first.")
+        return
+
+    st.subheader("Stage Latency (ms)")
+    summary_df = pd.DataFrame(summary)
+    st.dataframe(summary_df, use_container_width=True)
+    st.bar_chart(summary_df.set_index("stage")["p50_ms"])
+    st.caption(f"Every run is also appended to {METRICS_PATH}")
+
+    chart_stats = chart_cache.stats()
+    st.caption(f"Chart cache: {chart_stats['entries']} charts ({chart_stats['bytes'] / 1024:.0f} KiB), "
+               f"{chart_stats['hits']} hits / {chart_stats['misses']} misses")
+
+    if st.button("Reset in-memory timings"):
+        stage_metrics.reset()
+        st.rerun()
+
+
 # Initialize session state if it's the first time
 if "page" not in st.session_state:
     st.session_state.page = "home"
 
 # Conditional page rendering based on the current page in session state
-if st.session_state.page == "home":
-    home_page()
-elif st.session_state.page == "template_upload":
-    template_image_upload_page()
-elif st.session_state.page == "capture_output_image":
-    capture_output_image_page()
-elif st.session_state.page == "image_alignment":
-    image_alignment()
-elif st.session_state.page == "image_subtraction_and_results":
-    image_subtraction_and_results()
-
-
+# (the finally block records this run's stage timings, also when a page calls st.rerun())
+try:
+    if st.session_state.page == "home":
+        home_page()
+    elif st.session_state.page == "template_upload":
+        template_image_upload_page()
+    elif st.session_state.page == "capture_output_image":
+        capture_output_image_page()
+    elif st.session_state.page == "image_alignment":
+        image_alignment()
+    elif st.session_state.page == "image_subtraction_and_results":
+        image_subtraction_and_results()
+    elif st.session_state.page == "diagnostics":
+        diagnostics_page()
+finally:
+    timer.finish()
@@ -0,0 +1,138 @@
+# batch_detect.py
+# Batched YOLO inference over a folder of images.
+#
+# Images are decoded and letterboxed on a thread pool while the model runs on the
+# previous batch. Detections are converted to rows with the defect_data schema and
+# appended to the defect log in one bulk write at the end.
+#
+# Usage:  python batch_detect.py "test images" --batch-size 8 --workers 4
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+
+from defect_store import DefectLog
+from detection_utils import result_arrays
+from inference_backends import configured_backend, load_backend
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def letterbox(image, size=640, color=(114, 114, 114)):
+    """Resize keeping the aspect ratio and pad to size x size.
+
+    Returns (padded, ratio, (pad_x, pad_y)) so boxes can be mapped back with
+    (xy - pad) / ratio.
+    """
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    padded = cv2.copyMakeBorder(image, pad_y, size - new_h - pad_y, pad_x, size - new_w - pad_x,
+                                cv2.BORDER_CONSTANT, value=color)
+    return padded, ratio, (pad_x, pad_y)
+
+
+def _load(path, size):
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        return path, None, None, None
+    padded, ratio, pad = letterbox(image, size)
+    return path, padded, ratio, pad
+
+
+def list_images(folder):
+    return sorted(p for p in glob.glob(os.path.join(folder, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def detections_to_rows(xyxy, confidences, classes, names, timestamp, image_path):
+    """defect_data rows for one image, built from the box arrays."""
+    if len(xyxy) == 0:
+        return []
+    # Same location convention as the original per-box loop: xywh centre + half size,
+    # i.e. the bottom-right corner of the box
+    location_x = xyxy[:, 2].astype(int).tolist()
+    location_y = xyxy[:, 3].astype(int).tolist()
+    return [
+        {
+            "timestamp": timestamp,
+            "defect_type": names[c],
+            "confidence": conf,
+            "location_x": x,
+            "location_y": y,
+            "image_path": image_path,
+        }
+        for c, conf, x, y in zip(classes.astype(int).tolist(), confidences.tolist(), location_x, location_y)
+    ]
+
+
+def detect_folder(model, paths, batch_size=8, conf=0.25, workers=4, imgsz=640):
+    """Run batched detection over `paths`; returns (rows, summary)."""
+    rows = []
+    skipped = 0
+    start = time.perf_counter()
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Keep one batch decoding ahead of the one being inferred
+        pending = [pool.submit(_load, p, imgsz) for p in batches[0]] if batches else []
+        for index in range(len(batches)):
+            loaded = [f.result() for f in pending]
+            if index + 1 < len(batches):
+                pending = [pool.submit(_load, p, imgsz) for p in batches[index + 1]]
+
+            valid = [item for item in loaded if item[1] is not None]
+            skipped += len(loaded) - len(valid)
+            if not valid:
+                continue
+
+            results = model.predict(source=[item[1] for item in valid], save=False, conf=conf,
+                                    imgsz=imgsz, verbose=False)
+            timestamp = datetime.now().isoformat()
+            for (path, _, ratio, (pad_x, pad_y)), result in zip(valid, results):
+                xyxy, confidences, classes = result_arrays(result)
+                xyxy = (xyxy - [pad_x, pad_y, pad_x, pad_y]) / ratio
+                rows.extend(detections_to_rows(xyxy, confidences, classes, model.names, timestamp, path))
+
+    elapsed = time.perf_counter() - start
+    processed = len(paths) - skipped
+    return rows, {
+        "images": processed,
+        "skipped": skipped,
+        "detections": len(rows),
+        "seconds": elapsed,
+        "images_per_second": processed / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Batched YOLO defect detection over a folder of images.")
+    parser.add_argument("folder", nargs="?", default=os.path.join(script_dir, "test images"))
+    parser.add_argument("--weights", default=os.path.join(script_dir, "train_results", "weights", "best.pt"))
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4, help="decode threads")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--csv", default=os.path.join("data", "defect_data.csv"), help="defect log to append to")
+    args = parser.parse_args()
+
+    paths = list_images(args.folder)
+    if not paths:
+        parser.error(f"no images found in {args.folder}")
+
+    model = load_backend(args.weights, configured_backend())
+    rows, summary = detect_folder(model, paths, args.batch_size, args.conf, args.workers)
+    DefectLog(args.csv).append(rows)
+    print(f"{summary['images']} images ({summary['skipped']} unreadable), {summary['detections']} detections "
+          f"in {summary['seconds']:.2f}s - {summary['images_per_second']:.1f} images/s")
+    print(f"Appended {len(rows)} rows to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# batch_inspect.py
+# Headless batch inspection with the template-subtraction pipeline.
+#
+# Template features are computed once in the parent process (or loaded from the
+# template cache) and handed to every worker through the pool initializer. Each
+# capture is inspected in a worker process and its result is written to a JSON
+# Lines file as soon as it finishes.
+#
+# Usage:
+#   python batch_inspect.py template.png "test images" -o results.jsonl --workers 4
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from feature_matching import MATCHERS
+from inspection_pipeline import inspect_capture
+from template_features import TemplateFeatureStore, array_to_keypoints, keypoints_to_array
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+# Per-worker state set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(template_payload, backend):
+    # One OpenCV thread per process: the pool already provides the parallelism
+    cv2.setNumThreads(1)
+    _worker["template"] = {
+        "stages": {"thresholded": template_payload["thresholded"]},
+        "keypoints": array_to_keypoints(template_payload["keypoints"]),
+        "descriptors": template_payload["descriptors"],
+    }
+    _worker["backend"] = backend
+    _worker["orb"] = cv2.ORB_create()
+
+
+def _inspect_path(path):
+    start = time.perf_counter()
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        result = {"aligned": False, "num_defects": None, "error": "unreadable image"}
+    else:
+        capture_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        result = inspect_capture(capture_rgb, _worker["template"], _worker["backend"], _worker["orb"])
+    result["image_path"] = path
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def list_captures(capture_dir):
+    return sorted(
+        path for path in glob.glob(os.path.join(capture_dir, "*"))
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def run_batch(template_path, capture_paths, output_path, workers=None, backend="bruteforce",
+              cache_dir=os.path.join("data", "template_cache")):
+    with open(template_path, "rb") as f:
+        features = TemplateFeatureStore(cache_dir).get(f.read())
+    # Plain arrays pickle cheaply; cv2.KeyPoint objects do not pickle at all
+    payload = {
+        "thresholded": features["stages"]["thresholded"],
+        "keypoints": keypoints_to_array(features["keypoints"]),
+        "descriptors": features["descriptors"],
+    }
+
+    done = failed = 0
+    start = time.perf_counter()
+    with open(output_path, "w", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(payload, backend)) as pool:
+        futures = [pool.submit(_inspect_path, path) for path in capture_paths]
+        for future in as_completed(futures):
+            result = future.result()
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            done += 1
+            failed += not result["aligned"]
+            print(f"[{done}/{len(capture_paths)}] {os.path.basename(result['image_path'])}: "
+                  f"{result['num_defects'] if result['aligned'] else 'alignment failed'}")
+
+    elapsed = time.perf_counter() - start
+    return {"images": done, "failed": failed, "seconds": elapsed,
+            "images_per_second": done / elapsed if elapsed > 0 else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a folder of captures against a template PCB image.")
+    parser.add_argument("template", help="template PCB image")
+    parser.add_argument("captures", help="directory of captured images")
+    parser.add_argument("-o", "--output", default="inspection_results.jsonl", help="JSON Lines output file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--backend", default="bruteforce", choices=list(MATCHERS))
+    args = parser.parse_args()
+
+    paths = list_captures(args.captures)
+    if not paths:
+        parser.error(f"no images found in {args.captures}")
+
+    summary = run_batch(args.template, paths, args.output, args.workers, args.backend)
+    print(f"Inspected {summary['images']} images ({summary['failed']} failed to align) in "
+          f"{summary['seconds']:.2f}s - {summary['images_per_second']:.1f} images/s")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# camera_grabber.py
+# Background camera capture for the Streamlit detection page.
+#
+# A daemon thread keeps the device open and reads frames continuously into a small
+# ring buffer (older frames fall off the end), so the page never blocks on
+# cv2.VideoCapture and "Take Photo" simply copies the newest frame.
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class CameraGrabber:
+    def __init__(self, device=0, buffer_size=3, reconnect_delay=1.0):
+        self.device = device
+        self.reconnect_delay = reconnect_delay
+        self._frames = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.frame_id = 0
+        self.dropped = 0
+        self.error = None
+        self._fps = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"camera-{self.device}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        with self._lock:
+            self._frames.clear()
+
+    def latest(self):
+        """Newest (frame_bgr, timestamp, frame_id) or None if nothing was captured yet."""
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def fps(self):
+        return self._fps
+
+    def _run(self):
+        cap = None
+        last = time.monotonic()
+        while not self._stop.is_set():
+            if cap is None or not cap.isOpened():
+                cap = cv2.VideoCapture(self.device)
+                if not cap.isOpened():
+                    self.error = f"Cannot open camera {self.device}"
+                    cap.release()
+                    cap = None
+                    self._stop.wait(self.reconnect_delay)
+                    continue
+                self.error = None
+
+            ok, frame = cap.read()  # blocks until the driver delivers the next frame
+            if not ok:
+                # Device dropped: release it and try to reopen
+                self.error = "Failed to capture frame"
+                cap.release()
+                cap = None
+                self._stop.wait(self.reconnect_delay)
+                continue
+
+            now = time.monotonic()
+            self._fps = 0.9 * self._fps + 0.1 * (1.0 / max(now - last, 1e-6))
+            last = now
+            with self._lock:
+                if len(self._frames) == self._frames.maxlen:
+                    self.dropped += 1
+                self.frame_id += 1
+                self._frames.append((frame, time.time(), self.frame_id))
+
+        if cap is not None:
+            cap.release()
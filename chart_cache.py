@@ -0,0 +1,109 @@
+# chart_cache.py
+# Rendered-chart cache shared by both Streamlit apps.
+#
+# Figures are drawn with the object-oriented matplotlib API (matplotlib.figure.Figure),
+# so nothing is registered in pyplot's global figure manager. Each figure is rendered
+# once to PNG bytes, then closed, and the bytes are cached under a key derived from
+# the chart's input data. Reruns with unchanged data show the cached PNG without
+# drawing anything, and the LRU bound keeps memory flat on long-running stations.
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.figure import Figure
+
+
+def data_version(*parts):
+    """Short content hash of arrays, DataFrames/Series or plain values for use in chart keys."""
+    h = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        if hasattr(part, "to_numpy"):
+            part = part.to_numpy()
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            h.update(f"{part.shape}{part.dtype}".encode())
+            h.update(part.data if part.dtype != object else repr(part.tolist()).encode())
+        else:
+            h.update(repr(part).encode())
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def downsample(length, max_points=1000):
+    """Indices that keep at most ~max_points of a series of `length` points.
+
+    Every bucket keeps its first and last point, so the overall shape and the end
+    points survive; use `downsample_minmax` when spikes must stay visible.
+    """
+    if length <= max_points:
+        return np.arange(length)
+    edges = np.linspace(0, length, max_points // 2 + 1).astype(int)
+    return np.unique(np.concatenate([edges[:-1], edges[1:] - 1]))
+
+
+def downsample_minmax(values, max_points=1000):
+    """Indices of the minimum and maximum of each bucket, in order (peaks are preserved)."""
+    values = np.asarray(values, dtype=float)
+    if len(values) <= max_points:
+        return np.arange(len(values))
+    edges = np.linspace(0, len(values), max_points // 2 + 1).astype(int)
+    keep = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        bucket = values[start:stop]
+        keep.append(start + int(np.nanargmin(bucket)))
+        keep.append(start + int(np.nanargmax(bucket)))
+    return np.unique(keep)
+
+
+class ChartCache:
+    def __init__(self, max_entries=32, dpi=100):
+        self.max_entries = max_entries
+        self.dpi = dpi
+        self._charts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, key, draw, figsize=(10, 6)):
+        """PNG bytes of the chart drawn by `draw(fig)`, rendered only on a cache miss."""
+        with self._lock:
+            png = self._charts.get(key)
+            if png is not None:
+                self._charts.move_to_end(key)
+                self.hits += 1
+                return png
+            self.misses += 1
+
+        fig = Figure(figsize=figsize, dpi=self.dpi)
+        try:
+            draw(fig)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png", bbox_inches="tight")
+            png = buffer.getvalue()
+        finally:
+            # Drop the canvas and artists right away instead of waiting for the GC
+            fig.clear()
+
+        with self._lock:
+            self._charts[key] = png
+            self._charts.move_to_end(key)
+            while len(self._charts) > self.max_entries:
+                self._charts.popitem(last=False)
+        return png
+
+    def clear(self):
+        with self._lock:
+            self._charts.clear()
+
+    def __len__(self):
+        return len(self._charts)
+
+    def stats(self):
+        return {
+            "entries": len(self._charts),
+            "bytes": sum(len(png) for png in self._charts.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,119 @@
+# defect_rollups.py
+# Incrementally maintained aggregates of the defect log for the analytics dashboard.
+#
+# Instead of re-reading, re-mapping and re-grouping every logged row on each visit,
+# the dashboard renders from three rollups that are updated as rows are appended:
+# per-class counts, per-day per-class counts and a fixed-grid 2D location histogram.
+# The rollups are persisted with the byte offset of the defect log they cover, so a
+# restart only folds in rows appended since the last save.
+import json
+import os
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+
+class DefectRollups:
+    def __init__(self, path, class_names, extent=(1280, 1280), bins=(64, 64)):
+        self.path = path
+        self.class_names = class_names
+        self.extent = extent  # (max_x, max_y) in pixels; locations beyond are clipped to the edge
+        self.bins = bins  # (x bins, y bins)
+        self._lock = threading.Lock()
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.offset = 0
+        self.total = 0
+        self.class_counts = Counter()
+        self.daily = defaultdict(Counter)
+        self.histogram = np.zeros((self.bins[1], self.bins[0]), dtype=np.int64)
+        self.version = 0
+
+    def label(self, defect_type):
+        # Older rows store the numeric class id, newer ones may store the name
+        text = str(defect_type)
+        return self.class_names.get(int(text), text) if text.isdigit() else text
+
+    def update(self, frame):
+        """Fold a DataFrame of new defect_data rows into the rollups."""
+        if frame.empty:
+            return
+        labels = frame["defect_type"].map(self.label)
+        self.class_counts.update(labels.value_counts().to_dict())
+
+        # Timestamps are ISO strings, so the date is the first ten characters
+        days = frame["timestamp"].astype(str).str.slice(0, 10)
+        for (day, label), count in pd.crosstab(days, labels).stack().items():
+            if count:
+                self.daily[day][label] += int(count)
+
+        x = pd.to_numeric(frame["location_x"], errors="coerce").to_numpy(dtype=float)
+        y = pd.to_numeric(frame["location_y"], errors="coerce").to_numpy(dtype=float)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        bx = np.clip((x[valid] / self.extent[0] * self.bins[0]).astype(int), 0, self.bins[0] - 1)
+        by = np.clip((y[valid] / self.extent[1] * self.bins[1]).astype(int), 0, self.bins[1] - 1)
+        np.add.at(self.histogram, (by, bx), 1)
+
+        self.total += len(frame)
+        self.version += 1
+
+    def sync(self, defect_log):
+        """Fold in the rows appended to `defect_log` since the last sync and persist."""
+        with self._lock:
+            if os.path.exists(defect_log.path) and os.path.getsize(defect_log.path) < self.offset:
+                # The log was truncated or replaced: rebuild from scratch
+                self._reset()
+            frame, offset = defect_log.read_since(self.offset)
+            if offset == self.offset:
+                return False
+            self.update(frame)
+            self.offset = offset
+            self._save()
+            return True
+
+    def daily_frame(self):
+        """Per-day per-class counts as a small DataFrame (days x classes)."""
+        if not self.daily:
+            return pd.DataFrame()
+        frame = pd.DataFrame.from_dict({day: dict(counts) for day, counts in self.daily.items()},
+                                       orient="index").fillna(0).astype(int)
+        frame.index = pd.to_datetime(frame.index, errors="coerce").date
+        return frame.sort_index()
+
+    def _save(self):
+        state = {
+            "offset": self.offset,
+            "total": self.total,
+            "extent": list(self.extent),
+            "bins": list(self.bins),
+            "class_counts": dict(self.class_counts),
+            "daily": {day: dict(counts) for day, counts in self.daily.items()},
+            "histogram": self.histogram.tolist(),
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if tuple(state.get("extent", ())) != tuple(self.extent) or tuple(state.get("bins", ())) != tuple(self.bins):
+            # Grid settings changed: the stored histogram cannot be reused
+            return
+        self.offset = state["offset"]
+        self.total = state["total"]
+        self.class_counts = Counter(state["class_counts"])
+        self.daily = defaultdict(Counter, {day: Counter(c) for day, c in state["daily"].items()})
+        self.histogram = np.array(state["histogram"], dtype=np.int64)
+        self.version = 1
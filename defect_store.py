@@ -0,0 +1,73 @@
+# defect_store.py
+# Append-only defect log backed by data/defect_data.csv.
+#
+# Each inspection appends its rows in one write instead of rewriting the whole
+# history, and readers pick up only the rows added since their last read by
+# remembering the byte offset they stopped at.
+import csv
+import io
+import os
+import threading
+
+import pandas as pd
+
+DEFECT_COLUMNS = [
+    "timestamp", "defect_type", "confidence",
+    "location_x", "location_y", "image_path"
+]
+
+
+class DefectLog:
+    def __init__(self, path, columns=DEFECT_COLUMNS):
+        self.path = path
+        self.columns = list(columns)
+        self._lock = threading.Lock()
+
+    def empty_frame(self):
+        return pd.DataFrame(columns=self.columns)
+
+    def append(self, rows):
+        """Append a batch of row dicts with a single write; returns the number of rows written."""
+        if not rows:
+            return 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.columns, extrasaction="ignore",
+                                lineterminator="\n")
+        with self._lock:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                writer.writeheader()
+            writer.writerows(rows)
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                f.write(buffer.getvalue())
+        return len(rows)
+
+    def read_since(self, offset=0):
+        """Read rows appended after byte `offset`.
+
+        Returns (DataFrame, new_offset). Only complete lines are consumed, so a
+        batch that is still being written is picked up on the next call.
+        """
+        if not os.path.exists(self.path):
+            return self.empty_frame(), 0
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            return self.empty_frame(), offset
+        chunk = chunk[:end + 1]
+        new_offset = offset + len(chunk)
+
+        text = chunk.decode("utf-8")
+        if offset == 0:
+            # Skip the header line written with the first batch
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+        if not text.strip():
+            return self.empty_frame(), new_offset
+
+        frame = pd.read_csv(io.StringIO(text), header=None, names=self.columns)
+        return frame, new_offset
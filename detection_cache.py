@@ -0,0 +1,87 @@
+# detection_cache.py
+# Content-addressed cache for YOLO detection results.
+#
+# st_cropper(..., realtime_update=True) reruns the whole script on every drag, so the
+# same crop is often sent to model.predict many times in a row. Results are stored
+# under a hash of the crop pixels, the confidence threshold and the model version,
+# which makes repeated reruns on an unchanged crop free.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def crop_key(image, conf, model_version):
+    """Hash the pixels of `image` together with the detection settings."""
+    image = np.ascontiguousarray(image)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.shape}|{image.dtype}|{conf:.4f}|{model_version}".encode())
+    h.update(image.data)
+    return h.hexdigest()
+
+
+class DetectionCache:
+    """Bounded LRU cache shared by all sessions of the Streamlit process."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class CropDebouncer:
+    """Tells whether a crop has stopped changing for at least `settle_time` seconds.
+
+    One instance lives in each session's state. Every rerun reports the current crop
+    key; a key that differs from the previous one restarts the settle timer.
+    """
+
+    def __init__(self, settle_time=0.6):
+        self.settle_time = settle_time
+        self.last_key = None
+        self.changed_at = 0.0
+
+    def is_settled(self, key):
+        now = time.monotonic()
+        if key != self.last_key:
+            self.last_key = key
+            self.changed_at = now
+            return False
+        return now - self.changed_at >= self.settle_time
+
+    def remaining(self):
+        return max(0.0, self.settle_time - (time.monotonic() - self.changed_at))
@@ -0,0 +1,71 @@
+# detection_utils.py
+# Array helpers for detection boxes: class-aware NMS and box drawing.
+# Boxes are (N, 4) float arrays in xyxy pixel coordinates.
+import cv2
+import numpy as np
+
+# BGR colours cycled per class id when drawing
+_PALETTE = [
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+    (10, 249, 72), (23, 204, 146), (134, 219, 61), (211, 188, 0),
+]
+
+
+def result_arrays(result):
+    """(xyxy, confidences, class_ids) of an ultralytics Results object as NumPy arrays.
+
+    boxes.data holds [x1, y1, x2, y2, conf, cls] per row, so one transfer covers all boxes.
+    """
+    data = result.boxes.data.cpu().numpy().reshape(-1, result.boxes.data.shape[-1])
+    return data[:, :4].astype(np.float64), data[:, 4].astype(np.float64), data[:, 5].astype(int)
+
+
+def box_iou(box, boxes):
+    """IoU of one box against an (N, 4) array of boxes."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(boxes, scores, classes=None, iou_threshold=0.5):
+    """Greedy non-maximum suppression; returns the kept indices sorted by score.
+
+    With `classes` given, boxes only suppress boxes of the same class.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    if classes is not None:
+        # Offsetting every class into its own coordinate range makes one pass class-aware
+        offset = (np.asarray(classes, dtype=np.float64) * (boxes.max() + 1))[:, None]
+        boxes = boxes + offset
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        order = rest[box_iou(boxes[best], boxes[rest]) <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def draw_detections(image_bgr, xyxy, classes, confidences, names, line_width=2, font_scale=0.5):
+    """Return a copy of `image_bgr` with labelled boxes, similar to Results.plot()."""
+    annotated = image_bgr.copy()
+    for (x1, y1, x2, y2), cls, conf in zip(np.asarray(xyxy).astype(int), classes, confidences):
+        color = _PALETTE[int(cls) % len(_PALETTE)]
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, line_width)
+        label = f"{names.get(int(cls), int(cls))} {float(conf):.2f}"
+        (tw, th), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        top = max(y1 - th - baseline, 0)
+        cv2.rectangle(annotated, (x1, top), (x1 + tw, top + th + baseline), color, -1)
+        cv2.putText(annotated, label, (x1, top + th), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+    return annotated
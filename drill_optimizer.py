@@ -0,0 +1,346 @@
+# drill_optimizer.py
+# Reorders the drill hits of FlatCAM Excellon programs to shorten rapid travel.
+#
+# A hit is a "G00 X.. Y.." line followed by its Z-only plunge/retract lines. Every
+# run of consecutive hits (one run per tool section, since T/M6/M0 lines end a run)
+# is reordered independently: a nearest-neighbour tour from the position before the
+# run, improved with 2-opt and Or-opt moves restricted to each hole's nearest
+# neighbours so that boards with thousands of holes stay fast. Everything that is not
+# a hit (header, tool-change blocks, spindle commands, end block) is kept verbatim.
+#
+# Usage:  python drill_optimizer.py "Complex Design/[4x4]Drill_PTH_Through.DRL_cnc.nc" -o optimized.nc
+import argparse
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+from gcode_program import parse_gcode
+
+AXIS_WORD = re.compile(r"([XYZ])\s*([-+]?(?:\d+\.?\d*|\.\d+))", re.I)
+DEFAULT_RAPID_RATE = 1500.0  # mm/min, FlatCAM "Feedrate rapids" default
+
+
+def _code(line):
+    return re.sub(r"\(.*?\)|;.*$", "", line).strip().upper()
+
+
+def _axes(code):
+    return {letter.upper(): float(value) for letter, value in AXIS_WORD.findall(code)}
+
+
+def _is_z_only_move(code):
+    axes = _axes(code)
+    return bool(re.match(r"^G0*[01](?!\d)", code)) and set(axes) == {"Z"}
+
+
+def split_hits(lines):
+    """Segments of the program: ("keep", [lines], None) and ("hits", [(x, y, [lines]), ...], start).
+
+    `start` is the XY position before a run of hits, used as the tour start.
+    """
+    segments = []
+    position = (0.0, 0.0)
+    index = 0
+    while index < len(lines):
+        code = _code(lines[index])
+        axes = _axes(code)
+        is_rapid_xy = re.match(r"^G0*0(?!\d)", code) and ("X" in axes or "Y" in axes) and "Z" not in axes
+        block_end = index + 1
+        plunges = False
+        if is_rapid_xy:
+            while block_end < len(lines) and _is_z_only_move(_code(lines[block_end])):
+                plunges |= _code(lines[block_end]).startswith("G01") and _axes(_code(lines[block_end]))["Z"] < 0
+                block_end += 1
+        if is_rapid_xy and plunges:
+            hit = (axes.get("X", position[0]), axes.get("Y", position[1]), lines[index:block_end])
+            if segments and segments[-1][0] == "hits":
+                segments[-1][1].append(hit)
+            else:
+                segments.append(("hits", [hit], position))
+            position = hit[:2]
+            index = block_end
+            continue
+        if "X" in axes or "Y" in axes:
+            position = (axes.get("X", position[0]), axes.get("Y", position[1]))
+        if segments and segments[-1][0] == "keep":
+            segments[-1][1].append(lines[index])
+        else:
+            segments.append(("keep", [lines[index]], None))
+        index += 1
+    return segments
+
+
+def _brute_force_neighbours(points, rows, k):
+    result = np.empty((len(rows), k), dtype=np.int64)
+    for first in range(0, len(rows), 512):
+        block_rows = rows[first:first + 512]
+        d = ((points[block_rows, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+        d[np.arange(len(block_rows)), block_rows] = np.inf
+        part = np.argpartition(d, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(d, part, axis=1).argsort(axis=1)
+        result[first:first + len(block_rows)] = np.take_along_axis(part, order, axis=1)
+    return result
+
+
+def nearest_neighbours(points, k):
+    """Indices of the k nearest other points of every point.
+
+    Points are bucketed in a uniform grid with about k points per cell and each cell
+    is searched against its 3x3 block. That is exact whenever the k-th neighbour is
+    no farther than one cell; the remaining points fall back to a brute-force scan.
+    """
+    n = len(points)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty((n, 0), dtype=np.int64)
+    lo = points.min(axis=0)
+    span = np.maximum(points.max(axis=0) - lo, 1e-9)
+    cell = max(np.sqrt(span[0] * span[1] * (k + 1) / n), span.max() * (k + 1) / n)
+    ij = ((points - lo) // cell).astype(np.int64)
+    rows = int(ij[:, 1].max()) + 3
+    keys = (ij[:, 0] + 1) * rows + ij[:, 1] + 1
+    order = np.argsort(keys, kind="stable")
+    cell_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    cells = {key: order[first:first + count] for key, first, count in
+             zip(cell_keys.tolist(), starts.tolist(), counts.tolist())}
+
+    result = np.empty((n, k), dtype=np.int64)
+    fallback = []
+    for key, members in cells.items():
+        candidates = np.concatenate([cells[key + dx * rows + dy] for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                                     if key + dx * rows + dy in cells])
+        if len(candidates) <= k:
+            fallback.append(members)
+            continue
+        d = ((points[members, None, :] - points[None, candidates, :]) ** 2).sum(axis=2)
+        d[members[:, None] == candidates[None, :]] = np.inf
+        part = np.argpartition(d, k - 1, axis=1)[:, :k]
+        part_d = np.take_along_axis(d, part, axis=1)
+        sort = part_d.argsort(axis=1)
+        result[members] = candidates[np.take_along_axis(part, sort, axis=1)]
+        # A neighbour beyond one cell may have a closer one outside the 3x3 block
+        far = part_d.max(axis=1) > cell * cell
+        if far.any():
+            fallback.append(members[far])
+    if fallback:
+        far_rows = np.concatenate(fallback)
+        result[far_rows] = _brute_force_neighbours(points, far_rows, k)
+    return result
+
+
+def nearest_neighbour_tour(points, start, near=None):
+    """Greedy open tour over `points` starting next to `start`.
+
+    With `near` (neighbour lists of the points) the next hole is taken from the
+    current hole's list when one of them is still unvisited; only otherwise are all
+    remaining holes scanned.
+    """
+    remaining = np.ones(len(points), dtype=bool)
+    tour = []
+    current = np.asarray(start, dtype=float)
+    nxt = None
+    for _ in range(len(points)):
+        candidates = [c for c in near[nxt] if remaining[c]] if near is not None and nxt is not None else []
+        if candidates:
+            d = ((points[candidates] - current) ** 2).sum(axis=1)
+            nxt = candidates[int(np.argmin(d))]
+        else:
+            d = ((points - current) ** 2).sum(axis=1)
+            d[~remaining] = np.inf
+            nxt = int(np.argmin(d))
+        tour.append(nxt)
+        remaining[nxt] = False
+        current = points[nxt]
+    return tour
+
+
+def open_path_length(points, start, order):
+    path = np.vstack([start, points[order]])
+    return float(np.linalg.norm(np.diff(path, axis=0), axis=1).sum())
+
+
+def improve_tour(points, start, tour, neighbours=10, max_seconds=10.0, near=None):
+    """2-opt and Or-opt on an open path with a fixed start, using neighbour lists.
+
+    `max_seconds` is a hard limit: both passes stop as soon as it has elapsed.
+    `near` are precomputed neighbour lists of [start, *points].
+    """
+    # Node 0 is the fixed start position; holes are nodes 1..n
+    coords = np.vstack([start, points])
+    xs, ys = coords[:, 0].tolist(), coords[:, 1].tolist()
+    near = (nearest_neighbours(coords, neighbours) if near is None else near).tolist()
+    t = [0] + [i + 1 for i in tour]
+    pos = [0] * len(t)
+    for i, node in enumerate(t):
+        pos[node] = i
+    last = len(t) - 1
+
+    def dist(a, b):
+        return math.hypot(xs[a] - xs[b], ys[a] - ys[b])
+
+    def reverse(i, j):
+        t[i:j + 1] = t[i:j + 1][::-1]
+        for p in range(i, j + 1):
+            pos[t[p]] = p
+
+    deadline = time.perf_counter() + max_seconds
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+
+        # 2-opt: make a and its neighbour c adjacent by reversing t[i+1..j]
+        for i in range(last):
+            if time.perf_counter() >= deadline:
+                break
+            a, b = t[i], t[i + 1]
+            for c in near[a]:
+                j = pos[c]
+                if j <= i + 1:
+                    continue
+                d_next = t[j + 1] if j < last else None
+                gain = dist(a, b) - dist(a, c)
+                if d_next is not None:
+                    gain += dist(c, d_next) - dist(b, d_next)
+                if gain > 1e-9:
+                    reverse(i + 1, j)
+                    improved = True
+                    b = t[i + 1]
+
+        # Or-opt: move a segment of 1-3 holes next to a neighbour, in either orientation
+        for length in (1, 2, 3):
+            s = 1
+            while s + length - 1 <= last:
+                if time.perf_counter() >= deadline:
+                    break
+                e = s + length - 1
+                first, end = t[s], t[e]
+                prev = t[s - 1]
+                nxt = t[e + 1] if e < last else None
+                removal = dist(prev, first) + (dist(end, nxt) - dist(prev, nxt) if nxt is not None else 0.0)
+                best = None
+                for anchor in set(near[first] + near[end]):
+                    k = pos[anchor]
+                    if s - 1 <= k <= e:
+                        continue
+                    after = t[k + 1] if k < last else None
+                    base = dist(anchor, after) if after is not None else 0.0
+                    for head, tail in ((first, end), (end, first)):
+                        added = dist(anchor, head) + (dist(tail, after) if after is not None else 0.0) - base
+                        gain = removal - added
+                        if gain > 1e-9 and (best is None or gain > best[0]):
+                            best = (gain, k, head == end and length > 1)
+                if best is None:
+                    s += 1
+                    continue
+                _, k, flipped = best
+                segment = t[s:e + 1]
+                if flipped:
+                    segment.reverse()
+                rest = t[:s] + t[e + 1:]
+                k = k if k < s else k - length
+                t[:] = rest[:k + 1] + segment + rest[k + 1:]
+                # Only the stretch between the old and new segment position has moved
+                for p in range(min(s, k + 1), max(e, k + length) + 1):
+                    pos[t[p]] = p
+                improved = True
+                s += 1
+    return [node - 1 for node in t[1:]]
+
+
+def optimize_hits(hits, start, neighbours=10, max_seconds=10.0):
+    """New order (indices into `hits`) for one run of hits starting at `start`."""
+    if len(hits) < 3:
+        return list(range(len(hits)))
+    points = np.array([(x, y) for x, y, _ in hits], dtype=float)
+    start = np.asarray(start, dtype=float)
+    # One neighbour search serves the greedy tour and the improvement passes
+    near = nearest_neighbours(np.vstack([start, points]), neighbours)
+    hole_near = [[c - 1 for c in row if c] for row in near[1:].tolist()]
+    tour = nearest_neighbour_tour(points, start, hole_near)
+    tour = improve_tour(points, start, tour, neighbours, max_seconds, near)
+    # Never accept an order that is longer than the original one
+    original = list(range(len(hits)))
+    if open_path_length(points, start, tour) >= open_path_length(points, start, original):
+        return original
+    return tour
+
+
+def _normalise_retract(hits):
+    # A hit must end retracted before the next rapid; FlatCAM occasionally omits the
+    # retract, which is only harmless while the original order is kept
+    retracts = [block[-1] for _, _, block in hits if _code(block[-1]).startswith("G00")]
+    if not retracts:
+        return hits
+    retract = max(set(retracts), key=retracts.count)
+    return [(x, y, block if _code(block[-1]).startswith("G00") else block + [retract]) for x, y, block in hits]
+
+
+def rapid_report(text, rapid_rate=None):
+    moves, header = parse_gcode(text)
+    rapid_rate = rapid_rate or header.get("feedrate_rapids") or next(
+        (tool["feedrate_rapids"] for tool in header.get("tools", {}).values() if "feedrate_rapids" in tool),
+        DEFAULT_RAPID_RATE)
+    xyz = np.column_stack([moves["x"], moves["y"], moves["z"]])
+    lengths = np.zeros(len(xyz))
+    lengths[1:] = np.nan_to_num(np.linalg.norm(np.diff(xyz, axis=0), axis=1))
+    rapid_mm = float(lengths[moves["motion"] == 0].sum())
+    return {"rapid_mm": round(rapid_mm, 2), "rapid_s": round(rapid_mm / rapid_rate * 60, 2),
+            "rapid_rate": rapid_rate}
+
+
+def optimize_program(text, neighbours=10, max_seconds=10.0):
+    """(optimized text, report) for a drill program."""
+    start_time = time.perf_counter()
+    lines = text.splitlines()
+    output, holes = [], 0
+    for kind, content, start in split_hits(lines):
+        if kind == "keep":
+            output.extend(content)
+            continue
+        hits = _normalise_retract(content)
+        holes += len(hits)
+        for index in optimize_hits(hits, start, neighbours, max_seconds):
+            output.extend(hits[index][2])
+    newline = "\r\n" if "\r\n" in text else "\n"  # FlatCAM writes CRLF
+    optimized = newline.join(output) + (newline if text.endswith("\n") else "")
+
+    before, after = rapid_report(text), rapid_report(optimized)
+    return optimized, {
+        "holes": holes,
+        "before": before,
+        "after": after,
+        "saved_mm": round(before["rapid_mm"] - after["rapid_mm"], 2),
+        "saved_s": round(before["rapid_s"] - after["rapid_s"], 2),
+        "optimize_s": round(time.perf_counter() - start_time, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reorder drill hits to minimise rapid travel.")
+    parser.add_argument("gcode")
+    parser.add_argument("-o", "--output", help="default: <name>_optimized.nc next to the input")
+    parser.add_argument("--neighbours", type=int, default=10, help="candidate neighbours per hole")
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="improvement time limit per tool section")
+    args = parser.parse_args()
+
+    with open(args.gcode, encoding="utf-8", errors="replace", newline="") as f:
+        text = f.read()
+    optimized, report = optimize_program(text, args.neighbours, args.max_seconds)
+    output = args.output or os.path.splitext(args.gcode)[0] + "_optimized.nc"
+    with open(output, "w", encoding="utf-8", newline="") as f:
+        f.write(optimized)
+
+    before, after = report["before"], report["after"]
+    print(f"{report['holes']} holes, optimised in {report['optimize_s']:.2f}s")
+    print(f"Rapid travel: {before['rapid_mm']:.1f} mm -> {after['rapid_mm']:.1f} mm "
+          f"(saved {report['saved_mm']:.1f} mm)")
+    print(f"Rapid time at {before['rapid_rate']:.0f} mm/min: {before['rapid_s']:.1f} s -> {after['rapid_s']:.1f} s "
+          f"(saved {report['saved_s']:.1f} s)")
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# feature_matching.py
+# Pluggable ORB descriptor matching for the alignment step.
+#
+# Both backends run a kNN (k=2) match followed by Lowe's ratio test, keep only the
+# best `max_matches` pairs for RANSAC and gather the point arrays with NumPy indexing
+# instead of per-match list comprehensions.
+#
+# Micro-benchmark:  python feature_matching.py "test images"
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+FLANN_INDEX_LSH = 6
+
+
+def _bruteforce_matcher():
+    return cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+
+
+def _flann_lsh_matcher():
+    index_params = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+    search_params = dict(checks=50)
+    return cv2.FlannBasedMatcher(index_params, search_params)
+
+
+MATCHERS = {
+    "bruteforce": _bruteforce_matcher,
+    "flann-lsh": _flann_lsh_matcher,
+}
+
+
+def match_descriptors(des1, des2, backend="bruteforce", ratio=0.75, max_matches=200):
+    """kNN-match des1 (query) against des2 (train).
+
+    Returns (query_idx, train_idx, distance) arrays sorted by distance, holding at
+    most `max_matches` pairs that passed the ratio test.
+    """
+    empty = (np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32))
+    if des1 is None or des2 is None or len(des1) < 2 or len(des2) < 2:
+        return empty
+
+    knn = MATCHERS[backend]().knnMatch(des1, des2, k=2)
+    # FLANN-LSH can return fewer than two neighbours for some descriptors
+    pairs = np.array(
+        [(m[0].queryIdx, m[0].trainIdx, m[0].distance, m[1].distance) for m in knn if len(m) == 2],
+        dtype=np.float32,
+    ).reshape(-1, 4)
+
+    pairs = pairs[pairs[:, 2] < ratio * pairs[:, 3]]
+    if len(pairs) > max_matches:
+        pairs = pairs[np.argpartition(pairs[:, 2], max_matches - 1)[:max_matches]]
+    pairs = pairs[np.argsort(pairs[:, 2], kind="stable")]
+
+    return pairs[:, 0].astype(np.int32), pairs[:, 1].astype(np.int32), pairs[:, 2]
+
+
+def gather_points(kp1, kp2, query_idx, train_idx):
+    """Build the (N, 1, 2) source/destination arrays expected by findHomography."""
+    pts1 = cv2.KeyPoint_convert(kp1).reshape(-1, 2)
+    pts2 = cv2.KeyPoint_convert(kp2).reshape(-1, 2)
+    src_pts = pts1[query_idx].reshape(-1, 1, 2).astype(np.float32)
+    dst_pts = pts2[train_idx].reshape(-1, 1, 2).astype(np.float32)
+    return src_pts, dst_pts
+
+
+def to_dmatches(query_idx, train_idx, distance):
+    # Only needed for cv2.drawMatches visualisations
+    return [cv2.DMatch(int(q), int(t), float(d)) for q, t, d in zip(query_idx, train_idx, distance)]
+
+
+def find_homography(kp1, des1, kp2, des2, backend="bruteforce", ratio=0.75, max_matches=200,
+                    reproj_threshold=5.0):
+    """Match and estimate the homography mapping kp1 coordinates onto kp2.
+
+    Returns (h, inlier_mask, (query_idx, train_idx, distance)); h is None when there
+    are fewer than four usable matches or RANSAC fails.
+    """
+    matches = match_descriptors(des1, des2, backend, ratio, max_matches)
+    if len(matches[0]) < 4:
+        return None, None, matches
+    src_pts, dst_pts = gather_points(kp1, kp2, matches[0], matches[1])
+    h, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, reproj_threshold)
+    return h, mask, matches
+
+
+def corner_error(h_est, h_true, width, height):
+    """Mean distance between the image corners projected with both homographies."""
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    est = cv2.perspectiveTransform(corners, h_est)
+    true = cv2.perspectiveTransform(corners, h_true)
+    return float(np.linalg.norm(est - true, axis=2).mean())
+
+
+def _random_homography(rng, width, height, jitter=0.06):
+    src = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    offsets = rng.uniform(-jitter, jitter, size=(4, 2)) * [width, height]
+    return cv2.getPerspectiveTransform(src, (src + offsets).astype(np.float32))
+
+
+def benchmark(image_dir, backends, ratio=0.75, max_matches=200, seed=0):
+    """Warp each image with a known random homography and recover it with every backend."""
+    # Local import keeps this module usable without Pillow
+    from template_features import ALIGN_SIZE
+
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")) + glob.glob(os.path.join(image_dir, "*.png")))
+    rng = np.random.default_rng(seed)
+    orb = cv2.ORB_create()
+    width, height = ALIGN_SIZE
+    stats = {name: {"time": [], "inliers": [], "error": [], "failed": 0} for name in backends}
+
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        template = cv2.GaussianBlur(cv2.resize(image, ALIGN_SIZE), (3, 3), 0)
+        h_true = _random_homography(rng, width, height)
+        capture = cv2.warpPerspective(template, h_true, ALIGN_SIZE)
+
+        kp1, des1 = orb.detectAndCompute(template, None)
+        kp2, des2 = orb.detectAndCompute(capture, None)
+
+        for name in backends:
+            start = time.perf_counter()
+            h, mask, _ = find_homography(kp1, des1, kp2, des2, name, ratio, max_matches)
+            stats[name]["time"].append(time.perf_counter() - start)
+            if h is None:
+                stats[name]["failed"] += 1
+                continue
+            stats[name]["inliers"].append(float(mask.mean()))
+            stats[name]["error"].append(corner_error(h, h_true, width, height))
+
+    return len(paths), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ORB matcher backends on a folder of images.")
+    parser.add_argument("image_dir", nargs="?", default="test images")
+    parser.add_argument("--backends", nargs="+", default=list(MATCHERS), choices=list(MATCHERS))
+    parser.add_argument("--ratio", type=float, default=0.75)
+    parser.add_argument("--max-matches", type=int, default=200)
+    args = parser.parse_args()
+
+    count, stats = benchmark(args.image_dir, args.backends, args.ratio, args.max_matches)
+    print(f"{count} images, ratio={args.ratio}, max_matches={args.max_matches}")
+    print(f"{'backend':<12} {'match ms':>9} {'p95 ms':>8} {'inliers':>8} {'H err px':>9} {'failed':>7}")
+    for name, s in stats.items():
+        times = np.array(s["time"]) * 1000
+        print(f"{name:<12} {times.mean():>9.2f} {np.percentile(times, 95):>8.2f} "
+              f"{np.mean(s['inliers']) if s['inliers'] else float('nan'):>8.2f} "
+              f"{np.median(s['error']) if s['error'] else float('nan'):>9.2f} {s['failed']:>7}")
+
+
+if __name__ == "__main__":
+    main()
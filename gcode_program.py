@@ -0,0 +1,253 @@
+# gcode_program.py
+# G-code parser producing a compact, array-backed toolpath.
+#
+# A FlatCAM .nc file is read into one NumPy structured array with a row per motion
+# block (G00/G01/G02/G03 with at least one axis word). Modal state is carried
+# forward, so every row holds the absolute X/Y/Z target in mm, the feed, the spindle
+# speed (0 while stopped) and the active tool. The header comments (tool diameter,
+# feedrates, X/Y range, ...) are parsed into a dict.
+#
+# The parsed form can be cached under data/gcode_cache as a .npy file keyed by the
+# content hash of the program; cached loads are memory-mapped and take milliseconds.
+#
+# Usage:  python gcode_program.py "Complex Design/[4x4]Gerber_TopLayer.GTL_iso_combined_cnc.nc"
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+PARSER_VERSION = "1"
+CACHE_DIR = os.path.join("data", "gcode_cache")
+
+MOVE_DTYPE = np.dtype([
+    ("line", np.int32),      # 1-based source line number
+    ("motion", np.int8),     # 0 rapid, 1 linear, 2 arc CW, 3 arc CCW
+    ("x", np.float64),
+    ("y", np.float64),
+    ("z", np.float64),
+    ("i", np.float64),       # arc centre offsets (NaN for straight moves)
+    ("j", np.float64),
+    ("feed", np.float32),    # mm/min
+    ("spindle", np.float32), # RPM, 0 while the spindle is off
+    ("tool", np.int16),      # -1 before the first T word
+])
+
+WORD = re.compile(r"([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+COMMENT = re.compile(r"\(([^)]*)\)|;(.*)$")
+NUMBER = r"([-+]?\d+(?:\.\d+)?)"
+
+# Header comment patterns of the FlatCAM default preprocessors (geometry and excellon)
+HEADER_PATTERNS = {
+    "tool_diameter": re.compile(rf"TOOL DIAMETER:\s*{NUMBER}", re.I),
+    "feedrate_xy": re.compile(rf"Feedrate_XY:\s*{NUMBER}", re.I),
+    "feedrate_z": re.compile(rf"Feedrate_Z:\s*{NUMBER}", re.I),
+    "feedrate_rapids": re.compile(rf"Feedrate rapids\s*{NUMBER}", re.I),
+    "z_cut": re.compile(rf"Z_Cut:\s*{NUMBER}", re.I),
+    "z_move": re.compile(rf"Z_Move:\s*{NUMBER}", re.I),
+    "z_toolchange": re.compile(rf"Z Toolchange:\s*{NUMBER}", re.I),
+    "z_end": re.compile(rf"Z End:\s*{NUMBER}", re.I),
+    "spindle_speed": re.compile(rf"Spindle Speed:\s*{NUMBER}", re.I),
+    "steps_per_circle": re.compile(rf"Steps per circle:\s*{NUMBER}", re.I),
+}
+RANGE_PATTERN = re.compile(rf"([XY]) range:\s*{NUMBER}\s*\.\.\.\s*{NUMBER}", re.I)
+# Excellon tool tables: "(Tool: 1 -> Dia: 1.501)", "(Tool: 1 -> Feedrate Rapids: 1500)", ...
+TOOL_TABLE_PATTERN = re.compile(rf"Tool:\s*(\d+)\s*->\s*([A-Za-z_ ]+?):\s*{NUMBER}", re.I)
+
+
+def parse_header(comments):
+    """Header values from the comment lines at the top of a FlatCAM program."""
+    header = {"tools": {}}
+    for comment in comments:
+        if comment.startswith("Name:"):
+            header.setdefault("name", comment.split(":", 1)[1].strip())
+        elif comment.startswith("Units:"):
+            header.setdefault("units", comment.split(":", 1)[1].strip())
+        for key, pattern in HEADER_PATTERNS.items():
+            match = pattern.search(comment)
+            if match and key not in header:
+                header[key] = float(match.group(1))
+        match = RANGE_PATTERN.search(comment)
+        if match:
+            header[f"{match.group(1).lower()}_range"] = (float(match.group(2)), float(match.group(3)))
+        match = TOOL_TABLE_PATTERN.search(comment)
+        if match:
+            field = match.group(2).strip().lower().replace(" ", "_")
+            header["tools"].setdefault(int(match.group(1)), {})[field] = float(match.group(3))
+    # Excellon programs have no single TOOL DIAMETER line, only the tool table
+    if "tool_diameter" not in header and len(header["tools"]) == 1:
+        only = next(iter(header["tools"].values()))
+        if "dia" in only:
+            header["tool_diameter"] = only["dia"]
+    return header
+
+
+def parse_gcode(text):
+    """(moves, header) for G-code `text`; moves is a MOVE_DTYPE structured array."""
+    rows = []
+    header_comments = []
+    in_header = True
+    motion, feed, spindle_speed, tool = 0, 0.0, 0.0, -1
+    spindle_on, absolute, scale = False, True, 1.0
+    position = [np.nan, np.nan, np.nan]
+
+    for number, raw in enumerate(text.splitlines(), 1):
+        comments = [a or b for a, b in COMMENT.findall(raw)]
+        code = COMMENT.sub("", raw).upper()
+        if in_header:
+            header_comments.extend(c.strip() for c in comments)
+        words = WORD.findall(code)
+        if not words:
+            continue
+        in_header = False
+
+        axes = {}
+        arc = {}
+        for letter, value in words:
+            value = float(value)
+            if letter == "G":
+                g = int(value) if value == int(value) else value
+                if g in (0, 1, 2, 3):
+                    motion = g
+                elif g == 20:
+                    scale = 25.4
+                elif g == 21:
+                    scale = 1.0
+                elif g == 90:
+                    absolute = True
+                elif g == 91:
+                    absolute = False
+            elif letter == "M":
+                if value in (3, 4):
+                    spindle_on = True
+                elif value in (5, 2, 30):
+                    spindle_on = False
+            elif letter in "XYZ":
+                axes[letter] = value * scale
+            elif letter in "IJ":
+                arc[letter] = value * scale
+            elif letter == "F":
+                feed = value * scale
+            elif letter == "S":
+                spindle_speed = value
+            elif letter == "T":
+                tool = int(value)
+
+        if not axes:
+            continue
+        for index, letter in enumerate("XYZ"):
+            if letter in axes:
+                if absolute or np.isnan(position[index]):
+                    position[index] = axes[letter]
+                else:
+                    position[index] += axes[letter]
+        is_arc = motion in (2, 3)
+        rows.append((number, motion, *position,
+                     arc.get("I", 0.0) if is_arc else np.nan, arc.get("J", 0.0) if is_arc else np.nan,
+                     feed, spindle_speed if spindle_on else 0.0, tool))
+
+    return np.array(rows, dtype=MOVE_DTYPE), parse_header(header_comments)
+
+
+class Toolpath:
+    def __init__(self, moves, header, path=None, digest=None):
+        self.moves = moves
+        self.header = header
+        self.path = path
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __getitem__(self, column):
+        return self.moves[column]
+
+    def xyz(self):
+        """(N, 3) array of the absolute targets."""
+        return np.column_stack([self.moves["x"], self.moves["y"], self.moves["z"]])
+
+    def segment_lengths(self):
+        """Straight-line length of each move from the previous target (0 where unknown)."""
+        xyz = self.xyz()
+        lengths = np.zeros(len(xyz))
+        if len(xyz) > 1:
+            lengths[1:] = np.nan_to_num(np.linalg.norm(np.diff(xyz, axis=0), axis=1))
+        return lengths
+
+    def summary(self):
+        lengths = self.segment_lengths()
+        motion = self.moves["motion"]
+        return {
+            "moves": len(self),
+            "rapids": int((motion == 0).sum()),
+            "feeds": int((motion == 1).sum()),
+            "arcs": int(np.isin(motion, (2, 3)).sum()),
+            "rapid_mm": round(float(lengths[motion == 0].sum()), 3),
+            "cut_mm": round(float(lengths[motion != 0].sum()), 3),
+            "tools": sorted(int(t) for t in np.unique(self.moves["tool"]) if t >= 0),
+        }
+
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_program(path, cache_dir=CACHE_DIR, use_cache=True):
+    """Toolpath of the .nc file at `path`, memory-mapped from the cache when possible."""
+    digest = file_digest(path)
+    if use_cache:
+        stem = os.path.join(cache_dir, f"{digest}-v{PARSER_VERSION}")
+        try:
+            moves = np.load(stem + ".npy", mmap_mode="r")
+            with open(stem + ".json", encoding="utf-8") as f:
+                header = json.load(f)
+            header["tools"] = {int(k): v for k, v in header.get("tools", {}).items()}
+            for key in ("x_range", "y_range"):
+                if key in header:
+                    header[key] = tuple(header[key])
+            return Toolpath(moves, header, path, digest)
+        except (OSError, ValueError):
+            pass
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        moves, header = parse_gcode(f.read())
+
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to temporary names first so a concurrent reader never sees half a file
+        tmp = f"{stem}.{os.getpid()}.tmp"
+        np.save(tmp + ".npy", moves)
+        with open(tmp + ".json", "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp + ".json", stem + ".json")
+        os.replace(tmp + ".npy", stem + ".npy")
+    return Toolpath(moves, header, path, digest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse a G-code program into columnar arrays.")
+    parser.add_argument("gcode", nargs="+")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    for path in args.gcode:
+        start = time.perf_counter()
+        program = load_program(path, use_cache=not args.no_cache)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        load_program(path, use_cache=not args.no_cache)
+        second = time.perf_counter() - start
+        print(f"{path}: {program.summary()}")
+        print(f"  header: {program.header}")
+        print(f"  load {first * 1000:.1f} ms, again {second * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
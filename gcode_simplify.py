@@ -0,0 +1,285 @@
+# gcode_simplify.py
+# Post-processor that shrinks FlatCAM isolation programs.
+#
+# With "Steps per circle: 64" every pad outline becomes dozens of tiny G01 chords.
+# Runs of consecutive XY feed moves are rewritten greedily: collinear points are
+# merged into one G01 and curved stretches are replaced by G02/G03 arcs (I/J centre
+# format) whenever every original vertex and every original chord stays within the
+# chord tolerance of the new element. Each emitted element is then verified by
+# sampling it and measuring the two-way distance to the original polyline; elements
+# that fail fall back to the original lines. All other lines are kept verbatim.
+#
+# Arcs are checked with the I/J and end point exactly as written: GRBL rejects an arc
+# (error 33) when its end radius differs from the start radius r by more than
+# 0.005 mm and also by more than 0.5 mm or 0.1% of r, so the accepted mismatch is
+# max(0.005, min(0.5, 0.001 * r)).
+#
+# Usage:  python gcode_simplify.py "Complex Design/[4x4]Gerber_TopLayer.GTL_iso_combined_cnc.nc" --tolerance 0.01
+import argparse
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+AXIS_WORD = re.compile(r"([XYZ])\s*([-+]?(?:\d+\.?\d*|\.\d+))", re.I)
+XY_FEED_MOVE = re.compile(r"^\s*G0*1\s*X\s*[-+]?[\d.]+\s*Y\s*[-+]?[\d.]+\s*$", re.I)
+MAX_ARC_SWEEP = 1.5 * math.pi  # near-full circles make the centre ill-conditioned
+MAX_ARC_RADIUS = 1000.0  # mm; flatter stretches are handled as lines
+# GRBL's limits on |end radius - start radius|
+ARC_RADIUS_MISMATCH = 0.005  # mm, always accepted
+ARC_RADIUS_MISMATCH_MAX = 0.5  # mm, never accepted beyond this
+ARC_RADIUS_MISMATCH_RATIO = 0.001  # of the start radius, accepted in between
+
+
+def _point_segment_distance(points, a, b):
+    ab = b - a
+    denom = float(ab @ ab)
+    if denom == 0.0:
+        return np.linalg.norm(points - a, axis=1)
+    t = np.clip(((points - a) @ ab) / denom, 0.0, 1.0)
+    return np.linalg.norm(points - (a + t[:, None] * ab), axis=1)
+
+
+def distance_to_polyline(points, polyline, chunk=4096):
+    """Distance of every point to the nearest segment of `polyline`."""
+    a, ab = polyline[:-1], np.diff(polyline, axis=0)
+    denom = np.maximum((ab ** 2).sum(axis=1), 1e-18)
+    result = np.empty(len(points))
+    for first in range(0, len(points), chunk):
+        block = points[first:first + chunk, None, :] - a[None]
+        t = np.clip((block * ab).sum(axis=2) / denom, 0.0, 1.0)
+        result[first:first + chunk] = np.sqrt(((block - t[..., None] * ab) ** 2).sum(axis=2)).min(axis=1)
+    return result
+
+
+def fits_line(points, tolerance):
+    """True when all intermediate vertices lie within `tolerance` of the first-to-last segment."""
+    if len(points) <= 2:
+        return True
+    return bool(_point_segment_distance(points[1:-1], points[0], points[-1]).max() <= tolerance)
+
+
+def circle_through(p1, p2, p3):
+    """Centre of the circle through three points, or None when they are collinear."""
+    ax, ay = p1
+    bx, by = p2
+    cx, cy = p3
+    d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(d) < 1e-12:
+        return None
+    a2, b2, c2 = ax * ax + ay * ay, bx * bx + by * by, cx * cx + cy * cy
+    return np.array([(a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d,
+                     (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d])
+
+
+def radius_mismatch_ok(start, end, centre):
+    """True when GRBL accepts an arc from `start` to `end` around `centre`."""
+    radius = float(np.linalg.norm(start - centre))
+    mismatch = abs(float(np.linalg.norm(end - centre)) - radius)
+    return mismatch <= max(ARC_RADIUS_MISMATCH, min(ARC_RADIUS_MISMATCH_MAX, ARC_RADIUS_MISMATCH_RATIO * radius))
+
+
+def fit_arc(points, tolerance, digits=None):
+    """(centre, clockwise) of an arc from points[0] to points[-1] that follows every
+    vertex and chord within `tolerance`, or None.
+
+    With `digits`, the centre offset is rounded as it will be written before any check.
+    """
+    if len(points) < 4:
+        return None
+    centre = circle_through(points[0], points[len(points) // 2], points[-1])
+    if centre is None:
+        return None
+    if digits is not None:
+        centre = points[0] + np.round(centre - points[0], digits)
+    if not radius_mismatch_ok(points[0], points[-1], centre):
+        return None
+    radii = np.linalg.norm(points - centre, axis=1)
+    radius = radii[0]
+    if radius > MAX_ARC_RADIUS or np.abs(radii - radius).max() > tolerance:
+        return None
+    # Chord midpoints bound how far the original straight chords sag inside the arc
+    midpoints = (points[1:] + points[:-1]) / 2
+    if (radius - np.linalg.norm(midpoints - centre, axis=1)).max() > tolerance:
+        return None
+
+    # The vertices must advance monotonically around the centre
+    angles = np.unwrap(np.arctan2(points[:, 1] - centre[1], points[:, 0] - centre[0]))
+    steps = np.diff(angles)
+    if not (np.all(steps > 0) or np.all(steps < 0)):
+        return None
+    if abs(angles[-1] - angles[0]) > MAX_ARC_SWEEP:
+        return None
+    return centre, bool(steps[0] < 0)
+
+
+def sample_arc(start, end, centre, clockwise, step):
+    radius = float(np.linalg.norm(start - centre))
+    a0 = math.atan2(start[1] - centre[1], start[0] - centre[0])
+    a1 = math.atan2(end[1] - centre[1], end[0] - centre[0])
+    if clockwise and a1 >= a0:
+        a1 -= 2 * math.pi
+    elif not clockwise and a1 <= a0:
+        a1 += 2 * math.pi
+    count = max(int(abs(a1 - a0) * radius / step), 2)
+    angles = np.linspace(a0, a1, count + 1)
+    return centre + radius * np.column_stack([np.cos(angles), np.sin(angles)])
+
+
+def sample_line(start, end, step):
+    count = max(int(np.linalg.norm(end - start) / step), 1)
+    return start + np.linspace(0.0, 1.0, count + 1)[:, None] * (end - start)
+
+
+def path_deviation(samples, polyline):
+    """Two-way (Hausdorff) distance between sampled points of a new element and a polyline."""
+    # Chords over every 4th sample still follow an arc to well under a micron
+    coarse = np.vstack([samples[:-1:4], samples[-1:]])
+    return float(max(distance_to_polyline(samples, polyline).max(),
+                     distance_to_polyline(polyline, coarse).max()))
+
+
+def simplify_run(points, tolerance, digits=4):
+    """Replacement lines for the XY feed moves from points[0] through points[1:].
+
+    Returns (lines, element count by kind, max verified deviation).
+    """
+    lines, counts, worst = [], {"lines": 0, "arcs": 0, "kept": 0}, 0.0
+    fmt = f"{{:.{digits}f}}"
+    # Work on the coordinates as they will be written
+    points = np.round(points, digits)
+    i = 0
+    n = len(points)
+    while i < n - 1:
+        line_end, arc_end, arc = i + 1, None, None
+        j = i + 2
+        while j < n:
+            window = points[i:j + 1]
+            line_ok = fits_line(window, tolerance)
+            candidate = fit_arc(window, tolerance, digits)
+            if line_ok:
+                line_end = j
+            if candidate is not None:
+                arc_end, arc = j, candidate
+            if not line_ok and candidate is None and j - max(line_end, arc_end or 0) > 2:
+                break
+            j += 1
+
+        if arc_end is not None and arc_end > line_end:
+            end, (centre, clockwise) = arc_end, arc
+            start_point, end_point = points[i], points[end]
+            samples = sample_arc(start_point, end_point, centre, clockwise, tolerance / 2)
+            deviation = path_deviation(samples, points[i:end + 1])
+            if deviation <= tolerance:
+                offset = centre - start_point
+                lines.append(f"{'G02' if clockwise else 'G03'} X{fmt.format(end_point[0])} "
+                             f"Y{fmt.format(end_point[1])} I{fmt.format(offset[0])} J{fmt.format(offset[1])}")
+                counts["arcs"] += 1
+                worst = max(worst, deviation)
+                i = end
+                continue
+            line_end = max(line_end, i + 1)
+
+        end = line_end
+        samples = sample_line(points[i], points[end], tolerance / 2)
+        deviation = path_deviation(samples, points[i:end + 1]) if end > i + 1 else 0.0
+        if deviation <= tolerance:
+            lines.append(f"G01 X{fmt.format(points[end][0])} Y{fmt.format(points[end][1])}")
+            counts["lines"] += 1
+            worst = max(worst, deviation)
+        else:
+            for k in range(i + 1, end + 1):
+                lines.append(f"G01 X{fmt.format(points[k][0])} Y{fmt.format(points[k][1])}")
+                counts["kept"] += 1
+        i = end
+    return lines, counts, worst
+
+
+def simplify_program(text, tolerance=0.01, digits=4):
+    """(simplified text, report) for a G-code program in absolute XY coordinates."""
+    start_time = time.perf_counter()
+    newline = "\r\n" if "\r\n" in text else "\n"  # FlatCAM writes CRLF
+    source = text.splitlines()
+    output = []
+    totals = {"lines": 0, "arcs": 0, "kept": 0}
+    worst = 0.0
+    position = [None, None]
+    run = []
+    absolute = True
+
+    def flush():
+        nonlocal worst
+        if len(run) > 1:
+            new_lines, counts, deviation = simplify_run(np.array(run), tolerance, digits)
+            output.extend(new_lines)
+            for key, value in counts.items():
+                totals[key] += value
+            worst = max(worst, deviation)
+        run.clear()
+
+    for raw in source:
+        code = re.sub(r"\(.*?\)|;.*$", "", raw).upper()
+        if re.search(r"G0*91(?!\d)", code):
+            absolute = False
+        elif re.search(r"G0*90(?!\d)", code):
+            absolute = True
+        axes = {letter.upper(): float(value) for letter, value in AXIS_WORD.findall(code)}
+
+        if absolute and XY_FEED_MOVE.match(code) and None not in position:
+            if not run:
+                run.append(tuple(position))
+            run.append((axes["X"], axes["Y"]))
+            position = [axes["X"], axes["Y"]]
+            continue
+
+        flush()
+        output.append(raw)
+        if absolute:
+            position = [axes.get("X", position[0]), axes.get("Y", position[1])]
+        elif "X" in axes or "Y" in axes:
+            position = [None, None]  # relative moves are passed through untouched
+    flush()
+
+    simplified = newline.join(output) + (newline if text.endswith("\n") else "")
+    return simplified, {
+        "lines_before": len(source),
+        "lines_after": len(output),
+        "bytes_before": len(text.encode()),
+        "bytes_after": len(simplified.encode()),
+        "arcs": totals["arcs"],
+        "merged_lines": totals["lines"],
+        "kept_lines": totals["kept"],
+        "max_deviation_mm": round(worst, 5),
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge collinear G01 runs and fit G02/G03 arcs.")
+    parser.add_argument("gcode")
+    parser.add_argument("-o", "--output", help="default: <name>_simplified.nc next to the input")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="chord tolerance in mm")
+    parser.add_argument("--digits", type=int, default=4, help="decimals written for coordinates")
+    args = parser.parse_args()
+
+    with open(args.gcode, encoding="utf-8", errors="replace", newline="") as f:
+        text = f.read()
+    simplified, report = simplify_program(text, args.tolerance, args.digits)
+    output = args.output or os.path.splitext(args.gcode)[0] + "_simplified.nc"
+    with open(output, "w", encoding="utf-8", newline="") as f:
+        f.write(simplified)
+
+    print(f"Lines: {report['lines_before']} -> {report['lines_after']} "
+          f"({100 * (1 - report['lines_after'] / max(report['lines_before'], 1)):.1f}% fewer)")
+    print(f"Bytes: {report['bytes_before']} -> {report['bytes_after']} "
+          f"({100 * (1 - report['bytes_after'] / max(report['bytes_before'], 1)):.1f}% smaller)")
+    print(f"{report['arcs']} arcs, {report['merged_lines']} lines, {report['kept_lines']} original lines kept; "
+          f"max verified deviation {report['max_deviation_mm']} mm (tolerance {args.tolerance} mm), "
+          f"{report['seconds']:.2f}s")
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# grbl_streamer.py
+# Character-counting G-code streamer for GRBL controllers.
+#
+# Send-and-wait streaming leaves GRBL's planner empty between the short G01 segments
+# of the FlatCAM isolation jobs. Here the host tracks how many bytes are sitting in
+# GRBL's serial RX buffer (128 bytes on an Uno): every sent line is counted until its
+# "ok"/"error" comes back, and new lines are sent whenever they fit, so the buffer
+# and the planner behind it stay full.
+#
+# M0/M1/M6 are handled on the host: GRBL does not support M6 and FlatCAM emits
+# "M6, (MSG ...), M0" for every tool change. At a pause the streamer waits until all
+# sent lines are acknowledged and the machine is Idle (Check in $C check mode),
+# shows the tool-change message and continues after the operator confirms. A
+# directly following M0 is folded into the same pause.
+#
+# Slow moves legitimately keep the buffer full for a long time, so the streamer only
+# gives up after `timeout` seconds without progress (no ok/error and no position
+# change in the status reports). It then sends feed hold and a soft reset, which
+# also stops the spindle, before raising.
+#
+# Usage:  python grbl_streamer.py "Complex Design/[4x4]Gerber_TopLayer.GTL_iso_combined_cnc.nc"
+#         python grbl_streamer.py job.nc --port /dev/ttyACM0 --mode simple   (send-and-wait baseline)
+import argparse
+import re
+import threading
+import time
+from collections import deque
+
+import serial
+
+RX_BUFFER_SIZE = 128
+FEED_HOLD = b"!"
+SOFT_RESET = b"\x18"
+# States in which the operator has paused the machine; waiting there is not a stall
+OPERATOR_STATES = ("Hold", "Door")
+# Done once every line is acknowledged: Check is GRBL's check mode ($C), where
+# nothing moves and the position stays frozen
+FINISHED_STATES = ("Idle", "Check")
+# States that never finish the program on their own
+STOPPED_STATES = ("Alarm", "Door", "Sleep", "Jog")
+PAUSE_COMMAND = re.compile(r"^M0*[016](?!\d)")
+COMMENT = re.compile(r"\(([^)]*)\)|;.*$")
+
+
+def clean_line(raw):
+    """GRBL-ready command text: comments and whitespace removed, upper case."""
+    return re.sub(r"\s+", "", COMMENT.sub("", raw)).upper()
+
+
+def load_program(path):
+    """[(source line number, command, message)] for every non-empty command.
+
+    `command` is None for host-side pauses (M0/M1/M6); `message` holds the FlatCAM
+    "(MSG, ...)" text that belongs to the pause.
+    """
+    program = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for number, raw in enumerate(f, 1):
+            for comment in re.findall(r"\(([^)]*)\)", raw):
+                if comment.upper().startswith("MSG") and program and program[-1][1] is None:
+                    program[-1] = (program[-1][0], None, comment.split(",", 1)[-1].strip())
+            command = clean_line(raw)
+            if not command:
+                continue
+            if PAUSE_COMMAND.match(command):
+                if program and program[-1][1] is None:
+                    continue  # M6 followed by M0: one pause
+                program.append((number, None, f"Program pause ({command})"))
+                continue
+            program.append((number, command, None))
+    return program
+
+
+class GrblStreamer:
+    def __init__(self, port, baud=115200, rx_buffer_size=RX_BUFFER_SIZE, status_interval=0.2,
+                 prompt=input, timeout=30.0):
+        self.port = port
+        self.baud = baud
+        self.rx_buffer_size = rx_buffer_size
+        self.status_interval = status_interval
+        self.prompt = prompt
+        self.timeout = timeout
+        self._serial = None
+        self._pending = deque()  # (line number, bytes in the RX buffer) awaiting ok/error
+        self._buffered = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self.state = None
+        self.planner_free = None
+        self.planner_max_free = 0
+        self.errors = []
+        self.alarm = None
+        self.position = None
+        self.starvation_events = 0
+        self._starved = False
+        self._streaming = False
+        self._armed = False  # starvation only counts once the RX buffer has been full
+        self._last_progress = time.monotonic()
+
+    def open(self, wake=True):
+        self._serial = serial.serial_for_url(self.port, self.baud, timeout=0.1)
+        if wake:
+            # Wake GRBL up and discard the startup banner
+            self._serial.write(b"\r\n\r\n")
+            time.sleep(2)
+            self._serial.reset_input_buffer()
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._read_loop, name="grbl-reader", daemon=True),
+                         threading.Thread(target=self._status_loop, name="grbl-status", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(1.0)
+        if self._serial is not None:
+            self._serial.close()
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            try:
+                line = self._serial.readline().decode(errors="replace").strip()
+            except (serial.SerialException, OSError) as e:
+                with self._cond:
+                    self.alarm = f"serial port failed: {e}"
+                    self._cond.notify_all()
+                return
+            if not line:
+                continue
+            if line == "ok" or line.startswith("error"):
+                with self._cond:
+                    if self._pending:
+                        number, length = self._pending.popleft()
+                        self._buffered -= length
+                        if line != "ok":
+                            self.errors.append((number, line))
+                    self._last_progress = time.monotonic()
+                    self._cond.notify_all()
+            elif line.startswith("<"):
+                self._on_status(line)
+            elif line.startswith("ALARM"):
+                with self._cond:
+                    self.alarm = line
+                    self._cond.notify_all()
+
+    def _on_status(self, report):
+        # GRBL 1.1: <Run|MPos:...|Bf:15,128|FS:...>; Bf needs $10 with the buffer bit set
+        fields = report.strip("<>").split("|")
+        position = None
+        for field in fields[1:]:
+            if field.startswith("Bf:"):
+                self.planner_free = int(field[3:].split(",")[0])
+                self.planner_max_free = max(self.planner_max_free, self.planner_free)
+            elif field.startswith(("MPos:", "WPos:")):
+                position = field[5:]
+        with self._cond:
+            self.state = fields[0].split(":")[0]
+            # Moving, or paused by the operator, is progress; Run with a frozen position is not
+            if (position is not None and position != self.position) or self.state in OPERATOR_STATES:
+                self._last_progress = time.monotonic()
+            if position is not None:
+                self.position = position
+            self._cond.notify_all()
+
+        # Starving: the host still has lines but the planner ran (nearly) empty
+        if self._streaming and self._armed:
+            empty = self.state == "Idle" or (
+                self.planner_free is not None and self.planner_free >= self.planner_max_free - 1
+                and self.planner_max_free > 1)
+            if empty and not self._starved:
+                self.starvation_events += 1
+            self._starved = empty
+        else:
+            self._starved = False
+
+    def _status_loop(self):
+        # "?" is a real-time command: it bypasses the RX buffer and needs no accounting
+        while not self._stop.wait(self.status_interval):
+            try:
+                self._serial.write(b"?")
+            except (serial.SerialException, OSError):
+                return
+
+    def _abort(self):
+        """Feed hold, then soft reset: stops motion and the spindle."""
+        try:
+            self._serial.write(FEED_HOLD)
+            self._serial.flush()
+            time.sleep(0.2)
+            self._serial.write(SOFT_RESET)
+            self._serial.flush()
+        except (serial.SerialException, OSError):
+            pass
+
+    def _wait_for_progress(self, number):
+        # Called with self._cond held; raises after `timeout` seconds without any progress
+        remaining = self._last_progress + self.timeout - time.monotonic()
+        if remaining <= 0:
+            self._abort()
+            raise TimeoutError(f"GRBL made no progress for {self.timeout:.0f}s at line {number} "
+                               f"(state {self.state}); sent feed hold and soft reset")
+        self._cond.wait(min(remaining, 0.5))
+
+    def _send(self, number, command, counting):
+        data = (command + "\n").encode()
+        limit = self.rx_buffer_size - 1 if counting else 0
+        with self._cond:
+            # Character counting: send as soon as the line fits; simple mode: wait for an empty buffer
+            if self._pending and self._buffered + len(data) > limit:
+                self._armed = True
+                self._last_progress = time.monotonic()  # silence is measured from the start of a wait
+            while self._pending and self._buffered + len(data) > limit and self.alarm is None \
+                    and self.state != "Sleep":
+                self._wait_for_progress(number)
+            if self.alarm is not None or self.state == "Sleep":
+                raise RuntimeError(f"GRBL stopped at line {number}: {self.alarm or self.state}")
+            self._pending.append((number, len(data)))
+            self._buffered += len(data)
+        self._serial.write(data)
+
+    def _sync(self, number=None):
+        """Wait until every sent line is acknowledged and the machine has stopped.
+
+        Returns the final state: "Idle", "Check" in check mode, or "Hold" when the
+        machine sits in a feed hold. Alarm, Door, Sleep and Jog raise RuntimeError;
+        no progress for `timeout` seconds raises TimeoutError.
+        """
+        with self._cond:
+            self._last_progress = time.monotonic()
+            while self._pending and self.alarm is None and self.state != "Sleep":
+                self._wait_for_progress(number)
+        # Let a fresh status report arrive before trusting the machine state
+        time.sleep(2 * self.status_interval)
+        with self._cond:
+            while True:
+                if self.alarm is not None or self.state in STOPPED_STATES:
+                    raise RuntimeError(f"GRBL stopped at line {number}: {self.alarm or self.state}")
+                if self.state in FINISHED_STATES or self.state in ("Hold", None):
+                    return self.state or "Idle"
+                self._wait_for_progress(number)
+
+    def _wait_until_idle(self, number):
+        # A feed hold is the operator's call: report it and resume only on their confirmation
+        while self._sync(number) == "Hold":
+            self.prompt(f"[line {number}] Machine is in feed hold - press Enter to resume (cycle start) ")
+            with self._cond:
+                self._last_progress = time.monotonic()
+            self._serial.write(b"~")
+
+    def stream(self, program, mode="counting", progress_every=5.0):
+        """Stream `program` from load_program(); returns a statistics dict."""
+        counting = mode == "counting"
+        self._armed = False
+        sent = 0
+        paused_s = 0.0
+        start = last_report = time.perf_counter()
+        try:
+            for number, command, message in program:
+                if command is None:
+                    self._streaming = False
+                    self._wait_until_idle(number)
+                    pause_start = time.perf_counter()
+                    self.prompt(f"[line {number}] {message} - press Enter to continue ")
+                    paused_s += time.perf_counter() - pause_start
+                    self._armed = False  # the buffer refills from empty after a pause
+                    continue
+                self._send(number, command, counting)
+                self._streaming = True  # starvation only counts once motion has been queued
+                sent += 1
+                now = time.perf_counter()
+                if now - last_report >= progress_every:
+                    rate = sent / max(now - start - paused_s, 1e-9)
+                    print(f"{sent}/{len(program)} lines, {rate:.1f} lines/s, "
+                          f"{self.starvation_events} starvation events")
+                    last_report = now
+            self._streaming = False
+            self._wait_until_idle(program[-1][0] if program else None)
+        finally:
+            self._streaming = False
+
+        elapsed = time.perf_counter() - start - paused_s
+        return {
+            "mode": mode,
+            "lines": sent,
+            "seconds": elapsed,
+            "lines_per_second": sent / elapsed if elapsed > 0 else 0.0,
+            "starvation_events": self.starvation_events,
+            "errors": self.errors,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a G-code file to GRBL using character counting.")
+    parser.add_argument("gcode")
+    parser.add_argument("--port", default="/dev/ttyACM0", help="CNC Arduino port (or a pyserial URL)")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--mode", choices=["counting", "simple"], default="counting",
+                        help="simple = send-and-wait, for comparison")
+    parser.add_argument("--rx-buffer", type=int, default=RX_BUFFER_SIZE, help="GRBL serial RX buffer size")
+    parser.add_argument("--yes", action="store_true", help="continue at pauses without asking (dry runs)")
+    args = parser.parse_args()
+
+    program = load_program(args.gcode)
+    pauses = sum(command is None for _, command, _ in program)
+    print(f"{len(program) - pauses} commands, {pauses} pauses in {args.gcode}")
+
+    prompt = (lambda text: print(text)) if args.yes else input
+    streamer = GrblStreamer(args.port, args.baud, args.rx_buffer, prompt=prompt)
+    streamer.open()
+    try:
+        stats = streamer.stream(program, args.mode)
+    finally:
+        streamer.close()
+
+    print(f"{stats['lines']} lines in {stats['seconds']:.1f}s ({stats['lines_per_second']:.1f} lines/s, "
+          f"{args.mode} mode), {stats['starvation_events']} planner starvation events")
+    for number, error in stats["errors"]:
+        print(f"  line {number}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# hybrid_inspect.py
+# Hybrid inspection: template subtraction proposes regions, YOLO classifies only those.
+#
+# Subtraction against the aligned template is cheap and finds *where* something
+# differs; the YOLO model is expensive but says *what* it is. Here the difference-map
+# blobs are padded into crop windows of the aligned colour capture, the windows are
+# sent to the model in one batch and every blob gets the class of the best detection
+# covering it. A board without blobs never reaches the model.
+import time
+
+import cv2
+import numpy as np
+
+from detection_utils import box_iou, nms, result_arrays
+
+UNCLASSIFIED = -1
+
+
+def propose_regions(defects, scale=(1.0, 1.0), image_shape=None, padding=16, min_size=64):
+    """Padded crop windows (x0, y0, x1, y1) around defect blobs, overlapping windows merged.
+
+    `defects` are find_defects records in difference-map pixels; `scale` maps them onto
+    the image the crops are taken from, whose (height, width) is `image_shape`.
+    """
+    sx, sy = scale
+    height, width = image_shape[:2]
+    windows = []
+    for d in defects:
+        cx = (d["x"] + d["width"] / 2) * sx
+        cy = (d["y"] + d["height"] / 2) * sy
+        half_w = max(d["width"] * sx / 2 + padding, min_size / 2)
+        half_h = max(d["height"] * sy / 2 + padding, min_size / 2)
+        windows.append([cx - half_w, cy - half_h, cx + half_w, cy + half_h])
+    if not windows:
+        return []
+
+    # Nearby blobs share one crop: overlapping windows form one connected region
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for x0, y0, x1, y1 in np.round(windows).astype(int):
+        cv2.rectangle(mask, (max(x0, 0), max(y0, 0)), (min(x1, width) - 1, min(y1, height) - 1), 1, -1)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    return [(int(x), int(y), int(x + w), int(y + h)) for x, y, w, h, _ in stats[1:].tolist()
+            if w >= 2 and h >= 2]
+
+
+def classify_regions(model, image_bgr, windows, conf=0.25, imgsz=320, iou_threshold=0.5):
+    """Run `model` on all crop windows in one batch.
+
+    Returns (xyxy, confidences, classes) in image pixels, merged with class-aware NMS.
+    """
+    if not windows:
+        return np.empty((0, 4)), np.empty(0), np.empty(0, dtype=int)
+    crops = [image_bgr[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+    results = model.predict(source=crops, save=False, conf=conf, imgsz=imgsz, verbose=False)
+
+    xyxy, confs, classes = [], [], []
+    for (x0, y0, _, _), result in zip(windows, results):
+        boxes, crop_confs, crop_classes = result_arrays(result)
+        xyxy.append(boxes + [x0, y0, x0, y0])
+        confs.append(crop_confs)
+        classes.append(crop_classes)
+    xyxy, confs, classes = np.concatenate(xyxy), np.concatenate(confs), np.concatenate(classes)
+    keep = nms(xyxy, confs, classes, iou_threshold)
+    return xyxy[keep], confs[keep], classes[keep]
+
+
+def assign_classes(defects, scale, xyxy, confidences, classes):
+    """Class id and confidence for each blob: the most confident detection overlapping it."""
+    sx, sy = scale
+    assigned = []
+    for d in defects:
+        blob = np.array([d["x"] * sx, d["y"] * sy, (d["x"] + d["width"]) * sx, (d["y"] + d["height"]) * sy])
+        overlapping = np.flatnonzero(box_iou(blob, xyxy) > 0) if len(xyxy) else []
+        if len(overlapping):
+            best = overlapping[np.argmax(confidences[overlapping])]
+            assigned.append((int(classes[best]), float(confidences[best])))
+        else:
+            assigned.append((UNCLASSIFIED, 0.0))
+    return assigned
+
+
+def hybrid_inspect(model, image_bgr, final_img, defects, conf=0.25, padding=16, min_size=64, imgsz=320):
+    """Classify the subtraction blobs `defects` found in `final_img` using crops of `image_bgr`.
+
+    `image_bgr` is the capture aligned onto the template (any resolution); `final_img`
+    is the difference map the blobs come from. Inference is skipped when there are no
+    blobs. Returns a dict with the classified blobs, crop windows, raw detections and
+    timings.
+    """
+    scale = (image_bgr.shape[1] / final_img.shape[1], image_bgr.shape[0] / final_img.shape[0])
+    start = time.perf_counter()
+    windows = propose_regions(defects, scale, image_bgr.shape, padding, min_size)
+    if windows:
+        xyxy, confidences, classes = classify_regions(model, image_bgr, windows, conf, imgsz)
+    else:
+        xyxy, confidences, classes = np.empty((0, 4)), np.empty(0), np.empty(0, dtype=int)
+    inference_ms = (time.perf_counter() - start) * 1000
+
+    blobs = []
+    for d, (class_id, confidence) in zip(defects, assign_classes(defects, scale, xyxy, confidences, classes)):
+        blobs.append({**d, "class_id": class_id, "confidence": round(confidence, 4)})
+    return {
+        "blobs": blobs,
+        "windows": windows,
+        "detections": (xyxy, confidences, classes),
+        "skipped": not windows,
+        "inference_ms": inference_ms,
+    }
@@ -0,0 +1,134 @@
+# inference_backends.py
+# CPU inference backends for the YOLO defect model.
+#
+# best.pt is exported once to ONNX or OpenVINO and the artifact is cached next to it
+# in train_results/weights (re-exported only when best.pt is newer). Every backend is
+# loaded through ultralytics.YOLO, so predict() returns the same Results objects and
+# the post-processing in yolo-app.py does not change.
+#
+# Latency comparison:  python inference_backends.py --backends pytorch onnx openvino
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+# backend name -> ultralytics export format (None = use best.pt directly)
+BACKENDS = {
+    "pytorch": None,
+    "onnx": "onnx",
+    "openvino": "openvino",
+}
+
+DEFAULT_BACKEND = "pytorch"
+BACKEND_ENV_VAR = "INSPECTMILL_BACKEND"
+
+
+def configured_backend():
+    """Backend chosen at startup through the INSPECTMILL_BACKEND environment variable."""
+    backend = os.environ.get(BACKEND_ENV_VAR, DEFAULT_BACKEND).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"{BACKEND_ENV_VAR}={backend!r} is not one of {sorted(BACKENDS)}")
+    return backend
+
+
+def exported_path(weights_path, backend):
+    stem, _ = os.path.splitext(weights_path)
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    return weights_path
+
+
+def ensure_exported(weights_path, backend, imgsz=640):
+    """Path of the model artifact for `backend`, exporting best.pt first if needed."""
+    if BACKENDS[backend] is None:
+        return weights_path
+
+    target = exported_path(weights_path, backend)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(weights_path):
+        return target
+
+    from ultralytics import YOLO
+
+    # dynamic=True keeps batched inputs (tiles, folder batches) working after export
+    exported = YOLO(weights_path).export(format=BACKENDS[backend], imgsz=imgsz, dynamic=True)
+    return str(exported)
+
+
+def load_backend(weights_path, backend, imgsz=640):
+    from ultralytics import YOLO
+
+    return YOLO(ensure_exported(weights_path, backend, imgsz), task="detect")
+
+
+def check_class_mapping(model, class_names):
+    """Make sure the exported model still uses the class ids of CLASS_NAMES."""
+    model_ids = sorted(int(k) for k in model.names)
+    if model_ids != sorted(class_names):
+        raise ValueError(f"Model class ids {model_ids} do not match CLASS_NAMES {sorted(class_names)}")
+
+
+def measure_latency(model, images, conf=0.25, warmup=1):
+    """Per-image wall-clock latency (ms) of model.predict on each image."""
+    for image in images[:warmup]:
+        model.predict(source=image, save=False, conf=conf, verbose=False)
+    latencies, detections = [], []
+    for image in images:
+        start = time.perf_counter()
+        results = model.predict(source=image, save=False, conf=conf, verbose=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+        detections.append(len(results[0].boxes))
+    return np.array(latencies), np.array(detections)
+
+
+def compare_backends(weights_path, backends, images, conf=0.25):
+    rows = []
+    for backend in backends:
+        start = time.perf_counter()
+        model = load_backend(weights_path, backend)
+        load_s = time.perf_counter() - start
+        latencies, detections = measure_latency(model, images, conf)
+        rows.append({
+            "backend": backend,
+            "load_s": round(load_s, 2),
+            "images": len(images),
+            "mean_ms": round(float(latencies.mean()), 2),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "detections": int(detections.sum()),
+        })
+    return rows
+
+
+def load_images(image_dir, limit=None):
+    import cv2
+
+    paths = sorted(glob.glob(os.path.join(image_dir, "*.jpg")) + glob.glob(os.path.join(image_dir, "*.png")))
+    images = [cv2.imread(path) for path in paths[:limit]]
+    return [image for image in images if image is not None]
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compare YOLO inference backends on CPU.")
+    parser.add_argument("--weights", default=os.path.join(script_dir, "train_results", "weights", "best.pt"))
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--images", default=os.path.join(script_dir, "test images"))
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit)
+    if not images:
+        parser.error(f"no images found in {args.images}")
+    rows = compare_backends(args.weights, args.backends, images)
+    print(f"{'backend':<10} {'load s':>7} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'boxes':>6}")
+    for row in rows:
+        print(f"{row['backend']:<10} {row['load_s']:>7.2f} {row['mean_ms']:>8.2f} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['detections']:>6}")
+
+
+if __name__ == "__main__":
+    main()
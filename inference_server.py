@@ -0,0 +1,469 @@
+# inference_server.py
+# Shared local YOLO inference service with dynamic micro-batching.
+#
+# One worker process loads the model once. Clients (the Streamlit apps, batch tools)
+# connect over a local multiprocessing.connection socket and send images; a batcher
+# thread collects the images of concurrent requests into micro-batches of up to
+# --max-batch images, waiting at most --max-wait-ms for more to arrive. RemoteModel
+# mimics the part of the ultralytics model API the apps use (predict() results with
+# boxes.data and speed, plus names), so existing code runs unchanged as a thin client.
+#
+# Serve:      python inference_server.py serve --max-batch 8 --max-wait-ms 10
+# Load test:  python inference_server.py bench --concurrency 1 2 4 8 --requests 40
+# Clients pick the server up from INSPECTMILL_INFERENCE_SERVER=host:port.
+#
+# Requests are pickled, so the connection authkey is what keeps other local users
+# and the network out. It comes from INSPECTMILL_INFERENCE_KEY; without it the server
+# generates a random key and writes it to a 0600 key file that clients on the same
+# host read, and it refuses to listen on anything but loopback.
+import argparse
+import ipaddress
+import os
+import queue
+import secrets
+import socket
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+SERVER_ENV_VAR = "INSPECTMILL_INFERENCE_SERVER"
+AUTHKEY_ENV_VAR = "INSPECTMILL_INFERENCE_KEY"
+KEY_FILE_ENV_VAR = "INSPECTMILL_INFERENCE_KEY_FILE"
+DEFAULT_KEY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "inference.key")
+DEFAULT_ADDRESS = ("127.0.0.1", 8765)
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or DEFAULT_ADDRESS[0], int(port)
+
+
+def configured_server():
+    """(host, port) of the inference server from INSPECTMILL_INFERENCE_SERVER, or None."""
+    text = os.environ.get(SERVER_ENV_VAR, "").strip()
+    return parse_address(text) if text else None
+
+
+def key_file():
+    return os.environ.get(KEY_FILE_ENV_VAR) or DEFAULT_KEY_FILE
+
+
+def explicit_authkey():
+    """The key from INSPECTMILL_INFERENCE_KEY, or None when it is not set."""
+    key = os.environ.get(AUTHKEY_ENV_VAR, "").strip()
+    return key.encode() if key else None
+
+
+def authkey():
+    """Client side: the explicit key, else the key file written by a local server."""
+    key = explicit_authkey()
+    if key is not None:
+        return key
+    try:
+        with open(key_file(), "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise RuntimeError(f"No inference server key: set {AUTHKEY_ENV_VAR} or start the server "
+                           f"on this host so it writes {key_file()}") from None
+
+
+def server_authkey(address):
+    """Server side: the explicit key, or a fresh random key written to a 0600 key file.
+
+    Without an explicit key only loopback addresses are allowed.
+    """
+    key = explicit_authkey()
+    if key is not None:
+        return key
+    if not is_loopback(address[0]):
+        raise ValueError(f"Refusing to listen on {address[0]} without {AUTHKEY_ENV_VAR} set; "
+                         f"only loopback addresses may use a generated key")
+    key = secrets.token_hex(32).encode()
+    path = key_file()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    os.replace(tmp, path)
+    return key
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+class _Job:
+    def __init__(self, images, conf, imgsz):
+        self.images = images
+        self.conf = conf
+        self.imgsz = imgsz
+        self.submitted = time.perf_counter()
+        self.outputs = None
+        self.error = None
+        self.queue_ms = 0.0
+        self.batch_images = 0
+        self.version = None
+        self.done = threading.Event()
+
+
+class InferenceServer:
+    def __init__(self, model, address=DEFAULT_ADDRESS, max_batch=8, max_wait_ms=10.0, info=None,
+                 weights_path=None, loader=None):
+        self.model = model
+        # With weights_path and loader given, promoted weights are picked up between batches
+        self.weights_path = weights_path
+        self.loader = loader
+        self._weights_mtime = os.path.getmtime(weights_path) if weights_path else None
+        self.address = address
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.info = {"names": {int(k): v for k, v in model.names.items()}, **(info or {})}
+        self._jobs = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "images": 0, "batches": 0, "errors": 0}
+
+    def serve_forever(self):
+        key = server_authkey(self.address)
+        threading.Thread(target=self._batch_loop, name="batcher", daemon=True).start()
+        with Listener(self.address, backlog=64, authkey=key) as listener:
+            print(f"Inference server listening on {self.address[0]}:{self.address[1]} "
+                  f"(max batch {self.max_batch}, max wait {self.max_wait * 1000:.0f} ms)")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:  # a client failing the handshake must not stop the server
+                    print(f"Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        # One thread per client connection; requests on a connection are sequential
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                op = request.get("op")
+                if op == "info":
+                    reply = self.info
+                elif op == "stats":
+                    with self._stats_lock:
+                        reply = dict(self.stats)
+                elif op == "predict":
+                    job = _Job(request["images"], request.get("conf", 0.25), request.get("imgsz", 640))
+                    self._jobs.put(job)
+                    job.done.wait()
+                    reply = {
+                        "outputs": job.outputs,
+                        "error": job.error,
+                        "queue_ms": job.queue_ms,
+                        "batch_images": job.batch_images,
+                        # Lets clients notice a weights reload and refresh names/version
+                        "version": job.version,
+                    }
+                else:
+                    reply = {"error": f"unknown op {op!r}"}
+                try:
+                    conn.send(reply)
+                except OSError:  # includes BrokenPipeError from a client that timed out
+                    return
+
+    def _collect(self):
+        """Block for the first job, then gather more until the batch is full or the wait expires."""
+        jobs = [self._jobs.get()]
+        images = len(jobs[0].images)
+        deadline = time.perf_counter() + self.max_wait
+        while images < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                job = self._jobs.get(timeout=remaining)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            images += len(job.images)
+        return jobs
+
+    def _maybe_reload(self):
+        if self.loader is None:
+            return
+        try:
+            mtime = os.path.getmtime(self.weights_path)
+        except OSError:
+            return
+        if mtime != self._weights_mtime:
+            # Remembered even on failure, so a broken file is retried only once it changes again
+            self._weights_mtime = mtime
+            try:
+                model, info = self.loader()
+            except Exception as e:  # half-written export, incompatible weights, out of memory
+                print(f"Reload failed, keeping the current weights: {type(e).__name__}: {e}", flush=True)
+                return
+            self.model = model
+            self.info.update(info)
+            print(f"Reloaded weights ({self.info.get('version')})", flush=True)
+
+    def _batch_loop(self):
+        while True:
+            jobs = self._collect()
+            try:
+                self._maybe_reload()
+                started = time.perf_counter()
+                for job in jobs:
+                    job.queue_ms = (started - job.submitted) * 1000
+
+                # predict() takes one conf/imgsz, so jobs are batched per setting
+                groups = defaultdict(list)
+                for job in jobs:
+                    groups[(job.conf, job.imgsz)].append(job)
+                for (conf, imgsz), group in groups.items():
+                    self._run_group(group, conf, imgsz)
+
+                with self._stats_lock:
+                    self.stats["requests"] += len(jobs)
+                    self.stats["images"] += sum(len(job.images) for job in jobs)
+                    self.stats["errors"] += sum(job.error is not None for job in jobs)
+            except Exception as e:
+                # The batcher must outlive any one batch; waiting clients get the error
+                print(f"Batch failed: {type(e).__name__}: {e}", flush=True)
+                for job in jobs:
+                    if job.outputs is None and job.error is None:
+                        job.error = f"{type(e).__name__}: {e}"
+            finally:
+                for job in jobs:
+                    job.done.set()
+
+    def _run_group(self, group, conf, imgsz):
+        from detection_utils import result_arrays
+
+        version = self.info.get("version")
+        images = [image for job in group for image in job.images]
+        outputs = []
+        try:
+            for first in range(0, len(images), self.max_batch):
+                results = self.model.predict(source=images[first:first + self.max_batch], save=False,
+                                             conf=conf, imgsz=imgsz, verbose=False)
+                for result in results:
+                    xyxy, confidences, classes = result_arrays(result)
+                    data = np.column_stack([xyxy, confidences, classes]).astype(np.float32)
+                    outputs.append((data, dict(result.speed or {})))
+                with self._stats_lock:
+                    self.stats["batches"] += 1
+        except Exception as e:
+            for job in group:
+                job.error = f"{type(e).__name__}: {e}"
+            return
+
+        position = 0
+        for job in group:
+            job.outputs = outputs[position:position + len(job.images)]
+            job.batch_images = len(images)
+            job.version = version
+            position += len(job.images)
+
+
+class _HostTensor(np.ndarray):
+    # Lets result_arrays() call .cpu().numpy() on boxes.data as on a torch tensor
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return np.asarray(self)
+
+
+class RemoteBoxes:
+    def __init__(self, data):
+        self.data = data.view(_HostTensor)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class RemoteResult:
+    def __init__(self, data, speed):
+        self.boxes = RemoteBoxes(data.reshape(-1, 6))
+        self.speed = speed
+
+
+class RemoteModel:
+    """Thin client with the predict()/names surface of an ultralytics YOLO model.
+
+    Each thread gets its own connection, so concurrent Streamlit sessions in one
+    process reach the server as concurrent requests and can share a batch. A reply
+    that takes longer than `request_timeout` seconds raises TimeoutError.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=5.0, request_timeout=60.0):
+        self.address = address
+        self.timeout = timeout
+        self.request_timeout = request_timeout
+        self._local = threading.local()
+        self.info = self._request({"op": "info"})
+        self.names = self.info["names"]
+        self.last_queue_ms = 0.0
+        self.last_batch_images = 0
+
+    @property
+    def version(self):
+        return self.info.get("version")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    conn = Client(self.address, authkey=authkey())
+                    break
+                except ConnectionRefusedError:
+                    if time.monotonic() >= deadline:
+                        raise
+                    time.sleep(0.2)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _request(self, message):
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.send(message)
+                # A stuck server must not hang the caller; a late reply would desynchronise
+                # the connection, so it is dropped
+                if not conn.poll(self.request_timeout):
+                    raise TimeoutError(f"No reply from the inference server at {self.address[0]}:"
+                                       f"{self.address[1]} within {self.request_timeout:.0f}s")
+                return conn.recv()
+            except TimeoutError:
+                self._drop_connection()
+                raise
+            except (EOFError, OSError):
+                # Server restarted: drop the connection and retry once on a new one
+                self._drop_connection()
+                if attempt:
+                    raise
+
+    def predict(self, source, conf=0.25, imgsz=640, **kwargs):
+        images = list(source) if isinstance(source, (list, tuple)) else [source]
+        reply = self._request({"op": "predict", "images": images, "conf": conf, "imgsz": imgsz})
+        if reply.get("error"):
+            raise RuntimeError(f"Inference server error: {reply['error']}")
+        self.last_queue_ms = reply["queue_ms"]
+        self.last_batch_images = reply["batch_images"]
+        if reply.get("version") != self.info.get("version"):
+            # The server swapped its weights: pick up the new names and version
+            self.info = self._request({"op": "info"})
+            self.names = self.info["names"]
+        return [RemoteResult(data, speed) for data, speed in reply["outputs"]]
+
+    def stats(self):
+        return self._request({"op": "stats"})
+
+
+def run_load(address, images, concurrency, requests_per_client, conf=0.25):
+    """Drive the server from `concurrency` client threads; returns throughput and latency percentiles."""
+    latencies, batch_sizes = [], []
+    lock = threading.Lock()
+    clients = [RemoteModel(address) for _ in range(concurrency)]
+
+    timing = {}
+    # Connections are per thread: warm each one up, then start the timed phase together
+    barrier = threading.Barrier(concurrency, action=lambda: timing.setdefault("start", time.perf_counter()))
+
+    def worker(index):
+        client = clients[index]
+        client.predict(images[index % len(images)], conf=conf)
+        barrier.wait()
+        own = []
+        for i in range(requests_per_client):
+            image = images[(index + i) % len(images)]
+            start = time.perf_counter()
+            client.predict(image, conf=conf)
+            own.append(((time.perf_counter() - start) * 1000, client.last_batch_images))
+        with lock:
+            latencies.extend(latency for latency, _ in own)
+            batch_sizes.extend(size for _, size in own)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - timing["start"]
+
+    latencies = np.array(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "mean_batch": round(float(np.mean(batch_sizes)), 2),
+    }
+
+
+def main():
+    from inference_backends import configured_backend, load_backend, load_images
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Shared YOLO inference server with micro-batching.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="load the model and serve requests")
+    serve.add_argument("--weights", default=os.path.join(script_dir, "train_results", "weights", "best.pt"))
+    serve.add_argument("--address", default="127.0.0.1:8765")
+    serve.add_argument("--max-batch", type=int, default=8)
+    serve.add_argument("--max-wait-ms", type=float, default=10.0)
+
+    bench = sub.add_parser("bench", help="measure throughput and p99 latency as concurrency rises")
+    bench.add_argument("--address", default="127.0.0.1:8765")
+    bench.add_argument("--images", default=os.path.join(script_dir, "test images"))
+    bench.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    bench.add_argument("--requests", type=int, default=40, help="requests per client")
+    args = parser.parse_args()
+
+    address = parse_address(args.address)
+    if args.command == "serve":
+        if explicit_authkey() is None and not is_loopback(address[0]):
+            parser.error(f"set {AUTHKEY_ENV_VAR} to serve on a non-loopback address")
+        backend = configured_backend()
+
+        def loader():
+            stat = os.stat(args.weights)
+            version = f"{os.path.basename(args.weights)}:{int(stat.st_mtime)}:{stat.st_size}:{backend}"
+            return load_backend(args.weights, backend), {"backend": backend, "version": version}
+
+        model, info = loader()
+        InferenceServer(model, address, args.max_batch, args.max_wait_ms, info=info,
+                        weights_path=args.weights, loader=loader).serve_forever()
+        return
+
+    images = load_images(args.images, limit=20)
+    if not images:
+        parser.error(f"no images found in {args.images}")
+    print(f"{'clients':>7} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for concurrency in args.concurrency:
+        row = run_load(address, images, concurrency, args.requests)
+        print(f"{row['concurrency']:>7} {row['requests']:>8} {row['throughput_rps']:>8.1f} "
+              f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['mean_batch']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# inspection_pipeline.py
+# Template-subtraction inspection steps shared by app.py and the batch CLI:
+# preprocess capture -> ORB align onto the template -> subtract -> median blur -> blobs.
+import cv2
+import numpy as np
+
+from feature_matching import find_homography
+from template_features import preprocess_capture
+
+# Blob size limits in pixels (connected-component pixel counts). The earlier
+# findContours filter used polygon areas through the pixel centres, which are 0 for
+# 2-pixel specks and 1-pixel-wide lines and smaller than the pixel count for every
+# blob, and it also counted hole contours. Only single pixels are dropped now, so
+# thin blobs count and the upper cut sits at ~300 pixels: defect counts are not
+# comparable with defects_data.csv rows written by the contour filter.
+MIN_BLOB_PIXELS = 1
+MAX_BLOB_PIXELS = 300
+
+
+def align_capture(capture_rgb, template_features, backend="bruteforce", ratio=0.75, max_matches=200,
+                  orb=None):
+    """ORB-align a captured RGB image onto the processed template.
+
+    Returns (warped, h); warped is None when no homography could be estimated.
+    """
+    img1 = preprocess_capture(capture_rgb)
+    img2 = template_features["stages"]["thresholded"]
+    orb = orb or cv2.ORB_create()
+    kp1, des1 = orb.detectAndCompute(img1, None)
+    # Capture is the query side, so h maps capture coordinates onto the template
+    h, _, _ = find_homography(kp1, des1, template_features["keypoints"], template_features["descriptors"],
+                              backend, ratio, max_matches)
+    if h is None:
+        return None, None
+    return cv2.warpPerspective(img1, h, (img2.shape[1], img2.shape[0])), h
+
+
+def subtract_images(template_img, warped_img):
+    """Difference image and its median-blurred version used for defect extraction."""
+    sub_img = cv2.subtract(template_img, warped_img)
+    final_img = cv2.medianBlur(sub_img, 5)
+    return sub_img, final_img
+
+
+def find_defects(final_img, min_area=MIN_BLOB_PIXELS, max_area=MAX_BLOB_PIXELS, max_side=None,
+                 border_margin=0):
+    """Extract defect blobs from the difference image in one connected-components pass.
+
+    Every non-zero pixel is foreground. Components are kept when their pixel area
+    lies strictly between `min_area` and `max_area`, neither bounding-box side
+    exceeds `max_side` and the centroid is at least `border_margin` pixels from the
+    image border. Returns one record per defect with its bounding box, area and
+    centroid in image pixels.
+    """
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(
+        (final_img > 0).astype(np.uint8), connectivity=8
+    )
+    # Row 0 is the background component
+    stats, centroids = stats[1:], centroids[1:]
+
+    area = stats[:, cv2.CC_STAT_AREA]
+    keep = (area > min_area) & (area < max_area)
+    if max_side is not None:
+        keep &= np.maximum(stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]) <= max_side
+    if border_margin > 0:
+        height, width = final_img.shape[:2]
+        cx, cy = centroids[:, 0], centroids[:, 1]
+        keep &= (cx >= border_margin) & (cx < width - border_margin)
+        keep &= (cy >= border_margin) & (cy < height - border_margin)
+
+    stats, centroids = stats[keep], centroids[keep]
+    return [
+        {"x": int(x), "y": int(y), "width": int(w), "height": int(h), "area": int(a),
+         "centroid_x": round(float(cx), 2), "centroid_y": round(float(cy), 2)}
+        for (x, y, w, h, a), (cx, cy) in zip(stats.tolist(), centroids.tolist())
+    ]
+
+
+def inspect_capture(capture_rgb, template_features, backend="bruteforce", orb=None):
+    """Run the full pipeline on one capture and return a JSON-serialisable summary."""
+    warped, h = align_capture(capture_rgb, template_features, backend=backend, orb=orb)
+    if warped is None:
+        return {"aligned": False, "num_defects": None}
+    _, final_img = subtract_images(template_features["stages"]["thresholded"], warped)
+    defects = find_defects(final_img)
+    return {"aligned": True, "num_defects": len(defects), "defects": defects, "homography": h.tolist()}
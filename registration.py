@@ -0,0 +1,133 @@
+# registration.py
+# Coarse-to-fine pyramid registration of a captured board onto its template.
+#
+# The homography is first estimated with ORB on a small pyramid level, then
+# propagated to each finer level and refined there, either with another ORB pass on
+# the pre-warped capture or with cv2.findTransformECC. Refinement stops as soon as a
+# level moves the board corners by less than `tolerance` full-resolution pixels.
+import time
+
+import cv2
+import numpy as np
+
+from feature_matching import find_homography
+
+
+def build_pyramid(image, levels):
+    pyramid = [image]
+    for _ in range(levels - 1):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    return pyramid  # pyramid[0] is full resolution
+
+
+def auto_levels(shape, coarse_size=480, max_levels=5):
+    """Number of levels needed for the coarsest one to be at most `coarse_size` wide/high."""
+    levels = 1
+    largest = max(shape[:2])
+    while largest > coarse_size and levels < max_levels:
+        largest = (largest + 1) // 2
+        levels += 1
+    return levels
+
+
+def _scale_matrix(fine, coarse):
+    # Maps coarse-level pixel coordinates to fine-level ones
+    sy = fine.shape[0] / coarse.shape[0]
+    sx = fine.shape[1] / coarse.shape[1]
+    return np.diag([sx, sy, 1.0])
+
+
+def _corner_shift(h_a, h_b, shape):
+    height, width = shape[:2]
+    corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+    a = cv2.perspectiveTransform(corners, h_a)
+    b = cv2.perspectiveTransform(corners, h_b)
+    return float(np.linalg.norm(a - b, axis=2).max())
+
+
+def _orb_homography(capture, template, orb, backend):
+    kp_c, des_c = orb.detectAndCompute(capture, None)
+    kp_t, des_t = orb.detectAndCompute(template, None)
+    h, _, _ = find_homography(kp_c, des_c, kp_t, des_t, backend)
+    return h
+
+
+def _ecc_refine(capture, template, h, iterations, epsilon):
+    # ECC warps map template coordinates to input coordinates, i.e. the inverse of h
+    warp = np.linalg.inv(h).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iterations, epsilon)
+    _, warp = cv2.findTransformECC(template, capture, warp, cv2.MOTION_HOMOGRAPHY, criteria, None, 5)
+    return np.linalg.inv(warp.astype(np.float64))
+
+
+def pyramid_register(capture_gray, template_gray, levels=None, use_ecc=False, tolerance=1.0,
+                     backend="bruteforce", ecc_iterations=50, ecc_epsilon=1e-4):
+    """Estimate the homography that maps capture pixels onto template pixels.
+
+    Returns (h, report) where h is a full-resolution 3x3 matrix (None if the coarse
+    estimate failed) and report lists one dict per processed level with its size,
+    method, time in seconds and residual (corner shift in full-resolution pixels).
+    """
+    if levels is None:
+        levels = auto_levels(template_gray.shape)
+    capture_pyr = build_pyramid(capture_gray, levels)
+    template_pyr = build_pyramid(template_gray, levels)
+    orb = cv2.ORB_create(nfeatures=1000)
+    report = []
+
+    # Coarse estimate on the smallest level
+    start = time.perf_counter()
+    level = levels - 1
+    h = _orb_homography(capture_pyr[level], template_pyr[level], orb, backend)
+    report.append({
+        "level": level,
+        "size": f"{template_pyr[level].shape[1]}x{template_pyr[level].shape[0]}",
+        "method": "orb",
+        "time_s": time.perf_counter() - start,
+        "residual_px": None,
+    })
+    if h is None:
+        return None, report
+
+    for level in range(levels - 2, -1, -1):
+        start = time.perf_counter()
+        capture, template = capture_pyr[level], template_pyr[level]
+        # Propagate the coarser estimate: H_fine = S_t * H_coarse * S_c^-1
+        s_c = _scale_matrix(capture, capture_pyr[level + 1])
+        s_t = _scale_matrix(template, template_pyr[level + 1])
+        h = s_t @ h @ np.linalg.inv(s_c)
+
+        method = "ecc" if use_ecc else "orb"
+        try:
+            if use_ecc:
+                refined = _ecc_refine(capture, template, h, ecc_iterations, ecc_epsilon)
+            else:
+                # Match the template against the pre-warped capture and compose the correction
+                warped = cv2.warpPerspective(capture, h, (template.shape[1], template.shape[0]))
+                correction = _orb_homography(warped, template, orb, backend)
+                refined = None if correction is None else correction @ h
+        except cv2.error:
+            refined = None
+
+        if refined is None:
+            report.append({"level": level, "size": f"{template.shape[1]}x{template.shape[0]}",
+                           "method": f"{method} (failed)", "time_s": time.perf_counter() - start,
+                           "residual_px": None})
+            continue
+
+        # Residual in full-resolution pixels so the tolerance is level independent
+        residual = _corner_shift(refined, h, template.shape) * (template_gray.shape[1] / template.shape[1])
+        h = refined
+        report.append({"level": level, "size": f"{template.shape[1]}x{template.shape[0]}",
+                       "method": method, "time_s": time.perf_counter() - start,
+                       "residual_px": residual})
+
+        if residual < tolerance:
+            # Converged: carry the estimate straight up to full resolution
+            for finer in range(level - 1, -1, -1):
+                s_c = _scale_matrix(capture_pyr[finer], capture_pyr[finer + 1])
+                s_t = _scale_matrix(template_pyr[finer], template_pyr[finer + 1])
+                h = s_t @ h @ np.linalg.inv(s_c)
+            break
+
+    return h / h[2, 2], report
@@ -0,0 +1,291 @@
+# retrain.py
+# Fine-tuning pipeline fed by the reviewed uncertain detections.
+#
+# 1. export:   every review-queue frame whose uncertain boxes have all been reviewed
+#              becomes a YOLO sample labelled with its confident and its confirmed boxes
+#              (classes from confign.yaml). Images are pre-resized to the
+#              training size once and kept under data/retrain/dataset, so repeated runs
+#              only add new frames; training also uses cache="disk" instead of the
+#              cache: false of the original runs.
+# 2. train:    fine-tune from best.pt in a separate process (start_background), so the
+#              Streamlit UI never blocks.
+# 3. promote:  candidate and current weights are validated on the same split and on the
+#              original dataset (confign.yaml by default); best.pt is replaced only when
+#              the candidate scores higher mAP50-95 on the split without losing more
+#              than --max-base-drop on the original classes.
+#
+# Usage:  python retrain.py run --epochs 10
+#         python retrain.py export
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import yaml
+
+from review_queue import ReviewQueue
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(SCRIPT_DIR, "confign.yaml")
+WEIGHTS_PATH = os.path.join(SCRIPT_DIR, "train_results", "weights", "best.pt")
+RETRAIN_DIR = os.path.join("data", "retrain")
+QUEUE_DIR = os.path.join("data", "review_queue")
+# Boxes that become label lines: detections kept above the review threshold, and
+# uncertain ones a reviewer confirmed or corrected
+LABELLED_STATUSES = ("confident", "accepted", "relabelled")
+
+
+def load_class_names(config_path=CONFIG_PATH):
+    """{class id: name} from the dataset config the model was trained with."""
+    with open(config_path, encoding="utf-8") as f:
+        names = yaml.safe_load(f)["names"]
+    if isinstance(names, list):
+        return dict(enumerate(names))
+    return {int(k): v for k, v in names.items()}
+
+
+def dataset_dirs(data_yaml, key):
+    """Absolute image directories listed under `key` ("train"/"val") of a YOLO data yaml."""
+    with open(data_yaml, encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    root = data.get("path", os.path.dirname(os.path.abspath(data_yaml)))
+    entries = data.get(key) or []
+    return [entry if os.path.isabs(entry) else os.path.join(root, entry)
+            for entry in (entries if isinstance(entries, list) else [entries])]
+
+
+def _split(frame_id, val_fraction):
+    # Hash-based, so a frame stays in the same split across exports
+    return "val" if int(hashlib.blake2b(frame_id.encode(), digest_size=4).hexdigest(), 16) % 1000 \
+        < val_fraction * 1000 else "train"
+
+
+def yolo_labels(frame, class_names):
+    """YOLO label lines (class cx cy w h, normalised) for the confident and confirmed boxes of a frame."""
+    lines = []
+    for box in frame["boxes"]:
+        if box["status"] not in LABELLED_STATUSES or box["label"] is None or not str(box["label"]).isdigit():
+            continue
+        class_id = int(box["label"])
+        if class_id not in class_names:
+            continue
+        x1, x2 = sorted((max(box["x1"], 0), min(box["x2"], frame["width"])))
+        y1, y2 = sorted((max(box["y1"], 0), min(box["y2"], frame["height"])))
+        if x2 - x1 < 1 or y2 - y1 < 1:
+            continue
+        lines.append(f"{class_id} {(x1 + x2) / 2 / frame['width']:.6f} {(y1 + y2) / 2 / frame['height']:.6f} "
+                     f"{(x2 - x1) / frame['width']:.6f} {(y2 - y1) / frame['height']:.6f}")
+    return lines
+
+
+def export_dataset(queue, out_dir, class_names, imgsz=640, val_fraction=0.2, base_data=None):
+    """Write the reviewed frames as a YOLO dataset and return (data_yaml_path, counts).
+
+    Frames with only rejected boxes are kept as background images (empty label file).
+    `base_data` is the data yaml of the original dataset; its train/val images are
+    included so fine-tuning does not forget the original classes.
+    """
+    counts = {"train": 0, "val": 0, "new": 0, "boxes": 0}
+    for split in ("train", "val"):
+        os.makedirs(os.path.join(out_dir, "images", split), exist_ok=True)
+        os.makedirs(os.path.join(out_dir, "labels", split), exist_ok=True)
+
+    for frame in queue.reviewed_frames():
+        split = _split(frame["id"], val_fraction)
+        image_path = os.path.join(out_dir, "images", split, f"{frame['id']}.jpg")
+        label_path = os.path.join(out_dir, "labels", split, f"{frame['id']}.txt")
+        lines = yolo_labels(frame, class_names)
+        counts[split] += 1
+        counts["boxes"] += len(lines)
+
+        # Labels are cheap and may change after a re-review; images are resized only once
+        with open(label_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + ("\n" if lines else ""))
+        if os.path.exists(image_path):
+            continue
+        image = queue.load_frame(frame["id"])
+        if image is None:
+            os.remove(label_path)
+            counts[split] -= 1
+            continue
+        scale = imgsz / max(image.shape[:2])
+        if scale < 1:
+            image = cv2.resize(image, (round(image.shape[1] * scale), round(image.shape[0] * scale)),
+                               interpolation=cv2.INTER_AREA)
+        cv2.imwrite(image_path, image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        counts["new"] += 1
+
+    train = [os.path.abspath(os.path.join(out_dir, "images", "train"))]
+    val = [os.path.abspath(os.path.join(out_dir, "images", "val"))]
+    if base_data:
+        train += dataset_dirs(base_data, "train")
+        val += dataset_dirs(base_data, "val")
+
+    data_yaml = os.path.join(out_dir, "data.yaml")
+    with open(data_yaml, "w", encoding="utf-8") as f:
+        yaml.safe_dump({"train": train, "val": val, "names": class_names}, f, sort_keys=False)
+    return data_yaml, counts
+
+
+def validate(weights, data_yaml, imgsz=640):
+    from ultralytics import YOLO
+
+    metrics = YOLO(weights).val(data=data_yaml, imgsz=imgsz, split="val", plots=False, verbose=False)
+    return {"map50": float(metrics.box.map50), "map50_95": float(metrics.box.map)}
+
+
+def promote(candidate, weights_path=WEIGHTS_PATH):
+    """Replace the served weights atomically, keeping a timestamped backup of the old ones."""
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    if os.path.exists(weights_path):
+        shutil.copy2(weights_path, f"{weights_path}.{stamp}.bak")
+    tmp_path = weights_path + ".tmp"
+    shutil.copy2(candidate, tmp_path)
+    os.replace(tmp_path, weights_path)
+
+
+class RetrainStatus:
+    """JSON status file shared between the background run and the UI."""
+
+    def __init__(self, root=RETRAIN_DIR):
+        self.path = os.path.join(root, "status.json")
+        self.log_path = os.path.join(root, "retrain.log")
+
+    def read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"state": "idle"}
+
+    def write(self, **fields):
+        state = {**self.read(), **fields, "updated": datetime.now().isoformat(timespec="seconds")}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def running(self):
+        state = self.read()
+        if state.get("state") not in ("exporting", "training", "validating"):
+            return False
+        try:
+            os.kill(state["pid"], 0)
+        except (KeyError, OSError):
+            return False
+        return True
+
+
+def run_pipeline(args):
+    status = RetrainStatus(args.root)
+    status.write(state="exporting", pid=os.getpid(), started=datetime.now().isoformat(timespec="seconds"),
+                 error=None, result=None)
+    try:
+        # Promotion is gated on the original dataset too, so it has to be reachable
+        if not args.base_data:
+            raise ValueError("--base-data is required: the original dataset guards best.pt against "
+                             "forgetting its classes")
+        missing = [d for d in dataset_dirs(args.base_data, "val") if not os.path.isdir(d)]
+        if missing:
+            raise FileNotFoundError(f"Validation images of {args.base_data} not found: {', '.join(missing)}")
+
+        class_names = load_class_names(args.config)
+        data_yaml, counts = export_dataset(ReviewQueue(args.queue), os.path.join(args.root, "dataset"),
+                                           class_names, args.imgsz, args.val_fraction, args.base_data)
+        status.write(dataset=counts)
+        print(f"Dataset: {counts}", flush=True)
+        if counts["train"] < args.min_samples or counts["val"] < args.min_val:
+            status.write(state="skipped", result=f"need at least {args.min_samples} reviewed training frames "
+                                                 f"and {args.min_val} validation frames")
+            return
+
+        from ultralytics import YOLO
+
+        status.write(state="training")
+        start = time.perf_counter()
+        run_name = datetime.now().strftime("finetune-%Y%m%d-%H%M%S")
+        YOLO(args.weights).train(data=data_yaml, epochs=args.epochs, imgsz=args.imgsz, batch=args.batch,
+                                 cache="disk", freeze=args.freeze, workers=args.workers,
+                                 project=os.path.abspath(os.path.join(args.root, "runs")), name=run_name,
+                                 plots=False)
+        candidate = os.path.join(args.root, "runs", run_name, "weights", "best.pt")
+        status.write(state="validating", train_seconds=round(time.perf_counter() - start, 1))
+
+        current, new = {}, {}
+        for prefix, data in (("", data_yaml), ("base_", args.base_data)):
+            current.update({prefix + k: v for k, v in validate(args.weights, data, args.imgsz).items()})
+            new.update({prefix + k: v for k, v in validate(candidate, data, args.imgsz).items()})
+        print(f"Current {current}, candidate {new}", flush=True)
+        improved = new["map50_95"] > current["map50_95"] + args.min_delta
+        base_kept = new["base_map50_95"] >= current["base_map50_95"] - args.max_base_drop
+        if improved and base_kept:
+            promote(candidate, args.weights)
+            result = "candidate promoted to best.pt"
+        elif improved:
+            result = "current weights kept: candidate regressed on the original dataset"
+        else:
+            result = "current weights kept"
+        status.write(state="promoted" if improved and base_kept else "kept", current=current, candidate=new,
+                     candidate_path=candidate, result=result)
+    except Exception as e:
+        status.write(state="failed", error=f"{type(e).__name__}: {e}")
+        raise
+
+
+def start_background(root=RETRAIN_DIR, **options):
+    """Launch `retrain.py run` as a detached process logging to <root>/retrain.log; returns its pid."""
+    status = RetrainStatus(root)
+    if status.running():
+        raise RuntimeError("A retraining run is already in progress")
+    os.makedirs(root, exist_ok=True)
+    command = [sys.executable, os.path.abspath(__file__), "run", "--root", root]
+    for key, value in options.items():
+        if value is not None:
+            command += [f"--{key.replace('_', '-')}", str(value)]
+    with open(status.log_path, "a", encoding="utf-8") as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, cwd=os.getcwd(),
+                                   start_new_session=True)
+    status.write(state="exporting", pid=process.pid, error=None, result=None)
+    return process.pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the defect model on reviewed uncertain samples.")
+    parser.add_argument("command", choices=["run", "export"])
+    parser.add_argument("--root", default=RETRAIN_DIR)
+    parser.add_argument("--queue", default=QUEUE_DIR)
+    parser.add_argument("--config", default=CONFIG_PATH)
+    parser.add_argument("--weights", default=WEIGHTS_PATH)
+    parser.add_argument("--base-data", default=CONFIG_PATH,
+                        help="data yaml of the original dataset, mixed in and checked before promotion")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--freeze", type=int, default=10, help="backbone layers to freeze while fine-tuning")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--min-samples", type=int, default=20)
+    parser.add_argument("--min-val", type=int, default=10, help="reviewed validation frames needed to compare")
+    parser.add_argument("--min-delta", type=float, default=0.0, help="required mAP50-95 gain to promote")
+    parser.add_argument("--max-base-drop", type=float, default=0.0,
+                        help="allowed mAP50-95 loss on the original dataset when promoting")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        data_yaml, counts = export_dataset(ReviewQueue(args.queue), os.path.join(args.root, "dataset"),
+                                           load_class_names(args.config), args.imgsz, args.val_fraction,
+                                           args.base_data)
+        print(f"Wrote {data_yaml}: {counts}")
+        return
+    run_pipeline(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# review_queue.py
+# Disk-backed queue of uncertain detections awaiting human review.
+#
+# Each source frame is written once (JPEG + small thumbnail) under the queue root and
+# any number of low-confidence boxes link to it through a SQLite index. The number of
+# stored frames is capped; the oldest frames and their boxes are evicted first.
+# Pages of the queue are read lazily, so nothing is held in session memory.
+# Reviewed boxes carry a status and the confirmed class id, which retrain.py exports
+# as YOLO training labels. The confident detections of a queued frame are stored too
+# (status "confident", not shown for review), so an exported frame is labelled with
+# every defect on it rather than only the uncertain ones.
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import cv2
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS boxes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    frame_id TEXT NOT NULL REFERENCES frames(id) ON DELETE CASCADE,
+    timestamp TEXT,
+    defect_type TEXT,
+    confidence REAL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    location_x INTEGER,
+    location_y INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    label TEXT,
+    uncertain INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS boxes_frame ON boxes(frame_id);
+CREATE INDEX IF NOT EXISTS frames_created ON frames(created);
+"""
+
+REVIEW_STATUSES = ("accepted", "relabelled", "rejected")
+
+
+def frame_key(image):
+    image = np.ascontiguousarray(image)
+    h = hashlib.blake2b(digest_size=12)
+    h.update(f"{image.shape}".encode())
+    h.update(image.data)
+    return h.hexdigest()
+
+
+class ReviewQueue:
+    def __init__(self, root, max_frames=200, thumb_size=256, jpeg_quality=92):
+        self.root = root
+        self.max_frames = max_frames
+        self.thumb_size = thumb_size
+        self.jpeg_quality = jpeg_quality
+        self.db_path = os.path.join(root, "queue.sqlite3")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "frames"), exist_ok=True)
+        os.makedirs(os.path.join(root, "thumbs"), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA foreign_keys = ON")
+        return db
+
+    def frame_path(self, frame_id):
+        return os.path.join(self.root, "frames", f"{frame_id}.jpg")
+
+    def thumb_path(self, frame_id):
+        return os.path.join(self.root, "thumbs", f"{frame_id}.jpg")
+
+    def add(self, image_bgr, boxes, confident=None):
+        """Store `image_bgr` once and link `boxes` to it; returns the frame id.
+
+        Each box is a dict with the defect_data fields plus "xyxy" in frame pixels.
+        `confident` are the frame's other detections (with "class_id"); they are kept
+        as labels for retraining but not queued for review. Only frames added with
+        `confident` given (even empty) are complete enough to be exported.
+        Adding the same frame again only adds the boxes that are not linked yet.
+        """
+        if not boxes:
+            return None
+        frame_id = frame_key(image_bgr)
+        height, width = image_bgr.shape[:2]
+
+        with self._lock:
+            if not os.path.exists(self.frame_path(frame_id)):
+                cv2.imwrite(self.frame_path(frame_id), image_bgr,
+                            [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                scale = self.thumb_size / max(height, width)
+                thumb = cv2.resize(image_bgr, (max(1, int(width * scale)), max(1, int(height * scale))),
+                                   interpolation=cv2.INTER_AREA) if scale < 1 else image_bgr
+                cv2.imwrite(self.thumb_path(frame_id), thumb, [cv2.IMWRITE_JPEG_QUALITY, 80])
+
+            with closing(self._connect()) as db, db:
+                db.execute("INSERT OR IGNORE INTO frames (id, created, width, height, complete) "
+                           "VALUES (?, ?, ?, ?, ?)",
+                           (frame_id, time.time(), width, height, int(confident is not None)))
+                existing = {
+                    (row["x1"], row["y1"], row["x2"], row["y2"])
+                    for row in db.execute("SELECT x1, y1, x2, y2 FROM boxes WHERE frame_id = ?", (frame_id,))
+                }
+                tagged = [(b, True) for b in boxes] + [(b, False) for b in confident or []]
+                new_boxes = [(b, uncertain) for b, uncertain in tagged
+                             if tuple(float(v) for v in b["xyxy"]) not in existing]
+                db.executemany(
+                    "INSERT INTO boxes (frame_id, timestamp, defect_type, confidence, x1, y1, x2, y2, "
+                    "location_x, location_y, status, label, uncertain) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(frame_id, b["timestamp"], str(b["defect_type"]), float(b["confidence"]),
+                      *(float(v) for v in b["xyxy"]), int(b["location_x"]), int(b["location_y"]),
+                      "pending" if uncertain else "confident",
+                      None if uncertain else str(b.get("class_id", b["defect_type"])), int(uncertain))
+                     for b, uncertain in new_boxes],
+                )
+            self._evict()
+        return frame_id
+
+    def _evict(self):
+        with closing(self._connect()) as db, db:
+            overflow = db.execute("SELECT COUNT(*) FROM frames").fetchone()[0] - self.max_frames
+            if overflow <= 0:
+                return
+            victims = [row["id"] for row in db.execute(
+                "SELECT id FROM frames ORDER BY created LIMIT ?", (overflow,))]
+            db.executemany("DELETE FROM frames WHERE id = ?", [(v,) for v in victims])
+        for frame_id in victims:
+            for path in (self.frame_path(frame_id), self.thumb_path(frame_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def count(self, status=None):
+        """(frames, uncertain boxes) in the queue, optionally restricted to boxes with `status`."""
+        with closing(self._connect()) as db:
+            if status is None:
+                boxes = db.execute("SELECT COUNT(*) FROM boxes WHERE uncertain = 1").fetchone()[0]
+                frames = db.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+            else:
+                boxes = db.execute("SELECT COUNT(*) FROM boxes WHERE uncertain = 1 AND status = ?",
+                                   (status,)).fetchone()[0]
+                frames = db.execute("SELECT COUNT(DISTINCT frame_id) FROM boxes WHERE uncertain = 1 "
+                                    "AND status = ?", (status,)).fetchone()[0]
+        return frames, boxes
+
+    def page(self, offset=0, limit=10):
+        """Newest-first page of frames, each with its uncertain boxes (no pixels are loaded)."""
+        with closing(self._connect()) as db:
+            frames = [dict(row) for row in db.execute(
+                "SELECT * FROM frames ORDER BY created DESC LIMIT ? OFFSET ?", (limit, offset))]
+            for frame in frames:
+                frame["boxes"] = [dict(row) for row in db.execute(
+                    "SELECT * FROM boxes WHERE frame_id = ? AND uncertain = 1 ORDER BY confidence",
+                    (frame["id"],))]
+                frame["thumb_path"] = self.thumb_path(frame["id"])
+        return frames
+
+    def set_review(self, box_id, status, label=None):
+        """Record a human decision for one box: "accepted", "relabelled" or "rejected".
+
+        `label` is the class id the box really shows; rejected boxes are not defects.
+        """
+        if status not in REVIEW_STATUSES:
+            raise ValueError(f"status must be one of {REVIEW_STATUSES}, got {status!r}")
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE boxes SET status = ?, label = ? WHERE id = ?",
+                       (status, None if label is None else str(label), box_id))
+
+    def reviewed_frames(self):
+        """Complete frames whose uncertain boxes have all been reviewed, with all their boxes, oldest first."""
+        with closing(self._connect()) as db:
+            frames = [dict(row) for row in db.execute(
+                "SELECT * FROM frames WHERE complete = 1 "
+                "AND id NOT IN (SELECT frame_id FROM boxes WHERE status = 'pending') ORDER BY created")]
+            for frame in frames:
+                frame["boxes"] = [dict(row) for row in db.execute(
+                    "SELECT * FROM boxes WHERE frame_id = ?", (frame["id"],))]
+        return frames
+
+    def load_frame(self, frame_id):
+        return cv2.imread(self.frame_path(frame_id), cv2.IMREAD_COLOR)
+
+    def clear(self):
+        with self._lock:
+            with closing(self._connect()) as db, db:
+                frame_ids = [row["id"] for row in db.execute("SELECT id FROM frames")]
+                db.execute("DELETE FROM frames")
+            for frame_id in frame_ids:
+                for path in (self.frame_path(frame_id), self.thumb_path(frame_id)):
+                    if os.path.exists(path):
+                        os.remove(path)
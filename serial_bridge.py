@@ -1,32 +1,210 @@
 # serial_bridge.py
-import serial
+# Bidirectional serial bridge between the ESP32 pendant and the CNC Arduino (GRBL).
+#
+# Each port has one reader thread blocked in read(), so bytes are forwarded as soon as
+# they arrive instead of on a 10 ms polling tick. Pendant -> machine carries jog and
+# real-time commands ("?", "!", "~", Ctrl-X have no newline, so data is forwarded as
+# received rather than per line); machine -> pendant carries ok/error/status replies.
+# A port that drops is reopened by its reader thread with backoff while the other
+# direction keeps running. Forwarding latency is collected in histograms and
+# reported periodically instead of printing every command.
+#
+# Usage:  python serial_bridge.py --pendant /dev/ttyUSB0 --machine /dev/ttyACM0
+import argparse
+import bisect
+import threading
 import time
 
+import serial
 
-def main():
-    # Configure ports (adjust as needed)
-    ARDUINO_PORT = "/dev/ttyACM0"  # CNC Arduino
-    ESP32_PORT = "/dev/ttyUSB0"  # ESP32 Pendant
-    BAUD_RATE = 115200
+# Histogram bucket upper bounds in microseconds (roughly log-spaced)
+LATENCY_BUCKETS_US = [50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000]
 
-    try:
-        # Open serial connections
-        arduino = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=1)
-        esp32 = serial.Serial(ESP32_PORT, BAUD_RATE, timeout=1)
 
-        print(f"Forwarding {ESP32_PORT} → {ARDUINO_PORT}...")
+class LatencyHistogram:
+    def __init__(self, bounds_us=LATENCY_BUCKETS_US):
+        self.bounds_us = bounds_us
+        self.counts = [0] * (len(bounds_us) + 1)  # last bucket: above the largest bound
+        self.total = 0
+        self.max_us = 0.0
+        self._lock = threading.Lock()
 
-        while True:
-            if esp32.in_waiting:
-                cmd = esp32.readline().decode().strip()
-                print(f"Pendant: {cmd}")
-                arduino.write((cmd + '\n').encode())  # Forward to CNC
+    def record(self, seconds):
+        us = seconds * 1e6
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds_us, us)] += 1
+            self.total += 1
+            self.max_us = max(self.max_us, us)
+
+    def percentile(self, q):
+        """Upper bound (us) of the bucket holding the q-th percentile."""
+        with self._lock:
+            if not self.total:
+                return 0.0
+            target = q / 100 * self.total
+            seen = 0
+            for bound, count in zip(self.bounds_us + [self.max_us], self.counts):
+                seen += count
+                if seen >= target:
+                    return float(min(bound, self.max_us))
+        return self.max_us
+
+    def format(self):
+        with self._lock:
+            labels = [f"<{b}us" for b in self.bounds_us] + [f">{self.bounds_us[-1]}us"]
+            return " ".join(f"{label}:{count}" for label, count in zip(labels, self.counts) if count)
+
+
+class Link:
+    """One serial port that reopens itself after a failure."""
+
+    def __init__(self, name, port, baud, read_timeout=0.5, min_backoff=0.5, max_backoff=5.0):
+        self.name = name
+        self.port = port
+        self.baud = baud
+        self.read_timeout = read_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._serial = None
+        self._write_lock = threading.Lock()
+        self.reconnects = 0
+        self.dropped_bytes = 0
+
+    @property
+    def connected(self):
+        return self._serial is not None and self._serial.is_open
+
+    def connect(self, stop):
+        """Open the port, retrying with backoff until it works or `stop` is set."""
+        backoff = self.min_backoff
+        while not stop.is_set():
+            try:
+                # serial_for_url also accepts plain device paths, plus socket:// and rfc2217:// URLs
+                self._serial = serial.serial_for_url(self.port, self.baud, timeout=self.read_timeout)
+                print(f"[{self.name}] connected to {self.port}")
+                return True
+            except (serial.SerialException, OSError) as e:
+                print(f"[{self.name}] cannot open {self.port}: {e}; retrying in {backoff:.1f}s")
+                stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        return False
+
+    def close(self):
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except (serial.SerialException, OSError):
+                pass
+        self._serial = None
 
-            time.sleep(0.01)  # Reduce CPU usage
+    def read(self):
+        """Block until at least one byte arrives (or the read timeout passes); b"" on timeout."""
+        port = self._serial
+        data = port.read(1)
+        if data and port.in_waiting:
+            data += port.read(port.in_waiting)
+        return data
 
-    except Exception as e:
-        print(f"Error: {e}")
+    def write(self, data):
+        """Write and flush; data for a port that is down is dropped and counted."""
+        with self._write_lock:
+            port = self._serial
+            if port is None:
+                self.dropped_bytes += len(data)
+                return False
+            try:
+                port.write(data)
+                port.flush()
+                return True
+            except (serial.SerialException, OSError):
+                self.dropped_bytes += len(data)
+                return False
+
+
+class SerialBridge:
+    def __init__(self, pendant_port, machine_port, baud=115200, verbose=False):
+        self.pendant = Link("pendant", pendant_port, baud)
+        self.machine = Link("machine", machine_port, baud)
+        self.verbose = verbose
+        self.latency = {"pendant->machine": LatencyHistogram(), "machine->pendant": LatencyHistogram()}
+        self.bytes = {"pendant->machine": 0, "machine->pendant": 0}
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._pump, args=(self.pendant, self.machine, "pendant->machine"),
+                             name="pendant-reader", daemon=True),
+            threading.Thread(target=self._pump, args=(self.machine, self.pendant, "machine->pendant"),
+                             name="machine-reader", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.pendant.close()
+        self.machine.close()
+
+    def _pump(self, source, target, direction):
+        # The reader thread owns the source port, including reopening it after a failure
+        histogram = self.latency[direction]
+        while not self._stop.is_set():
+            if not source.connected and not source.connect(self._stop):
+                return
+            try:
+                data = source.read()
+            except (serial.SerialException, OSError) as e:
+                print(f"[{source.name}] port dropped: {e}")
+                source.close()
+                source.reconnects += 1
+                continue
+            if not data:
+                continue
+            received = time.perf_counter()
+            if target.write(data):
+                histogram.record(time.perf_counter() - received)
+                self.bytes[direction] += len(data)
+            if self.verbose:
+                print(f"{direction}: {data!r}")
+
+    def report(self):
+        lines = []
+        for direction, histogram in self.latency.items():
+            lines.append(f"{direction}: {histogram.total} chunks, {self.bytes[direction]} bytes, "
+                         f"p50 {histogram.percentile(50):.0f}us p99 {histogram.percentile(99):.0f}us "
+                         f"max {histogram.max_us:.0f}us | {histogram.format()}")
+        for link in (self.pendant, self.machine):
+            lines.append(f"{link.name}: {'up' if link.connected else 'DOWN'}, {link.reconnects} reconnects, "
+                         f"{link.dropped_bytes} bytes dropped while down")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge the ESP32 pendant and the CNC Arduino serial ports.")
+    parser.add_argument("--pendant", default="/dev/ttyUSB0", help="ESP32 pendant port")
+    parser.add_argument("--machine", default="/dev/ttyACM0", help="CNC Arduino port")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--report-interval", type=float, default=30.0, help="seconds between latency reports")
+    parser.add_argument("--verbose", action="store_true", help="print every forwarded chunk")
+    args = parser.parse_args()
+
+    bridge = SerialBridge(args.pendant, args.machine, args.baud, args.verbose)
+    print(f"Bridging {args.pendant} <-> {args.machine} at {args.baud} baud (Ctrl-C to stop)")
+    bridge.start()
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            print(bridge.report())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bridge.stop()
+        print(bridge.report())
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,99 @@
+# stage_timer.py
+# Lightweight wall-clock instrumentation for the inspection apps.
+#
+# Each script run / inspection gets a RunTimer that records one span per stage
+# (decode, crop, predict, ...). When the run finishes its spans are folded into a
+# process-wide StageMetrics, which keeps a bounded window of samples per stage for
+# percentile summaries and appends the run as one JSON line to a local metrics file.
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+
+class RunTimer:
+    def __init__(self, metrics, app, label=None):
+        self.metrics = metrics
+        self.app = app
+        self.label = label
+        self.run_id = uuid.uuid4().hex[:12]
+        self.spans = []
+        self._finished = False
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((stage, time.perf_counter() - start))
+
+    def finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        if self.spans:
+            self.metrics.record_run(self)
+
+
+class StageMetrics:
+    def __init__(self, path, window=2000):
+        self.path = path
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def start(self, app, label=None):
+        return RunTimer(self, app, label)
+
+    def record_run(self, timer):
+        with self._lock:
+            for stage, seconds in timer.spans:
+                self._samples[(timer.app, stage)].append(seconds)
+
+        line = json.dumps({
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "app": timer.app,
+            "label": timer.label,
+            "run_id": timer.run_id,
+            "spans": [{"stage": stage, "ms": round(seconds * 1000, 3)} for stage, seconds in timer.spans],
+        })
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            # Metrics must never break an inspection
+            pass
+
+    def summary(self, app=None):
+        """Per-stage count and latency percentiles (milliseconds) over the sample window."""
+        with self._lock:
+            items = [(key, np.fromiter(values, dtype=float)) for key, values in self._samples.items()
+                     if app is None or key[0] == app]
+        rows = []
+        for (run_app, stage), samples in sorted(items):
+            if not len(samples):
+                continue
+            ms = samples * 1000
+            rows.append({
+                "app": run_app,
+                "stage": stage,
+                "count": len(ms),
+                "mean_ms": round(float(ms.mean()), 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p90_ms": round(float(np.percentile(ms, 90)), 2),
+                "p99_ms": round(float(np.percentile(ms, 99)), 2),
+                "max_ms": round(float(ms.max()), 2),
+            })
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
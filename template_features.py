@@ -0,0 +1,139 @@
+# template_features.py
+# Preprocessing and ORB feature store for template PCB images.
+#
+# The same few board designs are inspected all day, so the template side of the
+# pipeline (grayscale -> resize -> blur -> threshold -> ORB) is computed once per
+# template and kept both in memory and on disk, keyed by the template's content hash.
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ALIGN_SIZE = (750, 450)  # (width, height) used by the alignment and subtraction steps
+
+# Bump when the preprocessing or ORB settings change so stale disk entries are ignored
+FEATURES_VERSION = "v1"
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def load_rgb(data):
+    # Decode uploaded bytes the same way the pages do (PIL -> numpy)
+    return np.array(Image.open(io.BytesIO(data)))
+
+
+def preprocess_template(img_array):
+    """Grayscale, resize, blur and threshold a template; returns every stage."""
+    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    resized = cv2.resize(gray, ALIGN_SIZE)
+    blurred = cv2.GaussianBlur(resized, (3, 3), 0)
+    _, thresholded = cv2.threshold(blurred, 128, 255, cv2.THRESH_BINARY)
+    return {"gray": gray, "resized": resized, "blurred": blurred, "thresholded": thresholded}
+
+
+def preprocess_capture(img_array):
+    """Grayscale, resize and blur a captured image for alignment."""
+    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    resized = cv2.resize(gray, ALIGN_SIZE)
+    return cv2.GaussianBlur(resized, (3, 3), 0)
+
+
+def keypoints_to_array(keypoints):
+    return np.array(
+        [(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+         for kp in keypoints],
+        dtype=np.float32,
+    ).reshape(-1, 7)
+
+
+def array_to_keypoints(array):
+    return [
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response),
+                     int(octave), int(class_id))
+        for x, y, size, angle, response, octave, class_id in array
+    ]
+
+
+def compute_template_features(img_array):
+    stages = preprocess_template(img_array)
+    orb = cv2.ORB_create()
+    keypoints, descriptors = orb.detectAndCompute(stages["thresholded"], None)
+    return {
+        "stages": stages,
+        "keypoints": keypoints,
+        "descriptors": descriptors,
+    }
+
+
+class TemplateFeatureStore:
+    """Two-level (memory LRU + .npz on disk) cache of processed templates."""
+
+    STAGES = ("gray", "resized", "blurred", "thresholded")
+
+    def __init__(self, cache_dir, max_memory_entries=8):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}_{FEATURES_VERSION}.npz")
+
+    def get(self, data):
+        """Return the features for the template encoded in `data` (raw file bytes)."""
+        key = content_hash(data)
+        with self._lock:
+            features = self._memory.get(key)
+            if features is not None:
+                self._memory.move_to_end(key)
+                return features
+
+        features = self._load(key)
+        if features is None:
+            features = compute_template_features(load_rgb(data))
+            features["key"] = key
+            self._save(key, features)
+
+        with self._lock:
+            self._memory[key] = features
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+        return features
+
+    def _load(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as stored:
+                descriptors = stored["descriptors"]
+                return {
+                    "key": key,
+                    "stages": {name: stored[name] for name in self.STAGES},
+                    "keypoints": array_to_keypoints(stored["keypoints"]),
+                    "descriptors": descriptors if descriptors.size else None,
+                }
+        except (OSError, KeyError, ValueError):
+            # Corrupt or partial cache file: recompute and overwrite it
+            return None
+
+    def _save(self, key, features):
+        descriptors = features["descriptors"]
+        if descriptors is None:
+            descriptors = np.empty((0, 32), dtype=np.uint8)
+        tmp_path = self._disk_path(key) + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            keypoints=keypoints_to_array(features["keypoints"]),
+            descriptors=descriptors,
+            **features["stages"],
+        )
+        os.replace(tmp_path, self._disk_path(key))
@@ -0,0 +1,55 @@
+import math
+import os
+
+import numpy as np
+
+from gcode_program import parse_gcode
+from gcode_simplify import simplify_program
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "Simple Design", "[Final]2x2Gerber_TopLayer.GTL_iso_combined_cnc.nc")
+
+
+def radius_mismatches(text):
+    """(mismatch, allowed) of every G02/G03 as GRBL computes it from the written words."""
+    moves, _ = parse_gcode(text)
+    result = []
+    for previous, move in zip(moves[:-1], moves[1:]):
+        if move["motion"] not in (2, 3):
+            continue
+        centre = np.array([previous["x"] + move["i"], previous["y"] + move["j"]])
+        radius = math.hypot(move["i"], move["j"])
+        end_radius = float(np.linalg.norm(np.array([move["x"], move["y"]]) - centre))
+        result.append((abs(end_radius - radius), max(0.005, min(0.5, 0.001 * radius))))
+    return result
+
+
+def polygon_pads(digits):
+    """Small 64-step pad outlines written with `digits` decimals, as FlatCAM does."""
+    rng = np.random.default_rng(3)
+    lines = ["G21", "G90", "G00 X0.0000 Y0.0000", "G01 F100"]
+    fmt = f"{{:.{digits}f}}"
+    for pad in range(40):
+        cx, cy = rng.uniform(0, 50, 2)
+        radius = rng.uniform(0.2, 1.5)
+        angles = np.linspace(0, 2 * math.pi, 65)
+        points = np.column_stack([cx + radius * np.cos(angles), cy + radius * np.sin(angles)])
+        lines.append(f"G00 X{fmt.format(points[0, 0])} Y{fmt.format(points[0, 1])}")
+        lines += [f"G01 X{fmt.format(x)} Y{fmt.format(y)}" for x, y in points[1:]]
+    return "\n".join(lines) + "\n"
+
+
+def test_sample_arcs_keep_grbl_radius_limit():
+    with open(SAMPLE, encoding="utf-8", newline="") as f:
+        simplified, report = simplify_program(f.read(), 0.01)
+    mismatches = radius_mismatches(simplified)
+    assert report["arcs"] > 0 and len(mismatches) == report["arcs"]
+    assert all(mismatch <= allowed for mismatch, allowed in mismatches)
+
+
+def test_coarse_digits_keep_grbl_radius_limit():
+    # Two decimals round I/J and end points by up to 0.005 mm each, enough to break GRBL's limit
+    simplified, report = simplify_program(polygon_pads(2), 0.01, digits=2)
+    mismatches = radius_mismatches(simplified)
+    assert report["arcs"] > 0
+    assert all(mismatch <= allowed for mismatch, allowed in mismatches)
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+
+from inspection_pipeline import align_capture
+from template_features import ALIGN_SIZE, compute_template_features
+
+
+def synthetic_board(seed=0):
+    """Random pads and traces on a dark substrate, RGB at the alignment size."""
+    rng = np.random.default_rng(seed)
+    width, height = ALIGN_SIZE
+    board = np.full((height, width, 3), 30, np.uint8)
+    for _ in range(60):
+        x, y = int(rng.integers(20, width - 60)), int(rng.integers(20, height - 60))
+        w, h = int(rng.integers(8, 50)), int(rng.integers(8, 50))
+        cv2.rectangle(board, (x, y), (x + w, y + h), (220, 200, 80), -1)
+    for _ in range(40):
+        center = (int(rng.integers(20, width - 20)), int(rng.integers(20, height - 20)))
+        cv2.circle(board, center, int(rng.integers(4, 14)), (240, 240, 240), -1)
+    for _ in range(20):
+        p1 = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        p2 = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.line(board, p1, p2, (200, 180, 60), 3)
+    return board
+
+
+def test_align_capture_undoes_a_shift():
+    board = synthetic_board()
+    features = compute_template_features(board)
+    dx, dy = 30.0, -18.0
+    shift = np.float32([[1, 0, dx], [0, 1, dy]])
+    capture = cv2.warpAffine(board, shift, ALIGN_SIZE, borderValue=(30, 30, 30))
+
+    warped, h = align_capture(capture, features)
+
+    assert h is not None
+    # h maps capture coordinates back onto the template
+    point = cv2.perspectiveTransform(np.float32([[[400 + dx, 200 + dy]]]), h)[0, 0]
+    np.testing.assert_allclose(point, [400, 200], atol=1.5)
+
+    # Away from the border the thresholded aligned capture matches the template
+    _, aligned = cv2.threshold(warped, 128, 255, cv2.THRESH_BINARY)
+    template = features["stages"]["thresholded"]
+    margin = 40
+    inner = (slice(margin, ALIGN_SIZE[1] - margin), slice(margin, ALIGN_SIZE[0] - margin))
+    mismatch = np.mean(aligned[inner] != template[inner])
+    assert mismatch < 0.01
@@ -0,0 +1,69 @@
+import argparse
+import os
+
+import numpy as np
+
+from retrain import RetrainStatus, export_dataset, run_pipeline
+from review_queue import ReviewQueue
+
+CLASS_NAMES = {0: "missing_hole", 1: "mouse_bite", 2: "open_circuit"}
+
+
+def box(class_id, confidence, xyxy):
+    return {"timestamp": "2026-01-01T00:00:00", "defect_type": str(class_id), "confidence": confidence,
+            "location_x": xyxy[2], "location_y": xyxy[3], "xyxy": xyxy, "class_id": class_id}
+
+
+def test_export_labels_confident_and_reviewed_boxes(tmp_path):
+    queue = ReviewQueue(str(tmp_path / "queue"))
+    image = np.random.default_rng(0).integers(0, 255, (200, 400, 3), dtype=np.uint8)
+    queue.add(image, [box(1, 0.3, [10, 10, 50, 50])], confident=[box(2, 0.9, [200, 100, 260, 180])])
+
+    # Only the uncertain box is shown for review; relabel it
+    (frame,) = queue.page()
+    (uncertain,) = frame["boxes"]
+    queue.set_review(uncertain["id"], "relabelled", 0)
+
+    out_dir = str(tmp_path / "dataset")
+    _, counts = export_dataset(queue, out_dir, CLASS_NAMES)
+
+    assert counts["boxes"] == 2
+    with open(next(os.path.join(out_dir, "labels", split, name)
+                   for split in ("train", "val")
+                   for name in os.listdir(os.path.join(out_dir, "labels", split))), encoding="utf-8") as f:
+        classes = sorted(line.split()[0] for line in f.read().splitlines())
+    assert classes == ["0", "2"]
+
+
+def test_export_skips_frames_without_their_confident_boxes(tmp_path):
+    queue = ReviewQueue(str(tmp_path / "queue"))
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    queue.add(image, [box(1, 0.3, [10, 10, 50, 50])])  # confident boxes were not kept
+    (frame,) = queue.page()
+    queue.set_review(frame["boxes"][0]["id"], "accepted", 1)
+
+    _, counts = export_dataset(queue, str(tmp_path / "dataset"), CLASS_NAMES)
+
+    assert counts["train"] + counts["val"] == 0
+
+
+def test_run_skips_without_enough_validation_frames(tmp_path):
+    queue = ReviewQueue(str(tmp_path / "queue"))
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    for _ in range(3):
+        queue.add(image, [box(1, 0.3, [10, 10, 50, 50])], confident=[])
+    for frame in queue.page():
+        queue.set_review(frame["boxes"][0]["id"], "accepted", 1)
+    os.makedirs(tmp_path / "base" / "val")
+    base_data = tmp_path / "base.yaml"
+    base_data.write_text(f"path: {tmp_path / 'base'}\ntrain: val\nval: val\nnames: {CLASS_NAMES}\n")
+    config = tmp_path / "classes.yaml"
+    config.write_text(f"names: {CLASS_NAMES}\n")
+
+    args = argparse.Namespace(root=str(tmp_path / "retrain"), queue=str(tmp_path / "queue"), config=str(config),
+                              weights="best.pt", base_data=str(base_data), imgsz=64, val_fraction=0.2,
+                              min_samples=1, min_val=10)
+    run_pipeline(args)
+
+    state = RetrainStatus(args.root).read()
+    assert state["state"] == "skipped" and "10 validation frames" in state["result"]
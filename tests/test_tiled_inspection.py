@@ -0,0 +1,19 @@
+import numpy as np
+
+from tiled_inspection import tiled_subtraction
+
+
+def test_long_and_full_resolution_defects_survive_tiling():
+    # Twice the 750x450 reference size, so the area limits scale by four
+    template = np.full((900, 1500), 255, np.uint8)
+    warped = template.copy()
+    warped[400:403, 100:480] = 0   # 3x380 px scratch, far longer than the tile overlap
+    warped[100:120, 1200:1220] = 0  # 400 px: too large at 750x450, fine at full resolution
+
+    defects, report = tiled_subtraction(template, warped, tile_size=256, overlap=32, workers=2)
+
+    assert len(report) > 1
+    assert len(defects) == 2
+    scratch, pad = sorted(defects, key=lambda d: d["width"], reverse=True)
+    assert scratch["y"] == 400 and scratch["width"] >= 370
+    assert (pad["x"], pad["y"], pad["width"], pad["height"]) == (1200, 100, 20, 20)
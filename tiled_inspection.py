@@ -0,0 +1,197 @@
+# tiled_inspection.py
+# Full-resolution inspection by overlapping tiles.
+#
+# Downscaling a whole board to 750x450 (template subtraction) or to the 640 px YOLO
+# letterbox makes sub-millimetre defects disappear. Here the aligned full-resolution
+# image is cut into overlapping tiles that are processed in parallel. Detections that
+# appear complete in more than one tile are merged with NMS; blobs cut by tile edges
+# are joined and re-measured on the full image.
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from detection_utils import nms, result_arrays
+from inspection_pipeline import MAX_BLOB_PIXELS, MIN_BLOB_PIXELS, find_defects, subtract_images
+from template_features import ALIGN_SIZE
+
+
+def tile_grid(height, width, tile_size, overlap):
+    """(x0, y0, x1, y1) windows covering the image; edge tiles are shifted inwards."""
+    stride = max(tile_size - overlap, 1)
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in starts(height)
+        for x0 in starts(width)
+    ]
+
+
+def preprocess_full_resolution(template_gray, warped_gray):
+    """Full-resolution equivalents of the 750x450 template/capture preprocessing."""
+    template = cv2.GaussianBlur(template_gray, (3, 3), 0)
+    _, template = cv2.threshold(template, 128, 255, cv2.THRESH_BINARY)
+    warped = cv2.GaussianBlur(warped_gray, (3, 3), 0)
+    return template, warped
+
+
+def _touches_inner_edge(defect, window, height, width):
+    # A blob cut by an inner tile edge may continue in the neighbouring tile
+    x0, y0, x1, y1 = window
+    return ((defect["x"] == 0 and x0 > 0) or (defect["y"] == 0 and y0 > 0)
+            or (defect["x"] + defect["width"] >= x1 - x0 and x1 < width)
+            or (defect["y"] + defect["height"] >= y1 - y0 and y1 < height))
+
+
+def _touching_groups(boxes, gap=1):
+    """Indices of boxes grouped by overlap (or adjacency within `gap` px), via union-find."""
+    parent = list(range(len(boxes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(boxes)):
+        rest = boxes[i + 1:]
+        touching = np.nonzero((rest[:, 0] <= boxes[i, 2] + gap) & (rest[:, 2] + gap >= boxes[i, 0])
+                              & (rest[:, 1] <= boxes[i, 3] + gap) & (rest[:, 3] + gap >= boxes[i, 1]))[0]
+        for j in touching + i + 1:
+            parent[find(j)] = find(i)
+
+    groups = {}
+    for i in range(len(boxes)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _measure_region(template_img, warped_img, box, pad=8):
+    """Blobs intersecting `box`, measured on one crop of the full images."""
+    height, width = template_img.shape[:2]
+    x0, y0 = max(int(box[0]) - pad, 0), max(int(box[1]) - pad, 0)
+    x1, y1 = min(int(box[2]) + pad, width), min(int(box[3]) + pad, height)
+    _, final_img = subtract_images(template_img[y0:y1, x0:x1], warped_img[y0:y1, x0:x1])
+    defects = []
+    for d in find_defects(final_img, min_area=0, max_area=np.inf):
+        _offset(d, x0, y0)
+        if (d["x"] < box[2] and d["x"] + d["width"] > box[0]
+                and d["y"] < box[3] and d["y"] + d["height"] > box[1]):
+            defects.append(d)
+    return defects
+
+
+def _offset(defect, x0, y0):
+    defect["x"] += x0
+    defect["y"] += y0
+    defect["centroid_x"] = round(defect["centroid_x"] + x0, 2)
+    defect["centroid_y"] = round(defect["centroid_y"] + y0, 2)
+
+
+def tiled_subtraction(template_img, warped_img, tile_size=512, overlap=64, workers=4,
+                      min_area=None, max_area=None, iou_threshold=0.3, reference_size=ALIGN_SIZE):
+    """Template subtraction per tile on full-resolution, already aligned images.
+
+    The default area limits are MIN_BLOB_PIXELS/MAX_BLOB_PIXELS, which were tuned on the
+    `reference_size` image, scaled by the pixel-count ratio of the full image. Blobs
+    cut by an inner tile edge are merged with their pieces from the neighbouring
+    tiles and re-measured, so defects longer than the overlap are not lost.
+
+    Returns (defects, tile_report). Defect records use full-image coordinates.
+    """
+    height, width = template_img.shape[:2]
+    scale = (width * height) / (reference_size[0] * reference_size[1])
+    min_area = MIN_BLOB_PIXELS * scale if min_area is None else min_area
+    max_area = MAX_BLOB_PIXELS * scale if max_area is None else max_area
+    windows = tile_grid(height, width, tile_size, overlap)
+
+    def process(window):
+        start = time.perf_counter()
+        x0, y0, x1, y1 = window
+        _, final_img = subtract_images(template_img[y0:y1, x0:x1], warped_img[y0:y1, x0:x1])
+        # Area limits are applied after merging, when cut blobs have their full size
+        defects = find_defects(final_img, min_area=0, max_area=np.inf)
+        for d in defects:
+            d["edge"] = _touches_inner_edge(d, window, height, width)
+            _offset(d, x0, y0)
+        return defects, time.perf_counter() - start
+
+    # OpenCV releases the GIL, so threads give real parallelism here
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outputs = list(pool.map(process, windows))
+
+    report = [{"tile": i, "window": window, "defects": len(defects), "time_ms": seconds * 1000}
+              for i, (window, (defects, seconds)) in enumerate(zip(windows, outputs))]
+    found = [d for tile_defects, _ in outputs for d in tile_defects]
+    if not found:
+        return [], report
+
+    boxes = np.array([[d["x"], d["y"], d["x"] + d["width"], d["y"] + d["height"]] for d in found])
+    complete, merged = [], []
+    for group in _touching_groups(boxes):
+        if any(found[i]["edge"] for i in group):
+            # Pieces of a blob cut by tile edges: measure the union once on the full images
+            union = (*boxes[group, :2].min(axis=0), *boxes[group, 2:].max(axis=0))
+            merged.extend(_measure_region(template_img, warped_img, union))
+        else:
+            complete.extend(found[i] for i in group)
+
+    # Blobs fully inside several overlapping tiles are reported more than once
+    if complete:
+        complete_boxes = np.array([[d["x"], d["y"], d["x"] + d["width"], d["y"] + d["height"]]
+                                   for d in complete])
+        keep = nms(complete_boxes, [d["area"] for d in complete], iou_threshold=iou_threshold)
+        complete = [complete[i] for i in sorted(keep)]
+
+    defects = []
+    for d in complete + merged:
+        d.pop("edge", None)
+        if min_area < d["area"] < max_area:
+            defects.append(d)
+    defects.sort(key=lambda d: (d["y"], d["x"]))
+    return defects, report
+
+
+def tiled_yolo(model, image_bgr, tile_size=640, overlap=128, conf=0.25, batch_size=8,
+               iou_threshold=0.5):
+    """Run the YOLO model on full-resolution tiles in batches and merge with class-aware NMS.
+
+    Returns ((xyxy, confidences, classes), tile_report) with boxes in image pixels.
+    """
+    height, width = image_bgr.shape[:2]
+    windows = tile_grid(height, width, tile_size, overlap)
+    tiles = [image_bgr[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+
+    xyxy, confs, classes, report = [], [], [], []
+    for first in range(0, len(tiles), batch_size):
+        start = time.perf_counter()
+        results = model.predict(source=tiles[first:first + batch_size], save=False, conf=conf,
+                                imgsz=tile_size, verbose=False)
+        batch_ms = (time.perf_counter() - start) * 1000
+        for offset, result in enumerate(results):
+            index = first + offset
+            x0, y0 = windows[index][:2]
+            boxes, tile_confs, tile_classes = result_arrays(result)
+            boxes = boxes + [x0, y0, x0, y0]
+            xyxy.append(boxes)
+            confs.append(tile_confs)
+            classes.append(tile_classes)
+            report.append({
+                "tile": index, "window": windows[index], "detections": len(boxes),
+                # Ultralytics reports per-image preprocess/inference/postprocess times
+                "time_ms": sum(result.speed.values()) if result.speed else batch_ms / len(results),
+            })
+
+    xyxy = np.concatenate(xyxy) if xyxy else np.empty((0, 4))
+    confs = np.concatenate(confs) if confs else np.empty(0)
+    classes = np.concatenate(classes) if classes else np.empty(0, dtype=int)
+    keep = nms(xyxy, confs, classes, iou_threshold)
+    return (xyxy[keep], confs[keep], classes[keep]), report
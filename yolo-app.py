@@ -3,13 +3,26 @@ import cv2
 from PIL import Image
 import numpy as np
 from streamlit_cropper import st_cropper
-from ultralytics import YOLO
 import os
 import pandas as pd
-import seaborn as sns
 import plotly.express as px
 from datetime import datetime
-import matplotlib.pyplot as plt
+import time
+from collections import deque
+from detection_cache import DetectionCache, CropDebouncer, crop_key
+from defect_store import DefectLog
+from defect_rollups import DefectRollups
+from detection_utils import draw_detections, result_arrays
+from tiled_inspection import tiled_yolo
+from stage_timer import StageMetrics
+from chart_cache import ChartCache, downsample
+from batch_detect import detect_folder, detections_to_rows, list_images
+from camera_grabber import CameraGrabber
+from review_queue import ReviewQueue
+from retrain import CONFIG_PATH, RetrainStatus, start_background
+from inference_server import RemoteModel, configured_server
+from inference_backends import BACKENDS, check_class_mapping, compare_backends, configured_backend, \
+    load_backend, load_images
 
 CLASS_NAMES = {
     0: "short",
@@ -23,60 +36,163 @@ CLASS_NAMES = {
     8: "base material foreign object"
 }
 
-# Add after your existing session state initialization
-if "defect_data" not in st.session_state:
-    st.session_state.defect_data = pd.DataFrame(columns=[
-        "timestamp", "defect_type", "confidence",
-        "location_x", "location_y", "image_path"
-    ])
-
-if "uncertain_samples" not in st.session_state:
-    st.session_state.uncertain_samples = []
-
 # Get current script's directory
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
 # Path construction for GitHub compatibility
 model_path = os.path.join(script_dir, "train_results", "weights", "best.pt")
-model = YOLO(model_path)
+
+
+# Load the model once per process: st.cache_resource keeps it alive across reruns
+# and shares it between sessions, so widget changes no longer reload best.pt
+# The runtime backend (pytorch/onnx/openvino) is chosen at startup via INSPECTMILL_BACKEND;
+# ONNX/OpenVINO artifacts are exported once and cached next to best.pt
+# `revision` (the mtime of best.pt) changes when retrain.py promotes new weights, which
+# loads them on the next rerun; max_entries=1 releases the replaced model
+@st.cache_resource(show_spinner="Loading YOLO model...", max_entries=1)
+def load_model(path, backend="pytorch", warmup_size=640, server=None, revision=None):
+    if server is not None:
+        # Thin client: the shared inference server holds the only copy of the model
+        start = time.perf_counter()
+        remote = RemoteModel(server)
+        check_class_mapping(remote, CLASS_NAMES)
+        return {
+            "model": remote,
+            "path": path,
+            "backend": f"server {server[0]}:{server[1]}, {remote.info.get('backend', '?')}",
+            "version": remote.info.get("version", f"{server[0]}:{server[1]}"),
+            "load_time": time.perf_counter() - start,
+            "warmup_time": 0.0,
+            "loaded_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    start = time.perf_counter()
+    yolo_model = load_backend(path, backend, imgsz=warmup_size)
+    load_time = time.perf_counter() - start
+
+    # Exports must keep the class ids that CLASS_NAMES maps to defect names
+    check_class_mapping(yolo_model, CLASS_NAMES)
+
+    # Warm-up inference on a dummy frame so the first real detection is not slowed
+    # down by lazy initialisation inside the predictor
+    start = time.perf_counter()
+    dummy = np.zeros((warmup_size, warmup_size, 3), dtype=np.uint8)
+    yolo_model.predict(source=dummy, save=False, verbose=False)
+    warmup_time = time.perf_counter() - start
+
+    # Identifies the weights in cache keys so results from a replaced best.pt are never reused
+    stat = os.stat(path)
+    version = f"{os.path.basename(path)}:{int(stat.st_mtime)}:{stat.st_size}:{backend}"
+
+    return {
+        "model": yolo_model,
+        "path": path,
+        "backend": backend,
+        "version": version,
+        "load_time": load_time,
+        "warmup_time": warmup_time,
+        "loaded_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+model_resource = load_model(model_path, configured_backend(), server=configured_server(),
+                            revision=os.path.getmtime(model_path) if os.path.exists(model_path) else None)
+model = model_resource["model"]
+
+st.sidebar.caption(
+    f"Model ({model_resource['backend']}) loaded at {model_resource['loaded_at']} "
+    f"(load {model_resource['load_time']:.2f}s, warm-up {model_resource['warmup_time']:.2f}s)"
+)
+
+CONF_THRESHOLD = 0.25
+UNCERTAIN_THRESHOLD = 0.4
+LOGGED_KEYS_LIMIT = 256  # crop keys remembered per session to avoid logging a result twice
+
+
+@st.cache_resource
+def get_detection_cache(max_entries=32):
+    return DetectionCache(max_entries=max_entries)
+
+
+detection_cache = get_detection_cache()
 
 ## Put this right after your imports
 # Data directory setup
 DATA_DIR = "data"
 os.makedirs(DATA_DIR, exist_ok=True)
 CSV_PATH = os.path.join(DATA_DIR, "defect_data.csv")
+METRICS_PATH = os.path.join(DATA_DIR, "metrics.jsonl")
+ROLLUPS_PATH = os.path.join(DATA_DIR, "defect_rollups.json")
+
+
+# Per-stage wall-clock spans, aggregated process-wide for the diagnostics page
+@st.cache_resource
+def get_stage_metrics(path):
+    return StageMetrics(path)
+
+
+stage_metrics = get_stage_metrics(METRICS_PATH)
+
+
+# Charts are rendered once per input-data version and reused as PNG bytes
+@st.cache_resource
+def get_chart_cache(max_entries=32):
+    return ChartCache(max_entries=max_entries)
+
+
+chart_cache = get_chart_cache()
+MAX_CHART_POINTS = 1000
+
+
+# Uncertain detections live on disk (frames + thumbnails + SQLite index), not in session state
+@st.cache_resource
+def get_review_queue(root, max_frames=200):
+    return ReviewQueue(root, max_frames=max_frames)
+
+
+review_queue = get_review_queue(os.path.join(DATA_DIR, "review_queue"))
+RETRAIN_DIR = os.path.join(DATA_DIR, "retrain")
+retrain_status = RetrainStatus(RETRAIN_DIR)
+timer = stage_metrics.start("yolo-app", label=st.session_state.get("page", "home"))
 
-def load_defect_data():
+
+@st.cache_resource
+def get_defect_log(path):
+    return DefectLog(path)
+
+
+defect_log = get_defect_log(CSV_PATH)
+
+
+# Analytics render from rollups kept in step with the log, never from the raw rows
+@st.cache_resource
+def get_defect_rollups(path):
+    return DefectRollups(path, CLASS_NAMES)
+
+
+defect_rollups = get_defect_rollups(ROLLUPS_PATH)
+
+
+def sync_defect_data():
+    # Fold in only the rows appended since the rollups were last updated
     try:
-        if os.path.exists(CSV_PATH):
-            return pd.read_csv(CSV_PATH)
-        return pd.DataFrame(columns=[
-            "timestamp", "defect_type", "confidence",
-            "location_x", "location_y", "image_path"
-        ])
+        defect_rollups.sync(defect_log)
     except Exception as e:
         st.error(f"Error loading defect data: {str(e)}")
-        return pd.DataFrame(columns=[
-            "timestamp", "defect_type", "confidence",
-            "location_x", "location_y", "image_path"
-        ])
 
-if "defect_data" not in st.session_state:
-    st.session_state.defect_data = load_defect_data()
 
+sync_defect_data()
 
-def save_defect_data():
-    try:
-        # Ensure directory exists
-        os.makedirs(DATA_DIR, exist_ok=True)
-
-        # Save to CSV
-        st.session_state.defect_data.to_csv(CSV_PATH, index=False)
 
+def save_defect_rows(rows):
+    # One append per inspection instead of rewriting the whole history per box
+    try:
+        defect_log.append(rows)
     except PermissionError:
         st.error("⚠️ Permission denied: Cannot save data file. Please check write permissions.")
     except Exception as e:
         st.error(f"⚠️ Error saving defect data: {str(e)}")
+    sync_defect_data()
 
 
 # Home Page (Overview & Introduction)
@@ -117,6 +233,152 @@ def home_page():
             st.session_state.page = "review_uncertain"
             st.rerun()
 
+    col3, col4 = st.columns(2)
+    with col3:
+        if st.button("🗂️ Batch Folder Inference"):
+            st.session_state.page = "batch_inference"
+            st.rerun()
+
+    with col4:
+        if st.button("⏱️ Diagnostics"):
+            st.session_state.page = "diagnostics"
+            st.rerun()
+
+    col5, _ = st.columns(2)
+    with col5:
+        if st.button("🧠 Retrain from Reviews"):
+            st.session_state.page = "retraining"
+            st.rerun()
+
+
+def build_detection(xyxy, confidences, classes, annotated):
+    """Rows, counts and summary for one inference, built from the box arrays in bulk."""
+    detection = {
+        "rows": [],
+        "uncertain": [],
+        "confident": [],
+        "annotated": annotated,
+        "counts": {name: 0 for name in CLASS_NAMES.values()},
+        "details": [],
+    }
+    if len(xyxy) == 0:
+        return detection
+
+    stamp = datetime.now()
+    rows = detections_to_rows(xyxy, confidences, classes, model.names, stamp.isoformat(),
+                              f"defects/{stamp.strftime('%Y%m%d%H%M%S')}.jpg")
+    detection["rows"] = rows
+
+    class_ids = classes.astype(int)
+    for class_id, count in zip(*np.unique(class_ids, return_counts=True)):
+        detection["counts"][CLASS_NAMES.get(int(class_id), "unknown")] = int(count)
+    detection["details"] = [
+        f"{CLASS_NAMES.get(c, 'unknown')} ({conf:.2f})"
+        for c, conf in zip(class_ids.tolist(), confidences.tolist())
+    ]
+
+    # Flag low-confidence samples for review; boxes are drawn when the queue is viewed.
+    # The confident boxes go along as labels so a retraining sample is fully annotated
+    uncertain = confidences < UNCERTAIN_THRESHOLD
+    boxes = [{**row, "xyxy": box.tolist(), "class_id": c} for row, box, c in zip(rows, xyxy, class_ids.tolist())]
+    detection["uncertain"] = [box for box, flag in zip(boxes, uncertain) if flag]
+    detection["confident"] = [box for box, flag in zip(boxes, uncertain) if not flag]
+    return detection
+
+
+def run_detection(cropped_bgr, key):
+    # Reruns with an unchanged crop reuse the boxes, annotated image and counts
+    cached = detection_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Dynamic Scaling Based on Captured Image Dimensions
+    image_height, image_width = cropped_bgr.shape[:2]
+    scaling_factor = min(image_width / 640, image_height / 640)
+
+    # YOLO Prediction with Scaled Detection Results
+    with timer.span("predict"):
+        results = model.predict(source=cropped_bgr, save=False, conf=CONF_THRESHOLD)
+
+    # One device-to-host transfer for all boxes instead of per-box .item() calls
+    xyxy, confidences, classes = result_arrays(results[0])
+
+    annotated = None
+    if len(xyxy) > 0:
+        # Rendered at most once per inference; drawn from the arrays so local and
+        # server-side inference look the same
+        with timer.span("plot"):
+            annotated = draw_detections(cropped_bgr, xyxy, classes, confidences, CLASS_NAMES,
+                                        font_scale=max(0.5 * scaling_factor, 0.4))
+
+    detection = build_detection(xyxy, confidences, classes, annotated)
+    detection_cache.put(key, detection)
+    return detection
+
+
+def run_tiled_detection(cropped_bgr, key, tile_size=640, overlap=128):
+    # Full-resolution tiles instead of one 640 letterbox, so small defects survive
+    cached = detection_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with timer.span("predict_tiled"):
+        (xyxy, confidences, classes), tile_report = tiled_yolo(
+            model, cropped_bgr, tile_size=tile_size, overlap=overlap, conf=CONF_THRESHOLD
+        )
+
+    annotated = None
+    if len(xyxy) > 0:
+        with timer.span("plot"):
+            annotated = draw_detections(cropped_bgr, xyxy, classes, confidences, CLASS_NAMES)
+
+    detection = build_detection(xyxy, confidences, classes, annotated)
+    detection["tiles"] = tile_report
+    detection_cache.put(key, detection)
+    return detection
+
+
+@st.cache_resource
+def get_camera(device=0):
+    return CameraGrabber(device)
+
+
+def live_camera_view(camera, live_detect):
+    # Fragment reruns happen after the page's timer has finished, so each one gets its own
+    fragment_timer = stage_metrics.start("yolo-app", label="live_camera")
+    try:
+        _render_live_frame(camera, live_detect, fragment_timer)
+    finally:
+        fragment_timer.finish()
+
+
+def _render_live_frame(camera, live_detect, fragment_timer):
+    latest = camera.latest()
+    if latest is None:
+        st.info(camera.error or "Waiting for the camera...")
+        return
+    frame, _, frame_id = latest
+
+    if live_detect:
+        # Only the newest frame is scored; frames that arrived in between are skipped
+        last = st.session_state.get("live_detection")
+        if last is None or last[0] != frame_id:
+            with fragment_timer.span("predict_live"):
+                results = model.predict(source=frame, save=False, conf=CONF_THRESHOLD, verbose=False)
+            xyxy, confidences, classes = result_arrays(results[0])
+            last = (frame_id, draw_detections(frame, xyxy, classes, confidences, CLASS_NAMES), len(xyxy))
+            st.session_state.live_detection = last
+        frame = last[1]
+        st.caption(f"{last[2]} defects in the latest scored frame")
+
+    st.image(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), use_container_width=True)
+    st.caption(f"Camera {camera.fps():.1f} FPS, {camera.dropped} stale frames dropped")
+
+
+def rerun_when_settled(debouncer, key):
+    if debouncer.is_settled(key):
+        st.rerun()
+
 
 def capture_output_image_page():
     st.title("Capture or Detect PCB Defects")
@@ -136,32 +398,36 @@ def capture_output_image_page():
     st.subheader("Capture PCB Output Image")
 
     # Camera control buttons
+    camera = get_camera()
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Start Camera"):
+            camera.start()
             st.session_state.camera_active = True
     with col2:
         if st.button("Stop Camera"):
+            camera.stop()
             st.session_state.camera_active = False
             st.session_state.captured_frame = None
 
-    # Camera capture section
+    # Camera capture section: frames come from the background grabber, so nothing here blocks
     if st.session_state.camera_active:
-        cap = cv2.VideoCapture(0)
-        FRAME_WINDOW = st.image([])
+        if not camera.running:
+            camera.start()
 
         # Capture and clear buttons
         capture_col, clear_col = st.columns(2)
         with capture_col:
             if st.button("Take Photo"):
-                ret, frame = cap.read()
-                if ret:
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                latest = camera.latest()
+                if latest is not None:
+                    frame_rgb = cv2.cvtColor(latest[0], cv2.COLOR_BGR2RGB)
                     st.session_state.captured_frame = Image.fromarray(frame_rgb)
                     st.session_state.output_img = st.session_state.captured_frame
                     st.session_state.camera_active = False
                     st.success("Photo captured!")
-                cap.release()
+                else:
+                    st.error("Failed to capture frame")
 
         with clear_col:
             if st.button("Clear Photo"):
@@ -169,17 +435,14 @@ def capture_output_image_page():
                 st.session_state.output_img = None
                 st.session_state.camera_active = False
 
-        # Show live feed
-        while st.session_state.camera_active and cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                st.error("Failed to capture frame")
-                break
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            FRAME_WINDOW.image(frame)
-
-        if 'cap' in locals():
-            cap.release()
+    # Show live feed (re-rendered on its own timer without rerunning the page)
+    if st.session_state.camera_active:
+        live_col1, live_col2 = st.columns(2)
+        with live_col1:
+            target_fps = st.slider("Preview / detection FPS", 1, 30, 10)
+        with live_col2:
+            live_detect = st.checkbox("Live detection on newest frame", value=False)
+        st.fragment(run_every=1.0 / target_fps)(live_camera_view)(camera, live_detect)
 
     # File uploader as alternative
     st.subheader("Or Upload an Image")
@@ -192,7 +455,9 @@ def capture_output_image_page():
         current_image = st.session_state.captured_frame
         st.subheader("Captured PCB Image")
     elif uploaded_image is not None:
-        current_image = Image.open(uploaded_image)
+        with timer.span("decode"):
+            current_image = Image.open(uploaded_image)
+            current_image.load()  # PIL decodes lazily; force it inside the span
         st.subheader("Uploaded PCB Image")
 
     if current_image is not None:
@@ -204,77 +469,78 @@ def capture_output_image_page():
 
         # Cropping functionality
         st.subheader("Crop the Image")
-        cropped_image = st_cropper(
-            current_image,
-            realtime_update=True,
-            box_color="blue",
-            aspect_ratio=None
-        )
+        with timer.span("crop"):
+            cropped_image = st_cropper(
+                current_image,
+                realtime_update=True,
+                box_color="blue",
+                aspect_ratio=None
+            )
 
         st.subheader("Cropped Image")
         st.image(cropped_image, caption="Cropped PCB Image", use_container_width=True)
 
         st.subheader("Run YOLOv8 Detection on Cropped Image")
-        cropped_np = np.array(cropped_image)
-        cropped_bgr = cv2.cvtColor(cropped_np, cv2.COLOR_RGB2BGR)
+        with timer.span("preprocess"):
+            cropped_np = np.array(cropped_image)
+            cropped_bgr = cv2.cvtColor(cropped_np, cv2.COLOR_RGB2BGR)
 
         st.subheader("Preprocessed Image")
         st.image(cropped_bgr, caption="Preprocessed PCB Image", use_container_width=True)
 
-        # Dynamic Scaling Based on Captured Image Dimensions
-        image_height, image_width = cropped_bgr.shape[:2]
-        scaling_factor = min(image_width / 640, image_height / 640)
-
-        # YOLO Prediction with Scaled Detection Results
-        results = model.predict(source=cropped_bgr, save=False, conf=0.25)
-
-        if len(results[0].boxes) > 0:
-            annotated_cropped = results[0].plot(font_size=int(12 * scaling_factor))
-
-            # Initialize counters
-            defect_counts = {name: 0 for name in CLASS_NAMES.values()}
-            type_details = []
-
-            # Data collection
-            for box in results[0].boxes:
-                class_id = int(box.cls)
-                defect_type = CLASS_NAMES.get(class_id, "unknown")
-                confidence = float(box.conf)
-
-                # Update counts
-                defect_counts[defect_type] += 1
-
-                # Store details for logging
-                type_details.append(f"{defect_type} ({confidence:.2f})")
-
-                # In your detection loop where you add new defects:
-                new_row = {
-                    "timestamp": datetime.now().isoformat(),
-                    "defect_type": model.names[int(box.cls)],
-                    "confidence": float(box.conf),
-                    "location_x": int((box.xywh[0][0] + box.xywh[0][2] / 2).item()),
-                    "location_y": int((box.xywh[0][1] + box.xywh[0][3] / 2).item()),
-                    "image_path": f"defects/{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
-                }
-                st.session_state.defect_data = pd.concat(
-                    [st.session_state.defect_data, pd.DataFrame([new_row])],
-                    ignore_index=True
-                )
-                save_defect_data()  # Add this right after adding new data
-
-                # Flag low-confidence samples for review
-                if float(box.conf) < 0.4:
-                    # Create annotated image for review
-                    annotated_img = results[0].plot()
-                    st.session_state.uncertain_samples.append({
-                        "image": annotated_img,  # Store the annotated image
-                        "prediction": new_row
-                    })
+        # Tiled mode runs the model on full-resolution tiles instead of one 640 letterbox
+        tiled = st.checkbox("Tiled full-resolution detection", value=False)
+        tile_size = 640
+        if tiled:
+            tile_size = st.select_slider("Tile size (px)", [320, 480, 640, 800, 960], value=640)
+        mode = f"tiled{tile_size}" if tiled else "full"
+        with timer.span("cache_key"):
+            # A shared server reloads promoted weights by itself, so ask the client for its version
+            version = model.version if isinstance(model, RemoteModel) else model_resource["version"]
+            key = crop_key(cropped_bgr, CONF_THRESHOLD, f"{version}|{mode}")
+
+        # Debounce mode: wait until the crop box has stopped moving before running inference
+        if "crop_debouncer" not in st.session_state:
+            st.session_state.crop_debouncer = CropDebouncer()
+        debounce = st.checkbox("Wait for the crop to settle before detecting", value=False)
+        debouncer = st.session_state.crop_debouncer
+        if debounce and key not in detection_cache and not debouncer.is_settled(key):
+            # A timed fragment polls the settle timestamp, so the script thread never sleeps
+            st.info("Crop is still changing - detection will run once it settles.")
+            st.fragment(run_every=0.25)(rerun_when_settled)(debouncer, key)
+            st.stop()
+
+        if tiled:
+            detection = run_tiled_detection(cropped_bgr, key, tile_size)
+            tile_report = detection["tiles"]
+            st.write(f"{len(tile_report)} tiles, {sum(t['time_ms'] for t in tile_report):.1f} ms total tile time")
+            with st.expander("Per-tile timing"):
+                st.dataframe(pd.DataFrame(tile_report))
+        else:
+            detection = run_detection(cropped_bgr, key)
+
+        # Log each detection result once per session, not once per rerun
+        if "logged_detections" not in st.session_state:
+            st.session_state.logged_detections = deque(maxlen=LOGGED_KEYS_LIMIT)
+        if key not in st.session_state.logged_detections:
+            st.session_state.logged_detections.append(key)
+            if detection["rows"]:
+                with timer.span("persist"):
+                    save_defect_rows(detection["rows"])
+            if detection["uncertain"]:
+                # The source frame is stored once, however many of its boxes are uncertain
+                with timer.span("review_queue"):
+                    review_queue.add(cropped_bgr, detection["uncertain"], detection["confident"])
+
+        if detection["rows"]:
+            annotated_cropped = detection["annotated"]
+            defect_counts = detection["counts"]
+            type_details = detection["details"]
 
             st.image(annotated_cropped, caption="Detected Defects on Cropped Image",
                      use_container_width=True)
             # Show summary with types
-            st.write(f"**Total Detected Defects:** {len(results[0].boxes)}")
+            st.write(f"**Total Detected Defects:** {len(detection['rows'])}")
             st.write("**Defect Breakdown:**")
 
             # Create two columns for better layout
@@ -327,56 +593,41 @@ def analytics_page():
 
 
     # Rest of your existing analytics code...
-    if st.session_state.defect_data.empty:
+    if defect_rollups.total == 0:
         st.warning("No defect data collected yet!")
         return
 
-    DEFECT_MAP = {
-        0: "short",
-        1: "spur",
-        2: "spurious copper",
-        3: "open",
-        4: "mouse bite",
-        5: "hole breakout",
-        6: "conductor scratch",
-        7: "conductor foreign object",
-        8: "base material foreign object"
-    }
-
-    # Create a modified copy for visualization
-    df = st.session_state.defect_data.copy()
-
-    # Convert numerical types to human-readable names
-    df['defect_type'] = df['defect_type'].apply(
-        lambda x: DEFECT_MAP[int(x)] if str(x).isdigit() else x
-    )
-
-    # Your existing visualization code remains the same...
-    # Modified visualization code
+    # Everything below reads the pre-aggregated rollups, so the cost does not grow with history
     st.subheader("Defect Distribution")
-    defect_counts = df["defect_type"].value_counts()
-    fig = px.bar(defect_counts,
-                 x=defect_counts.index,
-                 y=defect_counts.values,
-                 labels={'x': 'Defect Type', 'y': 'Count'})
-    st.plotly_chart(fig)
+    with timer.span("chart_distribution"):
+        defect_counts = pd.Series(defect_rollups.class_counts).sort_values(ascending=False)
+        fig = px.bar(defect_counts,
+                     x=defect_counts.index,
+                     y=defect_counts.values,
+                     labels={'x': 'Defect Type', 'y': 'Count'})
+        st.plotly_chart(fig)
 
     # Temporal Trends
     st.subheader("Defect Trends Over Time")
-    temporal_data = df.groupby(
-        [pd.to_datetime(df["timestamp"]).dt.date, "defect_type"]
-    ).size().unstack()
-    st.line_chart(temporal_data)
+    with timer.span("chart_trends"):
+        daily = defect_rollups.daily_frame()
+        st.line_chart(daily.iloc[downsample(len(daily), MAX_CHART_POINTS)])
 
     # Heatmap Visualization
     st.subheader("Defect Location Heatmap")
-    plt.figure(figsize=(10, 6))
-    sns.kdeplot(
-        x=st.session_state.defect_data["location_x"],
-        y=st.session_state.defect_data["location_y"],
-        cmap="Reds", fill=True
-    )
-    st.pyplot(plt.gcf())
+    with timer.span("chart_heatmap"):
+        max_x, max_y = defect_rollups.extent
+
+        def draw_heatmap(fig):
+            ax = fig.subplots()
+            image = ax.imshow(defect_rollups.histogram, cmap="Reds", origin="lower", aspect="auto",
+                              extent=(0, max_x, 0, max_y))
+            fig.colorbar(image, ax=ax, label="Defects")
+            ax.set_xlabel("location_x")
+            ax.set_ylabel("location_y")
+
+        # The log offset identifies exactly which rows the rollups cover
+        st.image(chart_cache.render(("heatmap", defect_rollups.offset, defect_rollups.total), draw_heatmap))
 
 
 def review_uncertain_page():
@@ -386,26 +637,196 @@ def review_uncertain_page():
         st.session_state.page = "home"
         st.rerun()
 
-    if not st.session_state.uncertain_samples:
+    frames, boxes = review_queue.count()
+    if not frames:
         st.info("No uncertain detections to review!")
         return
 
-    st.write(f"Found {len(st.session_state.uncertain_samples)} uncertain detections (confidence < 0.4)")
+    _, reviewed = review_queue.count(status="accepted")
+    _, relabelled = review_queue.count(status="relabelled")
+    _, rejected = review_queue.count(status="rejected")
+    st.caption(f"Reviewed: {reviewed} accepted, {relabelled} relabelled, {rejected} rejected")
+
+    st.write(f"Found {boxes} uncertain detections (confidence < {UNCERTAIN_THRESHOLD}) "
+             f"on {frames} images (keeping at most {review_queue.max_frames} images)")
 
-    for i, sample in enumerate(st.session_state.uncertain_samples[:10]):  # Show first 10 samples
+    # Only the current page is read from disk
+    page_size = 10
+    page_count = (frames + page_size - 1) // page_size
+    page_number = st.number_input("Page", 1, page_count, 1) if page_count > 1 else 1
+
+    for frame in review_queue.page((page_number - 1) * page_size, page_size):
         st.markdown("---")
-        st.subheader(f"Sample {i + 1}")
+        thumb_col, info_col = st.columns([1, 2])
+        with thumb_col:
+            st.image(frame["thumb_path"], caption=f"{frame['width']}x{frame['height']}",
+                     use_container_width=True)
+        with info_col:
+            decisions = {}
+            for box in frame["boxes"]:
+                st.write(f"""
+                - **Predicted defect**: {box["defect_type"]}
+                - **Confidence**: {box["confidence"]:.2f}
+                - **Location**: ({box["location_x"]}, {box["location_y"]})
+                - **Timestamp**: {box["timestamp"]}
+                - **Review**: {box["status"]}
+                """)
+                # Reviewed boxes become training labels for retrain.py
+                predicted = int(box["defect_type"]) if str(box["defect_type"]).isdigit() else None
+                current = box["label"] if box["status"] != "pending" else predicted
+                options = list(CLASS_NAMES) + [None]
+                decisions[box["id"]] = (predicted, st.selectbox(
+                    "Actual defect", options,
+                    index=options.index(int(current)) if current is not None and str(current).isdigit()
+                    and int(current) in CLASS_NAMES else len(options) - 1,
+                    format_func=lambda c: CLASS_NAMES[c] if c is not None else "not a defect",
+                    key=f"label_{box['id']}",
+                ))
+            if st.button("Save review", key=f"review_{frame['id']}"):
+                for box_id, (predicted, label) in decisions.items():
+                    status = "rejected" if label is None else "accepted" if label == predicted else "relabelled"
+                    review_queue.set_review(box_id, status, label)
+                st.rerun()
+
+        if st.checkbox("Show full image with boxes", key=f"full_{frame['id']}"):
+            image = review_queue.load_frame(frame["id"])
+            if image is None:
+                st.warning("Image file is missing.")
+                continue
+            boxes_xyxy = np.array([[b["x1"], b["y1"], b["x2"], b["y2"]] for b in frame["boxes"]])
+            class_ids = [int(b["defect_type"]) if str(b["defect_type"]).isdigit() else -1 for b in frame["boxes"]]
+            annotated = draw_detections(image, boxes_xyxy, class_ids,
+                                        [b["confidence"] for b in frame["boxes"]], CLASS_NAMES)
+            st.image(cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB),
+                     caption="Detected defect with bounding box", use_container_width=True)
+
+
+def batch_inference_page():
+    st.title("Batch Folder Inference")
+
+    if st.button("← Back to Home"):
+        st.session_state.page = "home"
+        st.rerun()
 
-        # Convert BGR to RGB for display (since we stored the annotated image)
-        img_rgb = cv2.cvtColor(sample["image"], cv2.COLOR_BGR2RGB)
-        st.image(img_rgb, caption="Detected defect with bounding box", use_container_width=True)
+    folder = st.text_input("Image folder", value=os.path.join(script_dir, "test images"))
+    col1, col2 = st.columns(2)
+    with col1:
+        batch_size = st.number_input("Batch size", 1, 64, 8)
+    with col2:
+        workers = st.number_input("Decode threads", 1, 16, 4)
+
+    if st.button("Run batch detection"):
+        paths = list_images(folder)
+        if not paths:
+            st.warning("No images found in that folder.")
+            return
+
+        with st.spinner(f"Scoring {len(paths)} images..."):
+            with timer.span("batch_predict"):
+                rows, summary = detect_folder(model, paths, int(batch_size), CONF_THRESHOLD, int(workers))
+        with timer.span("persist"):
+            save_defect_rows(rows)  # one bulk append for the whole folder
+
+        st.success(
+            f"{summary['images']} images, {summary['detections']} detections in {summary['seconds']:.2f}s "
+            f"- {summary['images_per_second']:.1f} images/s"
+        )
+        if summary["skipped"]:
+            st.warning(f"{summary['skipped']} files could not be decoded and were skipped.")
+        if rows:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+
+def retraining_page():
+    st.title("Retrain from Reviewed Detections")
+
+    if st.button("← Back to Home"):
+        st.session_state.page = "home"
+        st.rerun()
+
+    reviewed = len(review_queue.reviewed_frames())
+    st.write(f"{reviewed} fully reviewed images in the review queue. They are exported as YOLO labels "
+             f"(classes from confign.yaml) and pre-resized into a cached dataset under {RETRAIN_DIR}.")
+
+    state = retrain_status.read()
+    running = retrain_status.running()
+    st.write(f"**Status:** {state.get('state', 'idle')}" + (" (running)" if running else ""))
+    if state.get("dataset"):
+        st.write(f"Dataset: {state['dataset']}")
+    if state.get("current") and state.get("candidate"):
+        st.dataframe(pd.DataFrame([{"weights": "current", **state["current"]},
+                                   {"weights": "candidate", **state["candidate"]}]))
+    if state.get("result"):
+        st.info(state["result"])
+    if state.get("error"):
+        st.error(state["error"])
+
+    with st.expander("Fine-tuning settings"):
+        epochs = st.number_input("Epochs", 1, 100, 10)
+        freeze = st.number_input("Frozen backbone layers", 0, 22, 10)
+        min_samples = st.number_input("Minimum reviewed training images", 1, 1000, 20)
+        min_val = st.number_input("Minimum reviewed validation images", 1, 1000, 10)
+        base_data = st.text_input("Original dataset yaml (mixed in and checked before promotion)",
+                                  value=CONFIG_PATH)
+
+    # The run is a separate process; the UI only polls its status file
+    if st.button("Start fine-tuning from best.pt", disabled=running):
+        try:
+            start_background(RETRAIN_DIR, weights=model_path, epochs=int(epochs), freeze=int(freeze),
+                             min_samples=int(min_samples), min_val=int(min_val), base_data=base_data)
+        except Exception as e:
+            st.error(f"Could not start retraining: {str(e)}")
+        st.rerun()
+
+    if os.path.exists(retrain_status.log_path):
+        with open(retrain_status.log_path, encoding="utf-8", errors="replace") as f:
+            f.seek(max(os.path.getsize(retrain_status.log_path) - 4000, 0))
+            st.code(f.read())
+    if running and st.button("Refresh"):
+        st.rerun()
+
+
+def diagnostics_page():
+    st.title("Diagnostics")
+
+    if st.button("← Back to Home"):
+        st.session_state.page = "home"
+        st.rerun()
+
+    st.write(f"Model load: {model_resource['load_time']:.2f}s, warm-up: {model_resource['warmup_time']:.2f}s")
+    st.write(f"Detection cache: {detection_cache.stats()}")
+    st.write(f"Chart cache: {chart_cache.stats()}")
+    if isinstance(model, RemoteModel):
+        st.write(f"Inference server: {model.stats()} "
+                 f"(last request queued {model.last_queue_ms:.1f} ms, batch of {model.last_batch_images})")
+
+    summary = stage_metrics.summary()
+    st.subheader("Stage Latency (ms)")
+    if not summary:
+        st.info("No timings recorded yet - run a detection first.")
+    else:
+        summary_df = pd.DataFrame(summary)
+        st.dataframe(summary_df, use_container_width=True)
+        st.bar_chart(summary_df.set_index("stage")["p50_ms"])
+        st.caption(f"Every run is also appended to {METRICS_PATH}")
+
+        if st.button("Reset in-memory timings"):
+            stage_metrics.reset()
+            st.rerun()
 
-        st.write(f"""
-        - **Predicted defect**: {sample["prediction"]["defect_type"]}
-        - **Confidence**: {sample["prediction"]["confidence"]:.2f}
-        - **Location**: ({sample["prediction"]["location_x"]}, {sample["prediction"]["location_y"]})
-        - **Timestamp**: {sample["prediction"]["timestamp"]}
-        """)
+    # Built-in backend comparison: per-image latency of each runtime on the test images
+    st.subheader("Inference Backend Comparison")
+    backends = st.multiselect("Backends", list(BACKENDS), default=list(BACKENDS))
+    limit = st.slider("Images from 'test images'", 5, 81, 20)
+    if st.button("Run comparison") and backends:
+        images = load_images(os.path.join(script_dir, "test images"), limit)
+        with st.spinner("Exporting (first run only) and timing backends..."):
+            try:
+                rows = compare_backends(model_path, backends, images, CONF_THRESHOLD)
+            except Exception as e:
+                st.error(f"⚠️ Backend comparison failed: {str(e)}")
+            else:
+                st.dataframe(pd.DataFrame(rows), use_container_width=True)
 
 
 # Initialize session state if it's the first time
@@ -413,11 +834,21 @@ if "page" not in st.session_state:
     st.session_state.page = "home"
 
 # Conditional page rendering based on the current page in session state
-if st.session_state.page == "home":
-    home_page()
-elif st.session_state.page == "capture_output_image":
-    capture_output_image_page()
-elif st.session_state.page == "analytics":
-    analytics_page()
-elif st.session_state.page == "review_uncertain":
-    review_uncertain_page()
\ No newline at end of file
+# (the finally block records this run's stage timings, also when a page calls st.rerun())
+try:
+    if st.session_state.page == "home":
+        home_page()
+    elif st.session_state.page == "capture_output_image":
+        capture_output_image_page()
+    elif st.session_state.page == "analytics":
+        analytics_page()
+    elif st.session_state.page == "review_uncertain":
+        review_uncertain_page()
+    elif st.session_state.page == "batch_inference":
+        batch_inference_page()
+    elif st.session_state.page == "retraining":
+        retraining_page()
+    elif st.session_state.page == "diagnostics":
+        diagnostics_page()
+finally:
+    timer.finish()